@@ -0,0 +1,126 @@
+import zlib
+from gzip import GzipFile
+from io import BytesIO
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+
+
+class GzipCodec:
+    name = GZIP
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        buffer = BytesIO()
+        with GzipFile(mode='wb', compresslevel=self.level, fileobj=buffer,
+                      mtime=0) as file:
+            file.write(data)
+        return buffer.getvalue()
+
+    def stream(self, chunks):
+        """
+        Поток gzip: заголовок, сжатые куски со сбросом после каждого
+        (клиент получает данные по мере генерации) и трейлер с CRC
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class BrotliCodec:
+    name = BROTLI
+
+    def __init__(self, quality):
+        self.quality = quality
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.quality)
+
+    def stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.quality)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+def rechunk(chunks, size):
+    """
+    Склеивает мелкие куски потока (строки списка покупок) в блоки
+    не меньше size, чтобы сброс кодека не шёл на каждую строку
+    """
+    block, length = [], 0
+    for chunk in chunks:
+        block.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(block)
+            block, length = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def get_codecs():
+    """
+    Кодеки в порядке предпочтения из COMPRESSION['encodings'];
+    br пропускается, если пакет Brotli не установлен
+    """
+    config = settings.COMPRESSION
+    codecs = []
+    for name in config['encodings']:
+        if name == BROTLI and brotli is not None:
+            codecs.append(BrotliCodec(config['brotli_quality']))
+        elif name == GZIP:
+            codecs.append(GzipCodec(config['gzip_level']))
+    return codecs
+
+
+def parse_accept_encoding(header):
+    """
+    Accept-Encoding -> {кодировка: q}
+    """
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+def choose_codec(header, codecs):
+    """
+    Кодек с наибольшим q из принятых клиентом; при равных q
+    побеждает более ранний в COMPRESSION['encodings']
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for codec in codecs:
+        quality = accepted.get(codec.name, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = codec, quality
+    return best
@@ -0,0 +1,174 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                    5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST_RE = re.compile(r'\((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """
+    SQL без литералов и с одним плейсхолдером вместо списков IN:
+    запросы, отличающиеся только параметрами, дают одну форму
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = PLACEHOLDER_LIST_RE.sub('(?)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def repeated_shapes(statements, threshold):
+    """
+    Формы запросов, выполненных не меньше threshold раз: признак N+1
+    """
+    counts = Counter(query_shape(sql) for sql in statements)
+    return {
+        shape: count for shape, count in counts.items()
+        if count >= threshold
+    }
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return f'{{{pairs}}}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Накопительная гистограмма Prometheus: число наблюдений не больше
+    каждой границы, сумма и общее число
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),),
+                                self.counts):
+            total += count
+            yield (f'{name}_bucket',
+                   labels + (('le', format_value(bound)),), total)
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса: гистограммы и счётчики с метками. Каждый
+    воркер считает свои запросы, Prometheus собирает их по отдельности
+    """
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, kind, help_text, buckets=None):
+        self.metrics[name] = {
+            'kind': kind,
+            'help': help_text,
+            'buckets': buckets,
+            'series': {},
+        }
+
+    def observe(self, name, labels, value):
+        metric = self.metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = metric['series'].get(key)
+            if histogram is None:
+                histogram = metric['series'][key] = Histogram(
+                    metric['buckets']
+                )
+            histogram.observe(value)
+
+    def increment(self, name, labels, amount=1):
+        metric = self.metrics[name]
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            metric['series'][key] = metric['series'].get(key, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            for metric in self.metrics.values():
+                metric['series'] = {}
+
+    def render(self):
+        """
+        Текстовый формат экспозиции Prometheus
+        """
+        lines = []
+        with self._lock:
+            for name, metric in self.metrics.items():
+                lines.append(f'# HELP {name} {metric["help"]}')
+                lines.append(f'# TYPE {name} {metric["kind"]}')
+                for labels, series in sorted(metric['series'].items()):
+                    if metric['kind'] == 'counter':
+                        samples = ((name, labels, series),)
+                    else:
+                        samples = series.samples(name, labels)
+                    lines.extend(
+                        f'{sample}{format_labels(sample_labels)} '
+                        f'{format_value(value)}'
+                        for sample, sample_labels, value in samples
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+registry.register(
+    'foodgram_request_duration_seconds', 'histogram',
+    'Wall time of a request by view', DURATION_BUCKETS
+)
+registry.register(
+    'foodgram_db_queries', 'histogram',
+    'Database queries per request by view', QUERY_BUCKETS
+)
+registry.register(
+    'foodgram_db_duration_seconds', 'histogram',
+    'Time spent in database queries per request by view', DURATION_BUCKETS
+)
+registry.register(
+    'foodgram_render_duration_seconds', 'histogram',
+    'Time spent in the renderer encoding the response body by view',
+    DURATION_BUCKETS
+)
+registry.register(
+    'foodgram_response_size_bytes', 'histogram',
+    'Response body size by view', SIZE_BUCKETS
+)
+registry.register(
+    'foodgram_n_plus_one_total', 'counter',
+    'Requests that repeated one SQL shape at least the threshold times'
+)
+registry.register(
+    'foodgram_profiles_total', 'counter',
+    'Sampled requests dumped with cProfile'
+)
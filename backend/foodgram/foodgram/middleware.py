@@ -0,0 +1,219 @@
+import cProfile
+import logging
+import os
+import random
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from itertools import chain
+
+from django.conf import settings
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from .compression import choose_codec, get_codecs, rechunk
+from .metrics import registry, repeated_shapes
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED_VIEW = 'unresolved'
+
+
+class QueryRecorder:
+    """
+    Обёртка execute_wrapper: число, длительность и текст запросов
+    """
+    def __init__(self):
+        self.statements = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.statements.append(sql)
+
+
+class ProfilingMiddleware:
+    """
+    Время запроса, число и время запросов к БД, время отрисовки
+    и размер ответа по view в гистограммах для /api/metrics/.
+    Отмечает N+1 (одна форма SQL повторяется не меньше порога) и для
+    доли запросов PROFILING['sample_rate'] сохраняет вывод cProfile
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = settings.PROFILING
+        if not config['enabled'] or request.path in config['exclude']:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        profiler = None
+        if random.random() < config['sample_rate']:
+            profiler = cProfile.Profile()
+        request.render_duration = 0.0
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        duration = time.perf_counter() - started
+        view = self.get_view_name(request)
+        self.record(request, response, view, duration, recorder)
+        if profiler is not None:
+            self.dump_profile(profiler, request, view)
+        if config['server_timing']:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f}, '
+                f'render;dur={request.render_duration * 1000:.1f}, '
+                f'total;dur={duration * 1000:.1f}'
+            )
+            response['X-DB-Queries'] = str(len(recorder.statements))
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        Ответы DRF отрисовываются сразу после этого хука: время до
+        post-render колбэка - работа рендерера. Сериализаторы
+        выполняются раньше, во view, и сюда не входят
+        """
+        if not hasattr(request, 'render_duration'):
+            return response
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.render_duration += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def get_view_name(request):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return UNRESOLVED_VIEW
+        return match.view_name or UNRESOLVED_VIEW
+
+    def record(self, request, response, view, duration, recorder):
+        labels = {'view': view, 'method': request.method}
+        registry.observe(
+            'foodgram_request_duration_seconds',
+            dict(labels, status=response.status_code), duration
+        )
+        registry.observe(
+            'foodgram_db_queries', labels, len(recorder.statements)
+        )
+        registry.observe(
+            'foodgram_db_duration_seconds', labels, recorder.duration
+        )
+        registry.observe(
+            'foodgram_render_duration_seconds', labels,
+            request.render_duration
+        )
+        if not response.streaming:
+            registry.observe(
+                'foodgram_response_size_bytes', labels, len(response.content)
+            )
+        repeated = repeated_shapes(
+            recorder.statements, settings.PROFILING['n_plus_one_threshold']
+        )
+        if repeated:
+            registry.increment('foodgram_n_plus_one_total', labels)
+            for shape, count in repeated.items():
+                logger.warning(
+                    'Возможный N+1 в %s %s: %d повторов запроса %s',
+                    request.method, view, count, shape
+                )
+
+    def dump_profile(self, profiler, request, view):
+        directory = settings.PROFILING['profile_dir']
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{}-{}-{}-{}.prof'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'), os.getpid(),
+            view.replace(':', '_'), request.method.lower()
+        ))
+        profiler.dump_stats(path)
+        registry.increment('foodgram_profiles_total', {'view': view})
+        logger.info('Профиль %s %s сохранён в %s', request.method, view, path)
+
+
+class CompressionMiddleware:
+    """
+    Сжатие JSON и выгрузки списка покупок в br или gzip по
+    Accept-Encoding. Ответы меньше COMPRESSION['min_size'] отдаются
+    как есть; у потоковых ответов для этого читается начало потока,
+    остальное сжимается по мере генерации
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.codecs = get_codecs()
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        config = settings.COMPRESSION
+        if not config['enabled'] or not self.is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codec = choose_codec(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''), self.codecs
+        )
+        if codec is None:
+            return response
+        if response.streaming:
+            return self.compress_stream(response, codec, config['min_size'])
+        if len(response.content) < config['min_size']:
+            return response
+        content = codec.compress(response.content)
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        self.mark_encoded(response, codec)
+        return response
+
+    @staticmethod
+    def is_compressible(response):
+        if response.has_header('Content-Encoding'):
+            return False
+        content_type = response.get('Content-Type', '')
+        return (content_type.split(';')[0].strip()
+                in settings.COMPRESSION['content_types'])
+
+    def compress_stream(self, response, codec, min_size):
+        chunks = iter(response.streaming_content)
+        head, length = [], 0
+        for chunk in chunks:
+            head.append(chunk)
+            length += len(chunk)
+            if length >= min_size:
+                break
+        else:
+            response.streaming_content = head
+            return response
+        response.streaming_content = codec.stream(
+            rechunk(chain(head, chunks), min_size)
+        )
+        del response['Content-Length']
+        self.mark_encoded(response, codec)
+        return response
+
+    @staticmethod
+    def mark_encoded(response, codec):
+        """
+        Сжатое тело уже не совпадает побайтно с исходным, поэтому
+        сильный ETag становится слабым: If-None-Match сравнивает
+        слабо и продолжает давать 304
+        """
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = codec.name
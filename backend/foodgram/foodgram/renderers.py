@@ -0,0 +1,99 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_BACKEND = 'orjson'
+STDLIB_BACKEND = 'stdlib'
+
+# Как и JSONRenderer, экранируем U+2028 и U+2029: в JSONP и inline
+# <script> они завершают строковый литерал.
+LINE_SEPARATORS = (
+    ('\u2028'.encode(), b'\\u2028'),
+    ('\u2029'.encode(), b'\\u2029'),
+)
+
+
+class StdlibBackend:
+    """
+    JSONEncoder DRF с настройками UNICODE_JSON, COMPACT_JSON
+    и STRICT_JSON, созданный один раз: JSONRenderer собирает новый
+    кодировщик на каждый ответ
+    """
+    def __init__(self):
+        self.encoder = encoders.JSONEncoder(
+            ensure_ascii=False,
+            separators=(',', ':'),
+            allow_nan=False,
+        )
+
+    def dumps(self, data):
+        return self.encoder.encode(data).encode('utf-8')
+
+
+class OrjsonBackend:
+    """
+    orjson; типы, которых он не знает (ленивые строки, Decimal,
+    генераторы), приводит JSONEncoder DRF
+    """
+    def __init__(self):
+        self.default = encoders.JSONEncoder().default
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=self.default)
+
+
+BACKENDS = {
+    ORJSON_BACKEND: OrjsonBackend,
+    STDLIB_BACKEND: StdlibBackend,
+}
+
+
+def get_json_backend(name=None):
+    """
+    Кодировщик из JSON_RENDERER['backend']; без установленного orjson
+    используется стандартная библиотека
+    """
+    name = name or settings.JSON_RENDERER['backend']
+    if name == ORJSON_BACKEND and orjson is None:
+        name = STDLIB_BACKEND
+    return BACKENDS[name]()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer с подключаемым кодировщиком. Компактный вывод
+    совпадает с JSONRenderer, кроме записи чисел с экспонентой
+    у orjson (1e16 вместо 1e+16) и NaN (null вместо ошибки). Ответы
+    с отступом (Accept: ...; indent=) и данные, которые кодировщик
+    не принял (ключи не строки, целые больше 64 бит), отдаёт обычный
+    JSONRenderer
+    """
+    backend = None
+
+    def get_backend(self):
+        if FastJSONRenderer.backend is None:
+            FastJSONRenderer.backend = get_json_backend()
+        return FastJSONRenderer.backend
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '',
+                           renderer_context or {}):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            content = self.get_backend().dumps(data)
+        except (TypeError, ValueError):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        for raw, escaped in LINE_SEPARATORS:
+            content = content.replace(raw, escaped)
+        return content
@@ -1,4 +1,5 @@
 import os
+from datetime import datetime, timedelta, timezone
 
 from dotenv import load_dotenv
 
@@ -28,6 +29,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.ProfilingMiddleware',
+    'foodgram.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +83,51 @@ else:
         },
     }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    },
+}
+
+REFERENCE_CACHE = {
+    'alias': 'default',
+    'timeout': int(os.getenv('REFERENCE_CACHE_TIMEOUT', default=60 * 60)),
+    'local_maxsize': 256,
+    'local_ttl': int(os.getenv('REFERENCE_CACHE_LOCAL_TTL', default=30)),
+}
+
+RECIPE_RESPONSE_CACHE = {
+    'alias': 'default',
+    'timeout': int(os.getenv('RECIPE_RESPONSE_CACHE_TIMEOUT', default=60)),
+    'local_maxsize': 512,
+    'local_ttl': 5,
+}
+
+# Общие выдачи рецептов и флаги зрителя (избранное, корзина, подписки)
+# кэшируются, только если кэш общий для воркеров: в кэше процесса
+# изменения пользователя не видны другим воркерам gunicorn до истечения
+# REFERENCE_CACHE['timeout']. Иначе флаги считаются запросом (EXISTS)
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+RECIPE_RESPONSE_CACHE_ENABLED = os.getenv(
+    'RECIPE_RESPONSE_CACHE_ENABLED',
+    str(all(
+        CACHES[config['alias']]['BACKEND'] not in PROCESS_LOCAL_CACHES
+        for config in (REFERENCE_CACHE, RECIPE_RESPONSE_CACHE)
+    ))
+).lower() in ('true', '1', 't')
+
+INGREDIENT_AUTOCOMPLETE_INDEX = os.getenv(
+    'INGREDIENT_AUTOCOMPLETE_INDEX', 'True'
+).lower() in ('true', '1', 't')
+INGREDIENT_SEARCH_MAX_RESULTS = 100
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.'
@@ -118,7 +166,102 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static/')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (480, 480),
+    'preview': (1200, 1200),
+}
+RECIPE_IMAGE_FORMAT = 'WEBP'
+RECIPE_IMAGE_QUALITY = 80
+BACKGROUND_WORKERS = int(os.getenv(
+    'BACKGROUND_WORKERS', default=os.getenv('RECIPE_IMAGE_WORKERS', 2)
+))
+RECIPE_IMAGE_QUEUE = os.getenv('RECIPE_IMAGE_QUEUE', default='')
+
+RECIPE_FEED = {
+    'backend': os.getenv(
+        'RECIPE_FEED_BACKEND', default='recipes.feed.DatabaseFeedBackend'
+    ),
+    'fanout_threshold': int(
+        os.getenv('RECIPE_FEED_FANOUT_THRESHOLD', default=1000)
+    ),
+    'backfill': 50,
+    'max_length': 1000,
+    'queue': os.getenv('RECIPE_FEED_QUEUE', default=''),
+}
+
+RECIPE_SEARCH_MAX_RESULTS = 1000
+RECIPE_MATCH_MAX_RESULTS = 1000
+RECIPE_MATCH_MAX_MISSING = 5
+RECIPE_BULK_MAX_IDS = 500
+RECIPE_FAST_ENCODER = os.getenv(
+    'RECIPE_FAST_ENCODER', 'True'
+).lower() in ('true', '1', 't')
+
+RECIPE_SIMILAR = {
+    'top_k': 10,
+    'tag_weight': 0.5,
+    'favorite_weight': 0.3,
+    'max_df': 0.2,
+    'candidates': 2000,
+    'queue': os.getenv('RECIPE_SIMILAR_QUEUE', default=''),
+}
+
+# Трендовая оценка - сумма weight * 2 ** ((t - epoch) / half_life) по
+# событиям. Значения растут экспоненциально, поэтому эпоха сама
+# сдвигается от epoch вперёд каждые epoch_half_lives периодов
+# полураспада (до переполнения float ~1000 периодов); после сдвига
+# оценки переводит на новую эпоху периодический update_recipe_scores
+RECIPE_RANKING = {
+    'weights': {'favorite': 1.0, 'cart': 0.5},
+    'half_life': timedelta(hours=int(
+        os.getenv('RECIPE_TRENDING_HALF_LIFE_HOURS', default=72)
+    )),
+    'epoch': datetime(2026, 1, 1, tzinfo=timezone.utc),
+    'epoch_half_lives': 100,
+}
+
+# Сбор метрик по умолчанию включён только в режиме отладки
+PROFILING = {
+    'enabled': os.getenv(
+        'PROFILING_ENABLED', str(DEBUG)
+    ).lower() in ('true', '1', 't'),
+    'exclude': ('/api/metrics/',),
+    'n_plus_one_threshold': int(
+        os.getenv('PROFILING_N_PLUS_ONE_THRESHOLD', default=10)
+    ),
+    'sample_rate': float(os.getenv('PROFILING_SAMPLE_RATE', default=0)),
+    'profile_dir': os.getenv(
+        'PROFILING_DIR', default=os.path.join(BASE_DIR, 'profiles')
+    ),
+    'server_timing': DEBUG,
+    'metrics_token': os.getenv('METRICS_TOKEN', default=''),
+}
+
+# orjson или stdlib; без установленного orjson всегда stdlib
+JSON_RENDERER = {
+    'backend': os.getenv('JSON_RENDERER_BACKEND', default='orjson'),
+}
+
+# Ответы меньше min_size не сжимаются: заголовки и кадр gzip съедают
+# выигрыш. br выбирается первым, если установлен пакет Brotli
+COMPRESSION = {
+    'enabled': os.getenv(
+        'COMPRESSION_ENABLED', 'True'
+    ).lower() in ('true', '1', 't'),
+    'min_size': int(os.getenv('COMPRESSION_MIN_SIZE', default=1024)),
+    'encodings': ('br', 'gzip'),
+    'gzip_level': int(os.getenv('COMPRESSION_GZIP_LEVEL', default=6)),
+    'brotli_quality': int(
+        os.getenv('COMPRESSION_BROTLI_QUALITY', default=4)
+    ),
+    'content_types': ('application/json', 'text/plain', 'text/csv'),
+}
+
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
@@ -0,0 +1,25 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .metrics import CONTENT_TYPE, registry
+
+
+def metrics(request):
+    """
+    Метрики процесса в формате Prometheus. Доступны по заголовку
+    Authorization: Bearer <METRICS_TOKEN>, а без токена - только
+    в режиме отладки
+    """
+    token = settings.PROFILING['metrics_token']
+    if token:
+        expected = f'Bearer {token}'
+        allowed = hmac.compare_digest(
+            request.META.get('HTTP_AUTHORIZATION', ''), expected
+        )
+    else:
+        allowed = settings.DEBUG
+    if not allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -1,7 +1,36 @@
 from django.contrib import admin
 
+from .lists import resync_after_commit
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
+
+
+class ResyncAdmin(admin.ModelAdmin):
+    """
+    Правки в админке идут в обход API: после фиксации пересчитываются
+    списки покупок и счётчики по строкам до и после изменения.
+    get_affected(objects) -> (user_ids, recipe_ids, author_ids)
+    """
+    def get_affected(self, objects):
+        raise NotImplementedError
+
+    def resync(self, objects):
+        resync_after_commit(*self.get_affected(objects))
+
+    def save_model(self, request, obj, form, change):
+        objects = [obj]
+        if change:
+            objects.append(type(obj).objects.get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        self.resync(objects)
+
+    def delete_model(self, request, obj):
+        self.resync([obj])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        self.resync(list(queryset))
+        super().delete_queryset(request, queryset)
 
 
 @admin.register(Ingredient)
@@ -12,13 +41,14 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'author', 'count_favorites')
+class RecipeAdmin(ResyncAdmin):
+    list_display = ('id', 'name', 'author', 'favorites_count', 'cart_count')
     list_filter = ('name', 'author', 'tags',)
     search_fields = ('name', 'author__username', 'tags__name')
+    readonly_fields = ('favorites_count', 'cart_count')
 
-    def count_favorites(self, obj):
-        return obj.favorites.count()
+    def get_affected(self, objects):
+        return (), (), {recipe.author_id for recipe in objects}
 
 
 @admin.register(Tag)
@@ -26,6 +56,39 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'color', 'slug')
 
 
-admin.site.register(ShoppingCart)
-admin.site.register(Favorite)
-admin.site.register(RecipeIngredient)
+@admin.register(ShoppingCart, Favorite)
+class RecipeListAdmin(ResyncAdmin):
+    def get_affected(self, objects):
+        return (
+            {row.user_id for row in objects},
+            {row.recipe_id for row in objects},
+            (),
+        )
+
+
+@admin.register(RecipeIngredient)
+class RecipeIngredientAdmin(ResyncAdmin):
+    def get_affected(self, objects):
+        recipe_ids = {row.recipe_id for row in objects}
+        return (
+            ShoppingCart.objects.filter(
+                recipe__in=recipe_ids
+            ).values_list('user_id', flat=True),
+            recipe_ids,
+            (),
+        )
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """
+    Список покупок выводится из корзин: в админке только просмотр
+    """
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
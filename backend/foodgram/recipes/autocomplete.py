@@ -0,0 +1,64 @@
+import threading
+from bisect import bisect_left
+
+from .cache import INGREDIENTS_NAMESPACE, reference_cache
+from .models import Ingredient
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+    """
+    Отсортированный индекс нормализованных названий ингредиентов
+    в памяти процесса. Перестраивается, когда меняется версия
+    справочника ингредиентов в общем кэше.
+    """
+    def __init__(self):
+        self.version = None
+        self.entries = ([], [])
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        version = reference_cache.get_version(INGREDIENTS_NAMESPACE)
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            entries = sorted(
+                (normalize(name), pk)
+                for pk, name in Ingredient.objects.values_list('pk', 'name')
+            )
+            self.entries = (
+                [name for name, _ in entries],
+                [pk for _, pk in entries],
+            )
+            self.version = version
+
+    def search(self, query, limit):
+        """
+        Возвращает два списка id, вместе не длиннее limit: ингредиенты,
+        название которых начинается с запроса, и те, где запрос
+        встречается внутри
+        """
+        self.refresh()
+        names, ids = self.entries
+        query = normalize(query)
+        start = bisect_left(names, query)
+        end = start
+        while (end < len(names) and end - start < limit
+               and names[end].startswith(query)):
+            end += 1
+        prefix = ids[start:end]
+        substring = []
+        for name, pk in zip(names, ids):
+            if len(prefix) + len(substring) >= limit:
+                break
+            if query in name and not name.startswith(query):
+                substring.append(pk)
+        return prefix, substring
+
+
+ingredient_index = IngredientIndex()
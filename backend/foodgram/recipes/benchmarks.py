@@ -0,0 +1,619 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from foodgram.compression import get_codecs
+from foodgram.renderers import FastJSONRenderer
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Subscription, User
+
+from .encoders import encode_recipes, serialize_recipes
+from .exporters import export_text
+from .feed import rebuild_feeds
+from .filters import filter_by_tags
+from .matching import RecipeMatchIndex, invalidate_match_index
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .pagination import KeysetPagination
+from .ranking import update_recipe_scores
+from .search import rebuild_search_documents
+from .serializers import RecipeViewSerializer
+from .services import rebuild_shopping_lists, reconcile_counters
+from .similarity import compute_similar_recipes
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+DISCARD_QUEUE = 'recipes.benchmarks.discard_task'
+BENCHMARK_IMAGE = 'recipes/images/benchmark.png'
+BENCHMARK_IMAGE_BASE64 = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+# Максимальное число запросов к БД на один вызов эндпоинта,
+# не зависящее от размера страницы и объёма данных.
+QUERY_BUDGETS = {
+    'recipes-list': 9,
+    'recipes-list-limit': 6,
+    'recipes-list-cursor': 5,
+    'recipes-list-tags': 5,
+    'recipes-list-tags-multi': 9,
+    'recipes-list-popular': 6,
+    'recipes-list-trending': 6,
+    'recipes-detail': 4,
+    'recipes-list-anonymous': 5,
+    'recipes-detail-anonymous': 5,
+    'recipes-create': 20,
+    'recipes-update': 20,
+    'recipes-update-back': 20,
+    'recipes-favorite-bulk-add': 9,
+    'recipes-favorite-bulk-remove': 8,
+    'recipes-cart-bulk-add': 16,
+    'recipes-cart-bulk-remove': 16,
+    'recipes-feed': 6,
+    'recipes-feed-next': 6,
+    'recipes-search': 8,
+    'recipes-match': 6,
+    'recipes-similar': 4,
+    'recipes-match-missing': 6,
+    'users-subscriptions': 4,
+    'users-subscriptions-all': 4,
+}
+
+
+class Scale:
+    """
+    Размер синтетического набора данных
+    """
+    def __init__(self, users=50, recipes=500, ingredients=2000,
+                 ingredients_per_recipe=8, tags=5, favorites=20, carts=5,
+                 subscriptions=10, seed=42):
+        self.users = users
+        self.recipes = recipes
+        self.ingredients = ingredients
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.tags = tags
+        self.favorites = favorites
+        self.carts = carts
+        self.subscriptions = subscriptions
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class Dataset:
+    """
+    Объекты, на которые ссылаются сценарии бенчмарка
+    """
+    def __init__(self, user, token, recipe, own_recipe, author, ingredient,
+                 ingredient_ids, tag):
+        self.user = user
+        self.token = token
+        self.recipe = recipe
+        self.own_recipe = own_recipe
+        self.author = author
+        self.ingredient = ingredient
+        self.ingredient_ids = ingredient_ids
+        self.tag = tag
+
+
+def seed_dataset(scale):
+    """
+    Заполняет пустую БД синтетическими данными заданного размера.
+    Первый пользователь - тот, от чьего имени выполняются запросы;
+    последний рецепт и его автор оставлены вне его избранного,
+    корзины и подписок, чтобы сценарии добавления не падали на
+    уникальных ограничениях.
+    """
+    rnd = random.Random(scale.seed)
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.bulk_create(
+        User(
+            email=f'bench{i}@example.com',
+            username=f'bench{i}',
+            first_name='Bench',
+            last_name=f'User{i}',
+            password=password,
+        )
+        for i in range(scale.users)
+    )
+    users = list(User.objects.filter(
+        username__startswith='bench').order_by('id'))
+    Tag.objects.bulk_create(
+        Tag(name=f'Тег {i}', color='#FFFFFF', slug=f'tag{i}')
+        for i in range(scale.tags)
+    )
+    tags = list(Tag.objects.order_by('id'))
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'Ингредиент {i:06d}', measurement_unit='г')
+        for i in range(scale.ingredients)
+    )
+    ingredient_ids = list(
+        Ingredient.objects.order_by('id').values_list('id', flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=users[i % len(users)],
+            name=f'Рецепт {i}',
+            image=BENCHMARK_IMAGE,
+            text='Описание рецепта. ' * rnd.randint(5, 50),
+            cooking_time=rnd.randint(1, 180),
+        )
+        for i in range(scale.recipes)
+    )
+    recipes = list(Recipe.objects.order_by('id'))
+    recipe_ids = [recipe.id for recipe in recipes]
+    target = recipes[-1]
+
+    through = Recipe.tags.through
+    through.objects.bulk_create(
+        through(recipe_id=recipe.id, tag_id=tag.id)
+        for recipe in recipes
+        for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe_id=recipe.id,
+            ingredient_id=ingredient_id,
+            amount=rnd.randint(1, 500),
+        )
+        for recipe in recipes
+        for ingredient_id in rnd.sample(
+            ingredient_ids,
+            min(scale.ingredients_per_recipe, len(ingredient_ids))
+        )
+    )
+
+    def sample(population, count, exclude=None):
+        population = [item for item in population if item != exclude]
+        return rnd.sample(population, min(count, len(population)))
+
+    favorites, carts, subscriptions = [], [], []
+    for index, user in enumerate(users):
+        exclude = target.id if index == 0 else None
+        favorites.extend(
+            Favorite(user_id=user.id, recipe_id=recipe_id)
+            for recipe_id in sample(recipe_ids, scale.favorites, exclude)
+        )
+        carts.extend(
+            ShoppingCart(user_id=user.id, recipe_id=recipe_id)
+            for recipe_id in sample(recipe_ids, scale.carts, exclude)
+        )
+        authors = [author for author in users if author != user]
+        exclude = target.author if index == 0 else None
+        subscriptions.extend(
+            Subscription(user_id=user.id, author_id=author.id)
+            for author in sample(authors, scale.subscriptions, exclude)
+        )
+    Favorite.objects.bulk_create(favorites)
+    ShoppingCart.objects.bulk_create(carts)
+    Subscription.objects.bulk_create(subscriptions)
+    rebuild_shopping_lists()
+    reconcile_counters()
+    rebuild_feeds()
+    rebuild_search_documents()
+    invalidate_match_index()
+    compute_similar_recipes()
+    update_recipe_scores()
+
+    user = users[0]
+    token, _ = Token.objects.get_or_create(user=user)
+    return Dataset(
+        user=user,
+        token=token.key,
+        recipe=target,
+        own_recipe=recipes[0],
+        author=target.author,
+        ingredient=Ingredient.objects.get(pk=ingredient_ids[0]),
+        ingredient_ids=ingredient_ids[:10],
+        tag=tags[0],
+    )
+
+
+def get_scenarios(dataset):
+    """
+    Сценарии: (имя, метод, путь, тело, нужна ли авторизация).
+    Изменяющие запросы идут парами, чтобы повторные прогоны
+    выполнялись над одним и тем же состоянием.
+    """
+    recipe = dataset.recipe.id
+    author = dataset.author.id
+    ingredient = dataset.ingredient
+    pantry = ','.join(map(str, dataset.ingredient_ids))
+    feed_cursor = KeysetPagination().encode_cursor(dataset.recipe, False)
+    tag_query = '&'.join(
+        f'tags={slug}' for slug in Tag.objects.order_by('id').values_list(
+            'slug', flat=True
+        )[:3]
+    )
+    recipe_payload = {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in dataset.ingredient_ids
+        ],
+        'tags': [dataset.tag.id],
+        'image': BENCHMARK_IMAGE_BASE64,
+        'name': 'Бенчмарк',
+        'text': 'Рецепт для бенчмарка',
+        'cooking_time': 5,
+    }
+    return [
+        ('tags-list', 'get', '/api/tags/', None, False),
+        ('tags-detail', 'get', f'/api/tags/{dataset.tag.id}/', None, False),
+        ('ingredients-list', 'get', '/api/ingredients/', None, False),
+        ('ingredients-search', 'get',
+         f'/api/ingredients/?name={ingredient.name[:12]}', None, False),
+        ('ingredients-detail', 'get',
+         f'/api/ingredients/{ingredient.id}/', None, False),
+        ('recipes-list', 'get', '/api/recipes/', None, True),
+        ('recipes-list-limit', 'get', '/api/recipes/?page=2&limit=20',
+         None, True),
+        ('recipes-list-cursor', 'get',
+         '/api/recipes/?pagination=cursor&limit=20', None, True),
+        ('recipes-list-tags', 'get',
+         f'/api/recipes/?tags={dataset.tag.slug}', None, True),
+        ('recipes-list-popular', 'get', '/api/recipes/?ordering=popular',
+         None, True),
+        ('recipes-list-trending', 'get',
+         '/api/recipes/?ordering=trending&limit=20', None, True),
+        ('recipes-list-tags-multi', 'get',
+         f'/api/recipes/?{tag_query}&ordering=popular', None, True),
+        ('recipes-list-favorited', 'get', '/api/recipes/?is_favorited=1',
+         None, True),
+        ('recipes-list-cart', 'get', '/api/recipes/?is_in_shopping_cart=1',
+         None, True),
+        ('recipes-list-author', 'get', f'/api/recipes/?author={author}',
+         None, True),
+        ('recipes-feed', 'get', '/api/recipes/feed/?limit=20', None, True),
+        ('recipes-feed-next', 'get',
+         f'/api/recipes/feed/?limit=20&cursor={feed_cursor}', None, True),
+        ('recipes-search', 'get',
+         f'/api/recipes/search/?q={dataset.recipe.name.split()[0]}', None,
+         True),
+        ('recipes-match', 'get',
+         f'/api/recipes/match/?ingredients={pantry}', None, True),
+        ('recipes-match-missing', 'get',
+         f'/api/recipes/match/?ingredients={pantry}&missing=2', None, True),
+        ('recipes-similar', 'get', f'/api/recipes/{recipe}/similar/', None,
+         True),
+        ('recipes-detail', 'get', f'/api/recipes/{recipe}/', None, True),
+        ('recipes-list-anonymous', 'get', '/api/recipes/', None, False),
+        ('recipes-detail-anonymous', 'get', f'/api/recipes/{recipe}/', None,
+         False),
+        ('recipes-create', 'post', '/api/recipes/', recipe_payload, True),
+        ('recipes-update', 'patch', f'/api/recipes/{dataset.own_recipe.id}/',
+         dict(recipe_payload, ingredients=recipe_payload['ingredients'][1:]),
+         True),
+        ('recipes-update-back', 'patch',
+         f'/api/recipes/{dataset.own_recipe.id}/', recipe_payload, True),
+        ('recipes-favorite-bulk-add', 'post', '/api/recipes/favorite/',
+         {'author': author}, True),
+        ('recipes-favorite-bulk-remove', 'delete', '/api/recipes/favorite/',
+         {'author': author}, True),
+        ('recipes-cart-bulk-add', 'post', '/api/recipes/shopping_cart/',
+         {'author': author}, True),
+        ('recipes-cart-bulk-remove', 'delete',
+         '/api/recipes/shopping_cart/', {'author': author}, True),
+        ('recipes-favorite-add', 'post',
+         f'/api/recipes/{recipe}/favorite/', None, True),
+        ('recipes-favorite-remove', 'delete',
+         f'/api/recipes/{recipe}/favorite/', None, True),
+        ('recipes-cart-add', 'post',
+         f'/api/recipes/{recipe}/shopping_cart/', None, True),
+        ('recipes-cart-remove', 'delete',
+         f'/api/recipes/{recipe}/shopping_cart/', None, True),
+        ('recipes-download-cart', 'get',
+         '/api/recipes/download_shopping_cart/', None, True),
+        ('recipes-download-cart-csv', 'get',
+         '/api/recipes/download_shopping_cart/?format=csv', None, True),
+        ('recipes-download-cart-json', 'get',
+         '/api/recipes/download_shopping_cart/?format=json', None, True),
+        ('users-list', 'get', '/api/users/', None, False),
+        ('users-detail', 'get', f'/api/users/{author}/', None, True),
+        ('users-me', 'get', '/api/users/me/', None, True),
+        ('users-subscriptions', 'get',
+         '/api/users/subscriptions/?recipes_limit=3', None, True),
+        ('users-subscriptions-all', 'get', '/api/users/subscriptions/',
+         None, True),
+        ('users-subscribe', 'post', f'/api/users/{author}/subscribe/',
+         None, True),
+        ('users-unsubscribe', 'delete', f'/api/users/{author}/subscribe/',
+         None, True),
+        ('auth-token-login', 'post', '/api/auth/token/login/',
+         {'email': dataset.user.email, 'password': BENCHMARK_PASSWORD},
+         False),
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def benchmark_match_index(recipes, ingredients=2000, per_recipe=10,
+                          pantry=15, max_missing=2, queries=50, seed=0):
+    """
+    Синтетический замер индекса без базы: время построения
+    и перцентили времени запроса
+    """
+    generator = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(ingredients)]
+    population = range(1, ingredients + 1)
+    rows = [
+        (recipe_id, ingredient_id)
+        for recipe_id in range(1, recipes + 1)
+        for ingredient_id in set(generator.choices(
+            population, weights, k=per_recipe
+        ))
+    ]
+    index = RecipeMatchIndex()
+    started = time.perf_counter()
+    index.load(rows)
+    build = time.perf_counter() - started
+    timings, found = [], []
+    for _ in range(queries):
+        pantry_ids = generator.choices(population, weights, k=pantry)
+        started = time.perf_counter()
+        found.append(len(index.match(pantry_ids, max_missing)))
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'recipes': recipes,
+        'build_s': round(build, 3),
+        'query_p50_ms': round(percentile(timings, 0.5), 3),
+        'query_p95_ms': round(percentile(timings, 0.95), 3),
+        'matches_avg': round(statistics.mean(found), 1),
+    }
+
+
+def benchmark_tag_filter(repeat=20, page_size=6):
+    """
+    Время COUNT и первой страницы фильтра по 1..N тегам на уже
+    заполненной БД: с ростом числа тегов и рецептов оно не должно
+    расти вместе с числом подходящих строк
+    """
+    slugs = list(Tag.objects.order_by('id').values_list('slug', flat=True))
+    results = {}
+    for size in range(1, len(slugs) + 1):
+        queryset = filter_by_tags(Recipe.objects.all(), slugs[:size])
+        counts, pages = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            total = queryset.count()
+            counts.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            list(queryset.order_by('-pub_date', '-id').values_list(
+                'pk', flat=True
+            )[:page_size])
+            pages.append((time.perf_counter() - started) * 1000)
+        results[size] = {
+            'recipes': total,
+            'count_p50_ms': round(percentile(counts, 0.5), 3),
+            'page_p50_ms': round(percentile(pages, 0.5), 3),
+        }
+    return results
+
+
+def render_payloads(payloads):
+    """
+    JSON выдач в порядке id, как его отдаёт JSONRenderer
+    """
+    return JSONRenderer().render(sorted(payloads, key=lambda x: x['id']))
+
+
+def benchmark_encoders(repeat=20, page_sizes=(6, 20, 50, 100)):
+    """
+    Время построения выдач страницы (запросы, сборка и JSON) через
+    RecipeViewSerializer и через быстрый кодировщик
+    """
+    request = APIRequestFactory().get('/api/recipes/')
+    encoders = {
+        'drf': lambda ids: serialize_recipes(
+            request, ids, RecipeViewSerializer
+        ),
+        'fast': lambda ids: encode_recipes(request, ids),
+    }
+    results = {}
+    for size in page_sizes:
+        recipe_ids = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True)[:size])
+        result = {'recipes': len(recipe_ids)}
+        for name, encode in encoders.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                render_payloads(encode(recipe_ids))
+                timings.append((time.perf_counter() - started) * 1000)
+            result[f'{name}_p50_ms'] = round(percentile(timings, 0.5), 3)
+        result['speedup'] = round(
+            result['drf_p50_ms'] / result['fast_p50_ms'], 2
+        )
+        results[size] = result
+    return results
+
+
+def time_call(function, argument, repeat):
+    """
+    p50 времени вызова в мс и результат последнего вызова
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(argument)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(percentile(timings, 0.5), 3), result
+
+
+def measure_compression(content, repeat):
+    result = {'bytes': len(content)}
+    for codec in get_codecs():
+        result[f'{codec.name}_ms'], compressed = time_call(
+            codec.compress, content, repeat
+        )
+        result[f'{codec.name}_bytes'] = len(compressed)
+    return result
+
+
+def benchmark_compression(repeat=20, page_sizes=(6, 20, 50, 100)):
+    """
+    Отрисовка страниц рецептов JSONRenderer и FastJSONRenderer
+    и сжатие результата каждым доступным кодеком: время и байты.
+    identical - совпадают ли ответы обоих рендереров байт в байт.
+    Отдельно сжимается самый длинный список покупок в тексте
+    """
+    request = APIRequestFactory().get('/api/recipes/')
+    renderers = {'drf': JSONRenderer(), 'fast': FastJSONRenderer()}
+    results = {}
+    for size in page_sizes:
+        recipe_ids = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True)[:size])
+        payloads = sorted(
+            encode_recipes(request, recipe_ids), key=lambda x: x['id']
+        )
+        result = {'recipes': len(recipe_ids)}
+        contents = {}
+        for name, renderer in renderers.items():
+            result[f'{name}_render_ms'], contents[name] = time_call(
+                renderer.render, payloads, repeat
+            )
+        result['identical'] = contents['drf'] == contents['fast']
+        result.update(measure_compression(contents['fast'], repeat))
+        results[size] = result
+    owner = ShoppingListItem.objects.values('user').annotate(
+        items=Count('id')
+    ).order_by('-items').first()
+    if owner is not None:
+        rows = ShoppingListItem.objects.filter(user=owner['user']).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name')
+        content = ''.join(export_text(rows)).encode('utf-8')
+        results['shopping-list'] = dict(
+            {'items': owner['items']}, **measure_compression(content, repeat)
+        )
+    return results
+
+
+def response_size(response):
+    if getattr(response, 'streaming', False):
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+def discard_task(*args):
+    """
+    Очередь фоновых задач для прогона: замеряется только путь запроса
+    """
+
+
+def background_disabled():
+    return override_settings(
+        RECIPE_IMAGE_QUEUE=DISCARD_QUEUE,
+        RECIPE_SIMILAR=dict(settings.RECIPE_SIMILAR, queue=DISCARD_QUEUE),
+        RECIPE_FEED=dict(settings.RECIPE_FEED, queue=DISCARD_QUEUE),
+    )
+
+
+@contextmanager
+def temporary_media():
+    """
+    Картинки рецептов, созданных сценариями, пишутся во временный
+    MEDIA_ROOT, который удаляется после прогона
+    """
+    with TemporaryDirectory() as media_root:
+        with override_settings(MEDIA_ROOT=media_root):
+            yield media_root
+
+
+def run_scenarios(dataset, repeat=20, warmup=2):
+    """
+    Прогоняет сценарии через тестовый клиент и собирает
+    число запросов к БД, задержки и размер ответа
+    """
+    with background_disabled(), temporary_media():
+        return collect_samples(dataset, repeat, warmup)
+
+
+def collect_samples(dataset, repeat, warmup):
+    anonymous = APIClient()
+    authorized = APIClient()
+    authorized.credentials(HTTP_AUTHORIZATION=f'Token {dataset.token}')
+    scenarios = get_scenarios(dataset)
+    samples = {name: ([], [], {}) for name, *_ in scenarios}
+    created = []
+    # Сценарии прогоняются по кругу, чтобы пары "добавить/удалить"
+    # чередовались и не упирались в уникальные ограничения.
+    for iteration in range(warmup + repeat):
+        for name, method, path, data, auth in scenarios:
+            client = authorized if auth else anonymous
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data, format='json')
+                size = response_size(response)
+                elapsed = time.perf_counter() - started
+            if name == 'recipes-create' and response.status_code == 201:
+                created.append(response.data['id'])
+            timings, queries, last = samples[name]
+            last.update(status=response.status_code, bytes=size)
+            if iteration >= warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(context))
+    Recipe.objects.filter(pk__in=created).delete()
+    return {
+        name: {
+            'method': method.upper(),
+            'path': path,
+            'status': samples[name][2]['status'],
+            'queries': max(samples[name][1]),
+            'p50_ms': round(statistics.median(samples[name][0]), 3),
+            'p95_ms': round(percentile(samples[name][0], 0.95), 3),
+            'bytes': samples[name][2]['bytes'],
+            'budget': QUERY_BUDGETS.get(name),
+        }
+        for name, method, path, *_ in scenarios
+    }
+
+
+def check_budgets(results):
+    return [
+        f'{name}: {result["queries"]} запросов при бюджете '
+        f'{result["budget"]}'
+        for name, result in results.items()
+        if result['budget'] is not None
+        and result['queries'] > result['budget']
+    ]
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Сравнивает два отчёта: рост числа запросов - регрессия всегда,
+    рост p95 и размера ответа - при превышении порога
+    """
+    regressions = []
+    for name, result in current['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} -> '
+                f'{result["queries"]}'
+            )
+        for metric in ('p95_ms', 'bytes'):
+            limit = previous[metric] * (1 + threshold)
+            if result[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {previous[metric]} -> '
+                    f'{result[metric]}'
+                )
+    return regressions
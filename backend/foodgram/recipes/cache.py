@@ -0,0 +1,176 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.response import Response
+
+TAGS_NAMESPACE = 'tags'
+INGREDIENTS_NAMESPACE = 'ingredients'
+
+
+class LocalCache:
+    """
+    LRU-кэш с ограниченным временем жизни записей в памяти процесса
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class VersionedCache:
+    """
+    Двухуровневый кэш: локальный LRU в каждом процессе поверх общего
+    бэкенда Django. Ключи включают версию пространства имён, поэтому
+    для инвалидации достаточно увеличить версию в общем бэкенде.
+    """
+    def __init__(self, alias, timeout, local_maxsize, local_ttl):
+        self.alias = alias
+        self.timeout = timeout
+        self.local = LocalCache(local_maxsize, local_ttl)
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def get_version(self, namespace):
+        key = f'version:{namespace}'
+        version = self.shared.get(key)
+        if version is None:
+            self.shared.add(key, 1, None)
+            version = self.shared.get(key, 1)
+        return version
+
+    def bump_version(self, namespace):
+        key = f'version:{namespace}'
+        try:
+            return self.shared.incr(key)
+        except ValueError:
+            self.shared.add(key, 2, None)
+            return self.shared.get(key, 2)
+
+    def make_key(self, namespace, version, *parts):
+        digest = hashlib.md5(
+            '|'.join(map(str, parts)).encode('utf-8')
+        ).hexdigest()
+        return f'{namespace}:{version}:{digest}'
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        self.shared.set(key, value, self.timeout)
+
+    def get_many(self, keys):
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        if missing:
+            found = self.shared.get_many(missing)
+            for key, value in found.items():
+                self.local.set(key, value)
+            values.update(found)
+        return values
+
+    def set_many(self, values):
+        for key, value in values.items():
+            self.local.set(key, value)
+        self.shared.set_many(values, self.timeout)
+
+
+reference_cache = VersionedCache(**settings.REFERENCE_CACHE)
+response_cache = VersionedCache(**settings.RECIPE_RESPONSE_CACHE)
+
+
+def normalize_query(request):
+    return urlencode(sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    ))
+
+
+def etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in (tag.strip() for tag in header.split(',')) or (
+        header.strip() == '*'
+    )
+
+
+class ReferenceCacheMixin:
+    """
+    Кэширование ответов list/retrieve для справочных данных
+    с поддержкой ETag и If-None-Match
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = reference_cache.get_version(self.cache_namespace)
+        key = reference_cache.make_key(
+            self.cache_namespace, version, request.path,
+            normalize_query(request)
+        )
+        etag = f'"{key}"'
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = reference_cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                reference_cache.set(key, response.data)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
@@ -0,0 +1,139 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache import normalize_query, response_cache
+from .models import Recipe
+from .overlay import get_viewer_state, render_recipes
+
+RECIPES_NAMESPACE = 'recipes'
+RECIPE_NAMESPACE = 'recipe'
+
+
+def invalidate_recipe_lists():
+    """
+    Новая версия списков рецептов после фиксации транзакции: выдачи
+    отдельных рецептов сбрасываются сами, их ключи содержат отметку
+    изменения рецепта
+    """
+    transaction.on_commit(
+        lambda: response_cache.bump_version(RECIPES_NAMESPACE)
+    )
+
+
+def touch_recipes(recipes):
+    """
+    Обновляет отметку изменения рецептов, чья выдача зависит от
+    изменённых тегов, ингредиентов или автора
+    """
+    if recipes.update(modified=timezone.now()):
+        invalidate_recipe_lists()
+
+
+def get_recipe_stamp(pk):
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise Http404
+    stamp = Recipe.objects.filter(pk=pk).values_list(
+        'modified', flat=True
+    ).first()
+    if stamp is None:
+        raise Http404
+    return pk, stamp
+
+
+def finalize(response, etag, last_modified, private=False):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if private:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified)
+    )
+
+
+class RecipeResponseCacheMixin:
+    """
+    Ответы list/retrieve из общих выдач рецептов с наложенным
+    состоянием зрителя (см. overlay), с ETag, Last-Modified и ответом
+    304. Недостающие выдачи строит функция из self.get_encoder().
+    Рецепт проверяется по отметке изменения одним запросом по
+    первичному ключу. Анонимные списки целиком хранятся в кэше под
+    версией, которая растёт при любом изменении рецептов; счётчики
+    и порядок по оценкам в них обновляются не позже
+    RECIPE_RESPONSE_CACHE['timeout']. Без общего кэша
+    (RECIPE_RESPONSE_CACHE_ENABLED) ответы строятся обычным путём
+    viewset с флагами зрителя из запроса
+    """
+    def list(self, request, *args, **kwargs):
+        if not settings.RECIPE_RESPONSE_CACHE_ENABLED:
+            return super().list(request, *args, **kwargs)
+        if not request.user.is_anonymous:
+            return self.render_list(request)
+        version = response_cache.get_version(RECIPES_NAMESPACE)
+        key = response_cache.make_key(
+            RECIPES_NAMESPACE, version, request.get_host(), request.path,
+            normalize_query(request)
+        )
+        entry = response_cache.get(key)
+        if entry is None:
+            response = self.render_list(request)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            generated = int(time.time())
+            entry = (f'"{key}-{generated}"', generated, response.data)
+            response_cache.set(key, entry)
+        etag, generated, data = entry
+        response = not_modified(request, etag, generated) or Response(data)
+        return finalize(response, etag, generated)
+
+    def render_list(self, request):
+        """
+        Страница выбирается по лёгкому запросу (id и отметки), выдачи
+        рецептов берутся из кэша
+        """
+        queryset = self.filter_queryset(
+            Recipe.objects.only('pk', 'pub_date', 'modified')
+        )
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            render_recipes(request, page, self.get_encoder())
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if not settings.RECIPE_RESPONSE_CACHE_ENABLED:
+            return super().retrieve(request, *args, **kwargs)
+        pk, stamp = get_recipe_stamp(kwargs.get(self.lookup_field))
+        etag = f'{RECIPE_NAMESPACE}-{pk}-{int(stamp.timestamp() * 10 ** 6)}'
+        if request.user.is_authenticated:
+            state = get_viewer_state(request.user)
+            etag = f'{etag}-{request.user.pk}-{state.version}'
+        etag = f'"{etag}"'
+        last_modified = stamp.timestamp()
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            data = render_recipes(
+                request, [Recipe(pk=pk, modified=stamp)], self.get_encoder()
+            )
+            if not data:
+                raise Http404
+            response = Response(data[0])
+        return finalize(
+            response, etag, last_modified, request.user.is_authenticated
+        )
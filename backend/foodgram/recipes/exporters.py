@@ -0,0 +1,80 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """
+    Рендерер для выбора формата списка покупок через ?format=
+    или заголовок Accept. Сам список отдаётся потоком в обход
+    рендерера, через него проходят только ответы с ошибками.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class TextShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class JSONShoppingListRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+
+
+class Echo:
+    """
+    Псевдобуфер для csv.writer, возвращающий записанную строку
+    """
+    def write(self, value):
+        return value
+
+
+def export_text(rows):
+    yield 'Купить ингридиенты (продукты): \n'
+    for name, measurement_unit, amount in rows:
+        yield f'{name}: {amount} {measurement_unit}\n'
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    separator = '\n'
+    yield '['
+    for name, measurement_unit, amount in rows:
+        yield separator + json.dumps({
+            'name': name,
+            'measurement_unit': measurement_unit,
+            'amount': amount,
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n'
+
+
+EXPORTERS = {
+    TextShoppingListRenderer.format: export_text,
+    CSVShoppingListRenderer.format: export_csv,
+    JSONShoppingListRenderer.format: export_json,
+}
+
+SHOPPING_LIST_RENDERERS = (
+    TextShoppingListRenderer,
+    CSVShoppingListRenderer,
+    JSONShoppingListRenderer,
+)
@@ -0,0 +1,301 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from users.models import Subscription
+
+from . import tasks
+from .models import FeedEntry, Recipe
+from .pagination import keyset_filter
+
+_backend = None
+# Не больше 999 параметров в одном запросе SQLite
+TRIM_BATCH_SIZE = 500
+TRIM_FEEDS = '''
+    DELETE FROM {table} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id ORDER BY pub_date DESC, recipe_id DESC
+            ) AS position
+            FROM {table}
+            WHERE user_id IN ({user_ids})
+        ) ranked
+        WHERE position > %s
+    )
+'''
+
+
+class DatabaseFeedBackend:
+    """
+    Ленты в таблице FeedEntry. Записи (pub_date, recipe_id, author_id);
+    после вставки в каждой ленте остаются max_length последних
+    """
+    def __init__(self):
+        self.max_length = settings.RECIPE_FEED['max_length']
+
+    def add(self, user_ids, entries):
+        FeedEntry.objects.bulk_create(
+            [
+                FeedEntry(
+                    user_id=user_id, pub_date=pub_date,
+                    recipe_id=recipe_id, author_id=author_id
+                )
+                for user_id in user_ids
+                for pub_date, recipe_id, author_id in entries
+            ],
+            ignore_conflicts=True
+        )
+        self.trim(user_ids)
+
+    def trim(self, user_ids):
+        user_ids = sorted(set(user_ids))
+        with connection.cursor() as cursor:
+            for start in range(0, len(user_ids), TRIM_BATCH_SIZE):
+                batch = user_ids[start:start + TRIM_BATCH_SIZE]
+                cursor.execute(
+                    TRIM_FEEDS.format(
+                        table=FeedEntry._meta.db_table,
+                        user_ids=', '.join(['%s'] * len(batch))
+                    ),
+                    [*batch, self.max_length]
+                )
+
+    def remove_recipe(self, recipe_id):
+        FeedEntry.objects.filter(recipe_id=recipe_id).delete()
+
+    def remove_author(self, user_id, author_id):
+        FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+    def clear(self, user_ids=None):
+        entries = FeedEntry.objects.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+
+    def range(self, user_id, position, reverse, count):
+        entries = FeedEntry.objects.filter(user_id=user_id)
+        if position is None:
+            entries = entries.order_by('-pub_date', '-recipe_id')
+        else:
+            entries = keyset_filter(
+                entries, *position, reverse, pk_field='recipe_id'
+            )
+        return list(entries.values_list('pub_date', 'recipe_id')[:count])
+
+
+class MemoryFeedBackend:
+    """
+    Ленты в памяти процесса: отсортированные списки с ограниченной
+    длиной, как sorted set в Redis. Подходит для одного процесса
+    и для разработки; при нескольких воркерах нужна общая реализация
+    с тем же интерфейсом
+    """
+    def __init__(self):
+        self.max_length = settings.RECIPE_FEED['max_length']
+        self.timelines = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, user_ids, entries):
+        with self._lock:
+            for user_id in user_ids:
+                timeline = self.timelines[user_id]
+                for entry in entries:
+                    position = bisect_left(timeline, entry[:2])
+                    if (position < len(timeline)
+                            and timeline[position][:2] == entry[:2]):
+                        continue
+                    insort(timeline, tuple(entry))
+                del timeline[:-self.max_length]
+
+    def remove_recipe(self, recipe_id):
+        with self._lock:
+            for user_id, timeline in self.timelines.items():
+                timeline[:] = [
+                    entry for entry in timeline if entry[1] != recipe_id
+                ]
+
+    def remove_author(self, user_id, author_id):
+        with self._lock:
+            timeline = self.timelines[user_id]
+            timeline[:] = [
+                entry for entry in timeline if entry[2] != author_id
+            ]
+
+    def clear(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                self.timelines.clear()
+            for user_id in user_ids or ():
+                self.timelines.pop(user_id, None)
+
+    def range(self, user_id, position, reverse, count):
+        with self._lock:
+            timeline = list(self.timelines.get(user_id, ()))
+        if reverse:
+            pub_date, pk = position
+            start = bisect_left(timeline, (pub_date, pk + 1))
+            entries = timeline[start:start + count]
+        else:
+            end = len(timeline)
+            if position is not None:
+                end = bisect_left(timeline, position)
+            entries = timeline[max(end - count, 0):end][::-1]
+        return [entry[:2] for entry in entries]
+
+
+def get_feed_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.RECIPE_FEED['backend'])()
+    return _backend
+
+
+def is_pulled(author):
+    """
+    Рецепты авторов с большим числом подписчиков не рассылаются
+    по лентам, а подмешиваются при чтении
+    """
+    return author.followers_count >= settings.RECIPE_FEED['fanout_threshold']
+
+
+def schedule_feed_task(function, *args):
+    """
+    Рассылка по лентам в очереди RECIPE_FEED['queue'] после фиксации
+    транзакции: у автора может быть до fanout_threshold подписчиков
+    """
+    transaction.on_commit(lambda: tasks.dispatch(
+        settings.RECIPE_FEED['queue'], function, *args
+    ))
+
+
+def push_to_followers(author_id, entries):
+    followers = Subscription.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    get_feed_backend().add(list(followers), entries)
+
+
+def push_recipe(recipe_id):
+    entries = list(Recipe.objects.filter(pk=recipe_id).values_list(
+        'pub_date', 'id', 'author_id'
+    ))
+    if entries:
+        push_to_followers(entries[0][2], entries)
+
+
+def push_author(author_id):
+    push_to_followers(author_id, latest_entries(
+        [author_id], settings.RECIPE_FEED['backfill']
+    ))
+
+
+def fan_out_recipe(recipe):
+    """
+    Добавляет новый рецепт в ленты подписчиков автора
+    """
+    if not is_pulled(recipe.author):
+        schedule_feed_task(push_recipe, recipe.pk)
+
+
+def remove_recipe_from_feeds(recipe_id):
+    transaction.on_commit(
+        lambda: get_feed_backend().remove_recipe(recipe_id)
+    )
+
+
+def latest_entries(author_ids, count):
+    return list(
+        Recipe.objects.filter(author__in=author_ids).order_by(
+            '-pub_date', '-id'
+        ).values_list('pub_date', 'id', 'author_id')[:count]
+    )
+
+
+def backfill_feed(user, author):
+    """
+    Добавляет в ленту последние рецепты автора при подписке
+    """
+    if is_pulled(author):
+        return
+    transaction.on_commit(lambda: get_feed_backend().add(
+        [user.pk],
+        latest_entries([author.pk], settings.RECIPE_FEED['backfill'])
+    ))
+
+
+def start_fan_out(author):
+    """
+    Автор опустился ниже порога: его рецепты больше не подмешиваются
+    при чтении, поэтому последние добавляются в ленты подписчиков,
+    а новые рассылаются при публикации
+    """
+    schedule_feed_task(push_author, author.pk)
+
+
+def drop_author_from_feed(user, author):
+    transaction.on_commit(
+        lambda: get_feed_backend().remove_author(user.pk, author.pk)
+    )
+
+
+def rebuild_feeds(user_ids=None):
+    """
+    Пересобирает ленты по подпискам. Нужна после смены бэкенда или
+    порога и после массовых изменений в обход API
+    """
+    backend = get_feed_backend()
+    backend.clear(user_ids)
+    threshold = settings.RECIPE_FEED['fanout_threshold']
+    subscriptions = Subscription.objects.filter(
+        author__followers_count__lt=threshold
+    ).order_by('user_id')
+    if user_ids is not None:
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+    authors = defaultdict(list)
+    for user_id, author_id in subscriptions.values_list(
+            'user_id', 'author_id'):
+        authors[user_id].append(author_id)
+    for user_id, author_ids in authors.items():
+        backend.add([user_id], latest_entries(
+            author_ids, settings.RECIPE_FEED['max_length']
+        ))
+
+
+class Feed:
+    """
+    Лента подписок пользователя: записи из бэкенда, слитые
+    с рецептами авторов, которые читаются напрямую
+    """
+    def __init__(self, user):
+        self.user = user
+
+    def pulled(self, position, reverse, count):
+        authors = Subscription.objects.filter(
+            user=self.user,
+            author__followers_count__gte=settings.RECIPE_FEED[
+                'fanout_threshold'
+            ]
+        ).values('author')
+        recipes = Recipe.objects.filter(author__in=authors)
+        if position is None:
+            recipes = recipes.order_by('-pub_date', '-id')
+        else:
+            recipes = keyset_filter(recipes, *position, reverse)
+        return list(recipes.values_list('pub_date', 'id')[:count])
+
+    def fetch(self, position, reverse, count):
+        entries = heapq.merge(
+            get_feed_backend().range(self.user.pk, position, reverse, count),
+            self.pulled(position, reverse, count),
+            reverse=not reverse
+        )
+        ids = []
+        for _, recipe_id in entries:
+            if recipe_id not in ids:
+                ids.append(recipe_id)
+        ids = ids[:count]
+        recipes = Recipe.objects.for_user(self.user).in_bulk(ids)
+        return [recipes[pk] for pk in ids if pk in recipes]
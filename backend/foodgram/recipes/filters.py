@@ -1,14 +1,58 @@
+from django.conf import settings
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 from django_filters import rest_framework as filter
+from recipes.autocomplete import ingredient_index
 from recipes.models import Ingredient, Recipe
+from recipes.ranking import ORDERINGS
 
 
 class IngredientSearchFilter(filter.FilterSet):
-    name = filter.CharFilter(field_name='name', lookup_expr='istartswith')
+    name = filter.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name', 'measurement_unit')
 
+    def filter_name(self, queryset, name, value):
+        """
+        Сначала ингредиенты, начинающиеся с value, затем содержащие его.
+        Индекс в памяти отдаёт не больше INGREDIENT_SEARCH_MAX_RESULTS
+        id в нужном порядке, и из БД читаются только они
+        """
+        if settings.INGREDIENT_AUTOCOMPLETE_INDEX:
+            prefix, substring = ingredient_index.search(
+                value, settings.INGREDIENT_SEARCH_MAX_RESULTS
+            )
+            ids = prefix + substring
+            if not ids:
+                return queryset.none()
+            return queryset.filter(pk__in=ids).order_by(Case(
+                *(When(pk=pk, then=Value(position))
+                  for position, pk in enumerate(ids)),
+                output_field=IntegerField()
+            ))
+        return queryset.filter(name__icontains=value).annotate(
+            match_rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('match_rank', 'name')
+
+
+def filter_by_tags(queryset, slugs):
+    """
+    Рецепты хотя бы с одним из тегов через коррелированный EXISTS
+    по индексу (recipe_id, tag_id) таблицы связей вместо JOIN
+    и DISTINCT по строкам рецептов: страница читается по индексу
+    сортировки, и проверка останавливается на первых подходящих строках
+    """
+    return queryset.annotate(
+        has_tags=Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'), tag__slug__in=slugs
+        ))
+    ).filter(has_tags=True)
+
 
 class RecipeFilter(filter.FilterSet):
     tags = filter.CharFilter(
@@ -21,14 +65,20 @@ class RecipeFilter(filter.FilterSet):
     is_in_shopping_cart = filter.CharFilter(
         method='get_is_in_shopping_cart'
     )
+    ordering = filter.ChoiceFilter(
+        choices=[(name, name) for name in ORDERINGS],
+        method='order_by_score'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'ordering')
 
     def filter_tags(self, queryset, slug, tags):
-        tags = self.request.query_params.getlist('tags')
-        return queryset.filter(tags__slug__in=tags).distinct()
+        return filter_by_tags(
+            queryset, self.request.query_params.getlist('tags')
+        )
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -39,3 +89,10 @@ class RecipeFilter(filter.FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
+
+    def order_by_score(self, queryset, name, value):
+        """
+        Сортировка по заранее посчитанной оценке: страница читается
+        по индексу без агрегатов по избранному и корзинам
+        """
+        return queryset.order_by(*ORDERINGS[value])
@@ -0,0 +1,111 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, features
+
+from . import tasks
+from .conditional import invalidate_recipe_lists
+from .models import Recipe
+
+
+def get_variant_format():
+    if settings.RECIPE_IMAGE_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.RECIPE_IMAGE_FORMAT
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(
+        buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def process_recipe_image(recipe_id):
+    """
+    Записывает размеры картинки рецепта и генерирует её уменьшенные
+    варианты из settings.RECIPE_IMAGE_VARIANTS
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    with recipe.image.open('rb') as file:
+        image = Image.open(file)
+        image.load()
+    image_format = get_variant_format()
+    extension = 'webp' if image_format == 'WEBP' else 'jpg'
+    basename = os.path.splitext(os.path.basename(source))[0]
+    fields = {'image_width': image.width, 'image_height': image.height}
+    old_files = get_variant_files(recipe)
+    for field_name, size in settings.RECIPE_IMAGE_VARIANTS.items():
+        field = getattr(recipe, field_name)
+        field.save(
+            f'{basename}.{extension}',
+            ContentFile(render_variant(image, size, image_format)),
+            save=False
+        )
+        fields[field_name] = field.name
+    # Картинку могли заменить, пока шла обработка: тогда
+    # варианты устарели, и их запишет задача для новой картинки.
+    if Recipe.objects.filter(pk=recipe_id, image=source).update(
+            modified=timezone.now(), **fields):
+        delete_files_on_commit(old_files)
+        invalidate_recipe_lists()
+    else:
+        delete_files_on_commit(get_variant_files(recipe))
+
+
+def get_variant_files(recipe):
+    """
+    (хранилище, имя) записанных вариантов картинки рецепта
+    """
+    return [
+        (file.storage, file.name)
+        for file in (getattr(recipe, field_name)
+                     for field_name in settings.RECIPE_IMAGE_VARIANTS)
+        if file
+    ]
+
+
+def delete_files_on_commit(files):
+    """
+    Удаляет файлы из хранилища после фиксации транзакции: при откате
+    на них по-прежнему ссылается рецепт
+    """
+    def delete():
+        for storage, name in files:
+            storage.delete(name)
+
+    if files:
+        transaction.on_commit(delete)
+
+
+def reset_image_variants(recipe):
+    """
+    Сбрасывает варианты заменённой картинки; их файлы удаляются,
+    когда новая картинка сохранена
+    """
+    delete_files_on_commit(get_variant_files(recipe))
+    recipe.image_width = recipe.image_height = None
+    recipe.thumbnail = recipe.preview = ''
+
+
+def schedule_image_processing(recipe):
+    """
+    Ставит обработку картинки в очередь RECIPE_IMAGE_QUEUE после
+    фиксации транзакции (см. tasks.dispatch)
+    """
+    transaction.on_commit(lambda: tasks.dispatch(
+        settings.RECIPE_IMAGE_QUEUE, process_recipe_image, recipe.pk
+    ))
@@ -0,0 +1,132 @@
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from users.models import User
+
+from .conditional import touch_recipes
+from .models import Favorite, Recipe, ShoppingCart
+from .overlay import invalidate_viewer_state
+from .ranking import CART, FAVORITE, score_changes, update_recipe_scores
+from .services import (change_shopping_list, rebuild_shopping_lists,
+                       reconcile_counters)
+
+ADDED = 'added'
+EXISTS = 'exists'
+NOT_FOUND = 'not_found'
+REMOVED = 'removed'
+MISSING = 'missing'
+
+# Списки рецептов пользователя: событие -> (модель, счётчик рецепта).
+LISTS = {
+    FAVORITE: (Favorite, 'favorites_count'),
+    CART: (ShoppingCart, 'cart_count'),
+}
+
+
+def lock_user(user):
+    """
+    Блокирует строку пользователя до конца транзакции: изменения
+    его списков выполняются по очереди, и найденные существующие
+    строки не расходятся со вставкой
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list(
+        'pk', flat=True
+    ))
+
+
+def apply_list_changes(user, event, created, sign):
+    """
+    Счётчики, оценки и отметки изменения рецептов одним UPDATE,
+    затем список покупок и состояние пользователя для оверлея.
+    created - {id рецепта: время добавления}
+    """
+    if not created:
+        return
+    _, counter = LISTS[event]
+    Recipe.objects.filter(pk__in=created).update(
+        modified=timezone.now(),
+        **{counter: Greatest(F(counter) + sign, Value(0))},
+        **score_changes(event, created, sign)
+    )
+    if event == CART:
+        change_shopping_list(user, list(created), sign)
+    invalidate_viewer_state(user.pk)
+
+
+@transaction.atomic
+def add_recipes(user, event, recipe_ids):
+    """
+    Добавляет рецепты в избранное или корзину одной вставкой.
+    Возвращает {id: added | exists | not_found} в порядке recipe_ids
+    """
+    model, _ = LISTS[event]
+    lock_user(user)
+    found = set(Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'pk', flat=True
+    ))
+    existing = set(model.objects.filter(
+        user=user, recipe_id__in=found
+    ).values_list('recipe_id', flat=True))
+    rows = [
+        model(user=user, recipe_id=recipe_id)
+        for recipe_id in sorted(found - existing)
+    ]
+    model.objects.bulk_create(rows, ignore_conflicts=True)
+    apply_list_changes(
+        user, event, {row.recipe_id: row.created for row in rows}, 1
+    )
+    return {
+        recipe_id: (
+            NOT_FOUND if recipe_id not in found
+            else EXISTS if recipe_id in existing
+            else ADDED
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def remove_recipes(user, event, recipe_ids=None):
+    """
+    Убирает рецепты из избранного или корзины одним DELETE, без
+    recipe_ids - все. Возвращает {id: removed | missing}
+    """
+    model, _ = LISTS[event]
+    lock_user(user)
+    rows = model.objects.filter(user=user)
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    created = dict(rows.values_list('recipe_id', 'created'))
+    rows.delete()
+    apply_list_changes(user, event, created, -1)
+    if recipe_ids is None:
+        recipe_ids = sorted(created)
+    return {
+        recipe_id: REMOVED if recipe_id in created else MISSING
+        for recipe_id in recipe_ids
+    }
+
+
+def resync_after_commit(user_ids=(), recipe_ids=(), author_ids=()):
+    """
+    Для изменений в обход API (админка, каскадное удаление): после
+    фиксации пересобирает списки покупок и состояние для оверлея
+    пользователей user_ids, счётчики, оценки и отметки изменения
+    рецептов recipe_ids и счётчики авторов author_ids
+    """
+    user_ids, recipe_ids = set(user_ids), set(recipe_ids)
+    author_ids = set(author_ids)
+
+    def resync():
+        if user_ids:
+            rebuild_shopping_lists(user_ids)
+        if recipe_ids or author_ids:
+            reconcile_counters(recipe_ids, author_ids)
+        if recipe_ids:
+            update_recipe_scores(recipe_ids)
+            touch_recipes(Recipe.objects.filter(pk__in=recipe_ids))
+        for user_id in user_ids:
+            invalidate_viewer_state(user_id)
+
+    transaction.on_commit(resync)
@@ -0,0 +1,147 @@
+import json
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from recipes.benchmarks import (Scale, benchmark_compression,
+                                benchmark_encoders, benchmark_match_index,
+                                benchmark_tag_filter, check_budgets,
+                                compare_reports, run_scenarios, seed_dataset)
+
+EXTRA_LABELS = {
+    'tag_filter': 'tag filter, тегов',
+    'encoders': 'encoders, рецептов',
+    'compression': 'compression, рецептов',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway test database and records query counts, '
+        'latency and response sizes for every API endpoint'
+    )
+
+    def add_arguments(self, parser):
+        defaults = Scale()
+        for option in ('users', 'recipes', 'ingredients',
+                       'ingredients_per_recipe', 'tags', 'favorites',
+                       'carts', 'subscriptions', 'seed'):
+            parser.add_argument(
+                '--' + option.replace('_', '-'),
+                type=int,
+                default=getattr(defaults, option),
+            )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--output', help='JSON file for the report')
+        parser.add_argument(
+            '--baseline', help='JSON report to compare against'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Allowed relative growth of p95 latency and bytes'
+        )
+        parser.add_argument('--keepdb', action='store_true')
+        parser.add_argument(
+            '--match-recipes', type=int, default=0,
+            help='Also time the in-memory match index on N synthetic recipes'
+        )
+        parser.add_argument(
+            '--tag-filter', action='store_true',
+            help='Also time the tag filter for every number of tags'
+        )
+        parser.add_argument(
+            '--encoders', action='store_true',
+            help='Also time the fast recipe encoder against the DRF '
+                 'serializer at page sizes 6-100'
+        )
+        parser.add_argument(
+            '--compression', action='store_true',
+            help='Also time JSON rendering and gzip/br compression of '
+                 'recipe pages and the shopping list, with bytes saved'
+        )
+
+    def run_extras(self, options):
+        """
+        Дополнительные замеры на заполненной БД: {имя: результаты по
+        размеру}
+        """
+        extras = {}
+        if options['tag_filter']:
+            extras['tag_filter'] = benchmark_tag_filter(options['repeat'])
+        if options['encoders']:
+            extras['encoders'] = benchmark_encoders(options['repeat'])
+        if options['compression']:
+            extras['compression'] = benchmark_compression(options['repeat'])
+        return extras
+
+    def handle(self, *args, **options):
+        scale = Scale(**{
+            option: options[option] for option in Scale().as_dict()
+        })
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            self.stdout.write('Заполнение тестовой БД...')
+            dataset = seed_dataset(scale)
+            self.stdout.write('Прогон сценариев...')
+            results = run_scenarios(
+                dataset, repeat=options['repeat'], warmup=options['warmup']
+            )
+            extras = self.run_extras(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'scale': scale.as_dict(),
+                'repeat': options['repeat'],
+                'django': django.get_version(),
+                'vendor': connection.vendor,
+            },
+            'endpoints': results,
+        }
+        for name, extra in extras.items():
+            report[name] = extra
+            for size, result in extra.items():
+                self.stdout.write(f'{EXTRA_LABELS[name]} {size}: {result}')
+        if options['match_recipes']:
+            report['match_index'] = benchmark_match_index(
+                options['match_recipes']
+            )
+            self.stdout.write(f'match index: {report["match_index"]}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:28} {result["status"]} '
+                f'q={result["queries"]:<3} '
+                f'p50={result["p50_ms"]:>8.2f}ms '
+                f'p95={result["p95_ms"]:>8.2f}ms '
+                f'{result["bytes"]}b'
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Отчёт сохранён в {options["output"]}')
+
+        failures = check_budgets(results)
+        failures.extend(
+            f'FastJSONRenderer расходится с JSONRenderer на {size} рецептах'
+            for size, result in report.get('compression', {}).items()
+            if not result.get('identical', True)
+        )
+        if options['baseline']:
+            with open(options['baseline'], 'r', encoding='utf-8') as file:
+                baseline = json.load(file)
+            failures += compare_reports(
+                baseline, report, options['threshold']
+            )
+        if failures:
+            raise CommandError('Регрессии:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
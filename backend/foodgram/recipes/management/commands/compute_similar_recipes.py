@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from recipes.similarity import compute_similar_recipes, update_similar_recipe
+
+
+class Command(BaseCommand):
+    help = 'Recomputes top-K similar recipes for every recipe'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe', type=int, action='append', dest='recipes',
+            help='Only update the given recipe id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['recipes']:
+            for recipe_id in options['recipes']:
+                update_similar_recipe(recipe_id)
+        else:
+            compute_similar_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты пересчитаны за '
+            f'{time.monotonic() - started:.2f} с'
+        ))
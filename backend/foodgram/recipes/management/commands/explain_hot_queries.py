@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from recipes.benchmarks import Scale, seed_dataset
+from recipes.plans import check_plans
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds a throwaway test database, runs EXPLAIN for every hot '
+        'query and fails if any plan reads a table sequentially'
+    )
+
+    def add_arguments(self, parser):
+        defaults = Scale()
+        for option in ('users', 'recipes', 'seed'):
+            parser.add_argument(
+                '--' + option,
+                type=int,
+                default=getattr(defaults, option),
+            )
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        scale = Scale(
+            users=options['users'],
+            recipes=options['recipes'],
+            seed=options['seed'],
+        )
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb']
+        )
+        try:
+            self.stdout.write('Заполнение тестовой БД...')
+            dataset = seed_dataset(scale)
+            results = check_plans(dataset)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+            teardown_test_environment()
+
+        failures = []
+        for name, (plan, scans) in results.items():
+            if scans:
+                failures.append(f'{name}: полное чтение {", ".join(scans)}')
+                self.stdout.write(self.style.ERROR(f'{name}: SEQ SCAN'))
+            else:
+                self.stdout.write(f'{name}: OK')
+            if scans or options['verbosity'] > 1:
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+        if failures:
+            raise CommandError(
+                'Последовательное чтение в планах:\n' + '\n'.join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS('Все планы используют индексы'))
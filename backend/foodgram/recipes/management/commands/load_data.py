@@ -1,41 +1,187 @@
 import csv
+import json
+import os
+import time
+from itertools import islice
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db.utils import IntegrityError
+from django.db import transaction
+from recipes.cache import (INGREDIENTS_NAMESPACE, TAGS_NAMESPACE,
+                           reference_cache)
 from recipes.models import Ingredient, Tag
 
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'data'
+)
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+
+def iter_json_array(file):
+    """
+    Потоково читает JSON-массив объектов, не загружая файл целиком
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив')
+    buffer, finished = buffer[1:], False
+    while not finished:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        finished = not chunk
+        buffer += chunk
+        position = skip_separators(buffer, 0)
+        while position < len(buffer) and buffer[position] != ']':
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    raise CommandError('Некорректный JSON-массив')
+                break
+            yield item
+            position = skip_separators(buffer, end)
+        buffer = buffer[position:]
+
+
+def read_rows(path, fields):
+    """
+    Строки файла в виде словарей: CSV без заголовка с колонками
+    в порядке fields, JSON-массив или JSON Lines с объектами
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'r', encoding='utf-8') as file:
+        if extension == '.csv':
+            for row in csv.reader(file):
+                if row:
+                    yield dict(zip(fields, row))
+        elif extension == '.json':
+            yield from iter_json_array(file)
+        elif extension == '.jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            raise CommandError(f'Неизвестный формат файла {path}')
+
+
+def validate_rows(rows, fields, path):
+    """
+    Проверяет, что каждая запись - объект со всеми полями fields
+    """
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise CommandError(f'{path}: запись {number} не объект')
+        missing = [field for field in fields if field not in row]
+        if missing:
+            raise CommandError(
+                f'{path}: в записи {number} нет поля {", ".join(missing)}'
+            )
+        yield row
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'loading ingredients from data in json'
+    help = 'Loads ingredients and tags from CSV, JSON or JSON Lines files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(DATA_DIR, 'ingredients.csv'),
+            help='CSV (name,measurement_unit), JSON or JSONL file'
+        )
+        parser.add_argument(
+            '--tags',
+            default=os.path.join(DATA_DIR, 'tags.csv'),
+            help='CSV (name,color,slug), JSON or JSONL file'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Read and count rows without writing to the database'
+        )
+        parser.add_argument(
+            '--diff', action='store_true',
+            help='Print rows that are missing from the database'
+        )
 
     def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.dry_run = options['dry_run'] or options['diff']
+        self.diff = options['diff']
+        sources = (
+            (Ingredient, options['ingredients'],
+             ('name', 'measurement_unit'), 'name', INGREDIENTS_NAMESPACE),
+            (Tag, options['tags'], ('name', 'color', 'slug'), 'slug',
+             TAGS_NAMESPACE),
+        )
         try:
-            file_name = 'recipes/data/ingredients.csv'
-            with open(file_name, 'r',
-                      encoding='utf-8') as file:
-                file_reader = csv.reader(file)
-                for row in file_reader:
-                    name, measurement_unit = row
-                    try:
-                        Ingredient.objects.get_or_create(
-                            name=name,
-                            measurement_unit=measurement_unit
-                        )
-                    except IntegrityError:
-                        print(f'Ингредиент {name} {measurement_unit} '
-                              f'уже есть в базе')
-            print(f'Данные из {file_name} загружены')
-            file_name = 'recipes/data/tags.csv'
-            with open(file_name, 'r',
-                      encoding='utf-8') as file:
-                file_reader = csv.reader(file)
-                for row in file_reader:
-                    name, color, slug = row
-                    Tag.objects.get_or_create(
-                        name=name,
-                        color=color,
-                        slug=slug
-                    )
-            print(f'Данные из {file_name} загружены')
-        except FileNotFoundError:
-            raise CommandError(f'{file_name} отсутствует в директории data')
+            with transaction.atomic():
+                for model, path, fields, key, namespace in sources:
+                    self.load(model, path, fields, key)
+        except FileNotFoundError as error:
+            raise CommandError(f'{error.filename} не найден')
+        if not self.dry_run:
+            for *_, namespace in sources:
+                reference_cache.bump_version(namespace)
+
+    def load(self, model, path, fields, key):
+        started = time.monotonic()
+        before = model.objects.count()
+        total = new = 0
+        rows = validate_rows(read_rows(path, fields), fields, path)
+        for batch in batches(rows, self.batch_size):
+            objects = [
+                model(**{field: row[field] for field in fields})
+                for row in batch
+            ]
+            total += len(objects)
+            if self.dry_run:
+                new += self.compare(model, objects, fields, key)
+            else:
+                model.objects.bulk_create(objects, ignore_conflicts=True)
+            if self.verbosity > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{path}: {total} строк, {total / elapsed:.0f} строк/с'
+                )
+        if not self.dry_run:
+            new = model.objects.count() - before
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Данные из {path} {"проверены" if self.dry_run else "загружены"}'
+            f': {total} строк, новых {new}, за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def compare(self, model, objects, fields, key):
+        existing = {
+            row[key]: row
+            for row in model.objects.filter(**{
+                f'{key}__in': [getattr(obj, key) for obj in objects]
+            }).values(*fields)
+        }
+        new = 0
+        for obj in objects:
+            row = {field: getattr(obj, field) for field in fields}
+            current = existing.get(row[key])
+            if current is None:
+                new += 1
+                if self.diff:
+                    self.stdout.write(f'+ {row}')
+            elif self.diff and current != row:
+                self.stdout.write(f'~ {current} -> {row}')
+        return new
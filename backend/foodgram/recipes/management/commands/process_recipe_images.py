@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generates image variants and dimensions for existing recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Reprocess recipes that already have variants'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnail='')
+        processed = 0
+        for recipe_id in recipes.values_list('pk', flat=True).iterator():
+            process_recipe_image(recipe_id)
+            processed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано картинок: {processed}')
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from recipes.feed import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds following feeds from subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Limit to the given user id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        rebuild_feeds(options['users'])
+        self.stdout.write(self.style.SUCCESS('Ленты подписок пересобраны'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.search import rebuild_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds full-text search documents for all recipes'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_search_documents()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.services import (aggregate_shopping_lists,
+                              materialized_shopping_lists,
+                              rebuild_shopping_lists)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds or verifies materialized shopping lists'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='Limit to the given user id (may be repeated)'
+        )
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare with the live aggregate, do not write'
+        )
+
+    def handle(self, *args, **options):
+        users = options['users']
+        if not options['verify']:
+            rebuild_shopping_lists(users)
+            self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+            return
+        expected = aggregate_shopping_lists(users)
+        actual = materialized_shopping_lists(users)
+        mismatched = sorted(
+            user_id for user_id in set(expected) | set(actual)
+            if expected.get(user_id, {}) != actual.get(user_id, {})
+        )
+        if mismatched:
+            raise CommandError(
+                'Списки покупок расходятся с корзинами у пользователей: '
+                + ', '.join(map(str, mismatched))
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок совпадают'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.services import find_counter_mismatches, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts denormalized favorite, cart, recipe and follower counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report mismatched rows, do not write'
+        )
+
+    def handle(self, *args, **options):
+        mismatches = find_counter_mismatches()
+        for counter, rows in mismatches.items():
+            self.stdout.write(f'{counter}: расхождений {rows}')
+        if options['check']:
+            if any(mismatches.values()):
+                raise CommandError('Счётчики расходятся с данными')
+            return
+        reconcile_counters()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
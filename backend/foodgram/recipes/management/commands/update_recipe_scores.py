@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from recipes.ranking import update_recipe_scores
+
+
+class Command(BaseCommand):
+    help = 'Recomputes popularity and trending scores from favorites and carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipe', type=int, action='append', dest='recipes',
+            help='Limit to the given recipe id (may be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        changed = update_recipe_scores(options['recipes'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки рецептов пересчитаны, изменено строк: {changed}'
+        ))
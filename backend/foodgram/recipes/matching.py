@@ -0,0 +1,160 @@
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import reference_cache
+from .models import RecipeIngredient
+
+MATCH_NAMESPACE = 'match'
+MAX_CHANGE_LOG = 1000
+
+
+def change_key(version):
+    return f'{MATCH_NAMESPACE}:changes:{version}'
+
+
+def mark_recipe_changed(recipe_id):
+    """
+    После фиксации транзакции увеличивает версию индекса и записывает,
+    какой рецепт изменился, чтобы процессы обновили только его
+    """
+    def publish():
+        version = reference_cache.bump_version(MATCH_NAMESPACE)
+        reference_cache.shared.set(
+            change_key(version), [recipe_id], reference_cache.timeout
+        )
+
+    transaction.on_commit(publish)
+
+
+def invalidate_match_index():
+    """
+    Версия без журнала изменений: процессы перестроят индекс целиком
+    """
+    transaction.on_commit(
+        lambda: reference_cache.bump_version(MATCH_NAMESPACE)
+    )
+
+
+class RecipeMatchIndex:
+    """
+    Составы рецептов в памяти процесса: отсортированный кортеж id
+    ингредиентов на рецепт и обратные списки ингредиент -> рецепты.
+    Покрытие набора считается по обратным спискам только для
+    рецептов, в которых есть хотя бы один ингредиент из набора
+    """
+    def __init__(self):
+        self.version = None
+        self.recipes = {}
+        self.sizes = {}
+        self.postings = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def set_recipe(self, recipe_id, ingredient_ids):
+        self.remove_recipe(recipe_id)
+        if not ingredient_ids:
+            return
+        ingredient_ids = tuple(sorted(set(ingredient_ids)))
+        self.recipes[recipe_id] = ingredient_ids
+        self.sizes[recipe_id] = len(ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            self.postings[ingredient_id].add(recipe_id)
+
+    def remove_recipe(self, recipe_id):
+        self.sizes.pop(recipe_id, None)
+        for ingredient_id in self.recipes.pop(recipe_id, ()):
+            postings = self.postings[ingredient_id]
+            postings.discard(recipe_id)
+            if not postings:
+                del self.postings[ingredient_id]
+
+    def load(self, rows):
+        """
+        Перестраивает индекс из пар (id рецепта, id ингредиента)
+        """
+        compositions = defaultdict(set)
+        for recipe_id, ingredient_id in rows:
+            compositions[recipe_id].add(ingredient_id)
+        postings = defaultdict(set)
+        for recipe_id, ingredient_ids in compositions.items():
+            for ingredient_id in ingredient_ids:
+                postings[ingredient_id].add(recipe_id)
+        self.recipes = {
+            recipe_id: tuple(sorted(ingredient_ids))
+            for recipe_id, ingredient_ids in compositions.items()
+        }
+        self.sizes = {
+            recipe_id: len(ingredient_ids)
+            for recipe_id, ingredient_ids in self.recipes.items()
+        }
+        self.postings = postings
+
+    def changed_since(self, version):
+        if self.version is None or not (
+                0 < version - self.version <= MAX_CHANGE_LOG):
+            return None
+        keys = [
+            change_key(number)
+            for number in range(self.version + 1, version + 1)
+        ]
+        changes = reference_cache.shared.get_many(keys)
+        if len(changes) != len(keys):
+            return None
+        return set().union(*changes.values())
+
+    def refresh(self):
+        version = reference_cache.get_version(MATCH_NAMESPACE)
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            changed = self.changed_since(version)
+            rows = RecipeIngredient.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            )
+            if changed is None:
+                self.load(rows.iterator())
+            else:
+                compositions = defaultdict(list)
+                for recipe_id, ingredient_id in rows.filter(
+                        recipe_id__in=changed):
+                    compositions[recipe_id].append(ingredient_id)
+                for recipe_id in changed:
+                    self.set_recipe(recipe_id, compositions.get(recipe_id))
+            self.version = version
+
+    def match(self, ingredient_ids, max_missing=0, limit=None):
+        """
+        Рецепты, которым не хватает не больше max_missing ингредиентов
+        из набора: список (id, (покрытие, недостающих)) по убыванию
+        покрытия
+        """
+        overlap = Counter()
+        with self._lock:
+            for ingredient_id in set(ingredient_ids):
+                overlap.update(self.postings.get(ingredient_id, ()))
+            sizes = self.sizes
+            matches = [
+                (recipe_id, (common / sizes[recipe_id],
+                             sizes[recipe_id] - common))
+                for recipe_id, common in overlap.items()
+                if sizes[recipe_id] - common <= max_missing
+            ]
+        matches.sort(
+            key=lambda item: (item[1][0], -item[1][1], item[0]),
+            reverse=True
+        )
+        return matches[:limit]
+
+
+match_index = RecipeMatchIndex()
+
+
+def match_recipes(ingredient_ids, max_missing=0):
+    match_index.refresh()
+    return match_index.match(
+        ingredient_ids, max_missing, settings.RECIPE_MATCH_MAX_RESULTS
+    )
@@ -0,0 +1,55 @@
+from django.contrib.postgres import operations
+from django.db import migrations
+
+CREATE_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+    'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+DROP_INDEXES = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_like',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm',
+)
+
+
+class TrigramExtension(operations.TrigramExtension):
+    """
+    В Django 2.2 откат CreateExtension не проверяет СУБД и ломает
+    миграцию назад на SQLite
+    """
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+    """
+    Индексы для поиска ингредиентов в БД, когда индекс автодополнения
+    в памяти отключён: istartswith и icontains в PostgreSQL
+    сравнивают UPPER(name::text) через LIKE.
+    """
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_INDEXES),
+            run_on_postgresql(DROP_INDEXES),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота картинки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина картинки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='preview',
+            field=models.ImageField(blank=True, upload_to='recipes/previews/', verbose_name='Картинка для страницы рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnail',
+            field=models.ImageField(blank=True, upload_to='recipes/thumbnails/', verbose_name='Миниатюра для списков'),
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 2.2.19 on 2026-10-18 19:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('russian', title), 'A') || "
+    "setweight(to_tsvector('russian', tags || ' ' || ingredients), 'B') || "
+    "setweight(to_tsvector('russian', body), 'C')"
+)
+CREATE_SEARCH_VECTOR = (
+    'ALTER TABLE recipes_recipesearchdocument ADD COLUMN search_vector '
+    f'tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED',
+    'CREATE INDEX recipes_search_vector_gin '
+    'ON recipes_recipesearchdocument USING gin (search_vector)',
+)
+DROP_SEARCH_VECTOR = (
+    'DROP INDEX IF EXISTS recipes_search_vector_gin',
+    'ALTER TABLE recipes_recipesearchdocument '
+    'DROP COLUMN IF EXISTS search_vector',
+)
+
+
+def run_on_postgresql(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeSearchDocument = apps.get_model('recipes', 'RecipeSearchDocument')
+    recipes = Recipe.objects.prefetch_related(
+        'tags', 'ingredients__ingredient'
+    )
+    RecipeSearchDocument.objects.bulk_create(
+        (
+            RecipeSearchDocument(
+                recipe_id=recipe.pk,
+                title=recipe.name,
+                tags=' '.join(tag.name for tag in recipe.tags.all()),
+                ingredients=' '.join(
+                    item.ingredient.name for item in recipe.ingredients.all()
+                ),
+                body=recipe.text,
+            )
+            for recipe in recipes
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='recipes.Recipe', verbose_name='Рецепт')),
+                ('title', models.TextField(verbose_name='Название')),
+                ('tags', models.TextField(blank=True, verbose_name='Теги')),
+                ('ingredients', models.TextField(blank=True, verbose_name='Ингридиенты')),
+                ('body', models.TextField(blank=True, verbose_name='Описание')),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Поисковый документ рецепта',
+                'verbose_name_plural': 'Поисковые документы рецептов',
+            },
+        ),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SEARCH_VECTOR),
+            run_on_postgresql(DROP_SEARCH_VECTOR),
+        ),
+        migrations.RunPython(
+            fill_search_documents, migrations.RunPython.noop
+        ),
+    ]
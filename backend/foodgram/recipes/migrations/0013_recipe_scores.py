@@ -0,0 +1,66 @@
+# Generated by Django 2.2.19 on 2026-10-18 21:40
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_scores(apps, schema_editor):
+    """
+    Время существующих событий неизвестно, поэтому все они считаются
+    произошедшими в момент миграции
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    config = settings.RECIPE_RANKING
+    age = django.utils.timezone.now() - config['epoch']
+    factor = 2 ** (age / config['half_life'])
+    popularity = (
+        F('favorites_count') * config['weights']['favorite']
+        + F('cart_count') * config['weights']['cart']
+    )
+    Recipe.objects.update(
+        popularity=popularity,
+        trending_score=popularity * factor,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, verbose_name='Трендовая оценка'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 2.2.19 on 2026-10-18 23:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Составной индекс (tag_id, recipe_id) на таблице связей рецептов
+    и тегов. Проверка EXISTS фильтра по тегам идёт по уникальному
+    (recipe_id, tag_id), а этот индекс нужен планировщику, когда
+    выгоднее начать с тега (полусоединение при редком теге и COUNT)
+    """
+
+    dependencies = [
+        ('recipes', '0014_recipe_modified'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX IF EXISTS recipe_tags_tag_recipe_idx',
+        ),
+    ]
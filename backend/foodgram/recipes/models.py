@@ -1,7 +1,10 @@
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from users.models import User
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.functions import RowNumber
+from users.models import Subscription, User
 
 
 class Tag(models.Model):
@@ -67,6 +70,81 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборки рецептов для сериализаторов
+    """
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            ),
+        )
+
+    def viewer_independent(self):
+        """
+        Рецепты с флагами, выключенными для любого пользователя: общая
+        часть выдачи, поверх которой накладывается состояние зрителя
+        """
+        false = Value(False, output_field=BooleanField())
+        return self.with_related().annotate(
+            is_favorited=false,
+            is_in_shopping_cart=false,
+            is_author_subscribed=false,
+        )
+
+    def for_user(self, user):
+        """
+        Рецепты со связанными объектами и флагами избранного, корзины
+        и подписки на автора, вычисленными для пользователя одним запросом
+        """
+        if not user.is_authenticated:
+            return self.viewer_independent()
+        return self.with_related().annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_author_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние рецепты авторов одним запросом: при limit берутся
+        первые limit рецептов каждого автора по ROW_NUMBER() OVER
+        (PARTITION BY author). Возвращает словарь author_id -> список
+        """
+        queryset = self.filter(author__in=author_ids).only(
+            'id', 'name', 'image', 'thumbnail', 'cooking_time', 'author_id'
+        )
+        if limit is None:
+            recipes = queryset.order_by('author', '-pub_date', '-id')
+        else:
+            ranked = queryset.annotate(row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()],
+            )).order_by()
+            sql, params = ranked.query.sql_with_params()
+            recipes = self.raw(
+                f'SELECT * FROM ({sql}) ranked WHERE row_number <= %s '
+                f'ORDER BY author_id, row_number',
+                (*params, limit)
+            )
+        by_author = {author_id: [] for author_id in author_ids}
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        return by_author
+
+
 class Recipe(models.Model):
     tags = models.ManyToManyField(
         Tag,
@@ -86,6 +164,26 @@ class Recipe(models.Model):
         verbose_name='Картинка рецепта',
         upload_to='recipes/images/'
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Ширина картинки'
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Высота картинки'
+    )
+    thumbnail = models.ImageField(
+        blank=True,
+        verbose_name='Миниатюра для списков',
+        upload_to='recipes/thumbnails/'
+    )
+    preview = models.ImageField(
+        blank=True,
+        verbose_name='Картинка для страницы рецепта',
+        upload_to='recipes/previews/'
+    )
     text = models.TextField(
         verbose_name='Текст рецепта'
     )
@@ -101,11 +199,51 @@ class Recipe(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True,
     )
+    modified = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлений в избранное'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Добавлений в корзину'
+    )
+    popularity = models.FloatField(
+        default=0,
+        verbose_name='Популярность'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        verbose_name='Трендовая оценка'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = (
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-id'],
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -147,6 +285,12 @@ class RecipeIngredient(models.Model):
                 name='unique_recipe_ingridients'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='recipe_ingredient_amount_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe}, {self.ingredient}'
@@ -167,6 +311,10 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Пользователь',
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -177,6 +325,12 @@ class Favorite(models.Model):
                 name='unique_favorites'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=['user', 'recipe'],
+                name='favorite_user_recipe_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.recipe}, {self.user}'
@@ -198,6 +352,10 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         ordering = ['-id']
@@ -208,6 +366,154 @@ class ShoppingCart(models.Model):
                 name='unique_user_shopping_cart'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=['recipe', 'user'],
+                name='cart_recipe_user_idx'
+            ),
+        )
 
     def __str__(self):
         return f'{self.user}, {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Список покупок пользователя: суммарное количество каждого
+    ингредиента по всем рецептам из его корзины
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингридиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество ингридиента'
+    )
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_ingredient'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}, {self.ingredient}: {self.amount}'
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан
+    пользователь. Заполняется при публикации рецепта
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор рецепта'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации рецепта'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+        )
+
+
+class RecipeSearchDocument(models.Model):
+    """
+    Текст рецепта для полнотекстового поиска. В PostgreSQL по нему
+    строится колонка search_vector с GIN-индексом (см. миграцию)
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+        verbose_name='Рецепт'
+    )
+    title = models.TextField(verbose_name='Название')
+    tags = models.TextField(blank=True, verbose_name='Теги')
+    ingredients = models.TextField(blank=True, verbose_name='Ингридиенты')
+    body = models.TextField(blank=True, verbose_name='Описание')
+    updated = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата обновления'
+    )
+
+    class Meta:
+        verbose_name = 'Поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+
+
+class SimilarRecipe(models.Model):
+    """
+    Предрассчитанные похожие рецепты: top-K соседей рецепта по составу,
+    тегам и совместному добавлению в избранное
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_links',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        )
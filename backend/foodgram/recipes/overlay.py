@@ -0,0 +1,111 @@
+from collections import namedtuple
+
+from django.db import transaction
+from users.models import Subscription
+
+from .cache import reference_cache, response_cache
+from .models import Favorite, ShoppingCart
+
+VIEWER_NAMESPACE = 'viewer'
+PAYLOAD_NAMESPACE = 'recipe-payload'
+
+ViewerState = namedtuple(
+    'ViewerState', ('version', 'favorites', 'cart', 'following')
+)
+ANONYMOUS_STATE = ViewerState(0, frozenset(), frozenset(), frozenset())
+
+
+def viewer_namespace(user_id):
+    return f'{VIEWER_NAMESPACE}:{user_id}'
+
+
+def invalidate_viewer_state(user_id):
+    """
+    Новая версия состояния пользователя после фиксации транзакции:
+    вызывается при изменении избранного, корзины и подписок
+    """
+    transaction.on_commit(
+        lambda: reference_cache.bump_version(viewer_namespace(user_id))
+    )
+
+
+def load_viewer_state(user, version):
+    return ViewerState(
+        version,
+        frozenset(Favorite.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )),
+        frozenset(ShoppingCart.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )),
+        frozenset(Subscription.objects.filter(user=user).values_list(
+            'author_id', flat=True
+        )),
+    )
+
+
+def get_viewer_state(user):
+    """
+    Id избранных рецептов, рецептов в корзине и авторов, на которых
+    подписан пользователь: два обращения к кэшу (версия и значение)
+    и три коротких запроса при промахе
+    """
+    if not user.is_authenticated:
+        return ANONYMOUS_STATE
+    namespace = viewer_namespace(user.pk)
+    version = reference_cache.get_version(namespace)
+    key = reference_cache.make_key(namespace, version)
+    state = reference_cache.get(key)
+    if state is None:
+        state = load_viewer_state(user, version)
+        reference_cache.set(key, state)
+    return state
+
+
+def apply_viewer_state(payload, state):
+    """
+    Копия общей выдачи рецепта с флагами зрителя
+    """
+    author = dict(payload['author'])
+    author['is_subscribed'] = author['id'] in state.following
+    data = dict(payload)
+    data['author'] = author
+    data['is_favorited'] = payload['id'] in state.favorites
+    data['is_in_shopping_cart'] = payload['id'] in state.cart
+    return data
+
+
+def payload_key(request, recipe):
+    version = int(recipe.modified.timestamp() * 10 ** 6)
+    return response_cache.make_key(
+        PAYLOAD_NAMESPACE, version, request.get_host(), recipe.pk
+    )
+
+
+def get_recipe_payloads(request, recipes, encode):
+    """
+    Общие для всех пользователей выдачи рецептов (нужны только pk
+    и modified) из кэша; недостающие строит encode(request, ids) одной
+    выборкой. Ключ содержит отметку изменения, поэтому устаревшие
+    выдачи просто перестают читаться
+    """
+    keys = {recipe.pk: payload_key(request, recipe) for recipe in recipes}
+    cached = response_cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    if missing:
+        fresh = {
+            keys[payload['id']]: payload
+            for payload in encode(request, missing)
+        }
+        response_cache.set_many(fresh)
+        cached.update(fresh)
+    return [cached[keys[recipe.pk]] for recipe in recipes
+            if keys[recipe.pk] in cached]
+
+
+def render_recipes(request, recipes, encode):
+    state = get_viewer_state(request.user)
+    return [
+        apply_viewer_state(payload, state)
+        for payload in get_recipe_payloads(request, recipes, encode)
+    ]
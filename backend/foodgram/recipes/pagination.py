@@ -1,5 +1,231 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def keyset_filter(queryset, pub_date, pk, reverse, pk_field='pk'):
+    """
+    Строки строго после позиции (pub_date, pk) в порядке убывания
+    ключа, при reverse - строго до неё в порядке возрастания
+    """
+    if reverse:
+        return queryset.filter(
+            Q(pub_date__gt=pub_date)
+            | Q(pub_date=pub_date, **{f'{pk_field}__gt': pk})
+        ).order_by('pub_date', pk_field)
+    return queryset.filter(
+        Q(pub_date__lt=pub_date)
+        | Q(pub_date=pub_date, **{f'{pk_field}__lt': pk})
+    ).order_by('-pub_date', f'-{pk_field}')
 
 
 class CustomPagesPaginator(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу (pub_date, id): без OFFSET и без COUNT(*),
+    время выдачи страницы не зависит от её номера
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def encode_cursor(self, obj, reverse):
+        position = f'{int(reverse)}|{obj.pub_date.isoformat()}|{obj.pk}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            reverse, pub_date, pk = urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            return bool(int(reverse)), parse_datetime(pub_date), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def fetch(self, queryset, position, reverse, count):
+        """
+        Первые count строк после позиции; position=None - с начала
+        """
+        if position is None:
+            queryset = queryset.order_by('-pub_date', '-pk')
+        else:
+            queryset = keyset_filter(queryset, *position, reverse)
+        return list(queryset[:count])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        position, reverse = None, False
+        if cursor:
+            reverse, pub_date, pk = self.decode_cursor(cursor)
+            if pub_date is None:
+                raise NotFound(self.invalid_cursor_message)
+            position = (pub_date, pk)
+        page = self.fetch(queryset, position, reverse, size + 1)
+        has_more = len(page) > size
+        page = page[:size]
+        if reverse:
+            page.reverse()
+        self.has_next = bool(page) and (has_more or reverse)
+        self.has_previous = bool(page) and bool(cursor) and (
+            has_more or not reverse
+        )
+        self.page = page
+        return page
+
+    def get_link(self, obj, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(obj, reverse)
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.get_link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.get_link(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(CustomPagesPaginator):
+    """
+    Постраничная пагинация с размером страницы ?limit= и
+    переключением на пагинацию по ключу при ?pagination=cursor или
+    переданном курсоре. Курсор построен по (pub_date, id), поэтому
+    при сортировке ?ordering=... остаётся постраничная пагинация
+    """
+    max_page_size = KeysetPagination.max_page_size
+    mode_query_param = 'pagination'
+    ordering_query_param = 'ordering'
+    keyset_class = KeysetPagination
+
+    def use_keyset(self, request):
+        if request.query_params.get(self.ordering_query_param):
+            return False
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.keyset_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(KeysetPagination):
+    """
+    Пагинация ленты подписок тем же курсором (pub_date, id)
+    """
+    def fetch(self, feed, position, reverse, count):
+        return feed.fetch(position, reverse, count)
+
+
+class RankedPagination(CustomPagesPaginator):
+    """
+    Страницы ранжированного списка [(id, данные)] поиска и подбора.
+    Без фильтров страница - срез списка. С фильтрами id проверяются
+    в БД кусками, растущими вдвое, пока не наберётся страница и ещё
+    одна запись; count тогда известен, только если список пройден
+    до конца, иначе null
+    """
+    max_page_size = KeysetPagination.max_page_size
+
+    def get_page_number(self, request):
+        try:
+            number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise NotFound(self.invalid_page_message)
+        return number
+
+    def paginate_ranked(self, ranked, request, allowed=None):
+        """
+        allowed(ids) -> множество id, прошедших фильтры; None - без
+        фильтров
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        self.number = self.get_page_number(request)
+        start = (self.number - 1) * size
+        end = start + size
+        if allowed is None:
+            found = ranked
+            self.count = len(ranked)
+        else:
+            found, position, chunk = [], 0, size * 2
+            while len(found) <= end and position < len(ranked):
+                part = ranked[position:position + chunk]
+                ids = allowed([pk for pk, _ in part])
+                found.extend(item for item in part if item[0] in ids)
+                position += chunk
+                chunk *= 2
+            self.count = len(found) if position >= len(ranked) else None
+        self.has_next = len(found) > end
+        page = found[start:end]
+        if not page and self.number > 1:
+            raise NotFound(self.invalid_page_message)
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.page_query_param,
+            self.number + 1
+        )
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.number - 1
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,156 @@
+import re
+
+from django.db import connection, transaction
+from django.http import QueryDict
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import Subscription
+
+from .filters import RecipeFilter
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem)
+from .services import shopping_list_totals
+
+PAGE_SIZE = 6
+
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+POSTGRESQL_SCAN_RE = re.compile(
+    r'(Seq Scan|Index Only Scan|Index Scan)(?: Backward)?'
+    r'(?: using \w+)? on (\w+)'
+)
+SEQUENTIAL_SCAN = 'Seq Scan'
+INDEX_CONDITION = 'Index Cond:'
+
+
+def filter_recipes(user, **params):
+    """
+    Страница списка рецептов через RecipeFilter, как в RecipeViewSet
+    """
+    query = QueryDict(mutable=True)
+    for name, value in params.items():
+        if isinstance(value, list):
+            query.setlist(name, value)
+        else:
+            query[name] = value
+    request = Request(APIRequestFactory().get('/api/recipes/', query))
+    request.user = user
+    queryset = Recipe.objects.only('pk', 'pub_date', 'modified').order_by(
+        '-pub_date', '-id'
+    )
+    return RecipeFilter(query, queryset=queryset, request=request).qs[
+        :PAGE_SIZE
+    ]
+
+
+def get_hot_queries(dataset):
+    """
+    Запросы горячих путей API на данных бенчмарка: имя -> queryset
+    """
+    user, recipe = dataset.user, dataset.recipe
+    return {
+        'recipes-list': filter_recipes(user),
+        'recipes-author': filter_recipes(user, author=recipe.author_id),
+        'recipes-favorited': filter_recipes(user, is_favorited='1'),
+        'recipes-shopping-cart': filter_recipes(
+            user, is_in_shopping_cart='1'
+        ),
+        'recipes-tags': filter_recipes(user, tags=[dataset.tag.slug]),
+        'recipes-popular': filter_recipes(user, ordering='popular'),
+        'recipes-trending': filter_recipes(user, ordering='trending'),
+        'recipe-ingredients': RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredient_id', 'amount'),
+        'viewer-favorites': Favorite.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True),
+        'viewer-cart': ShoppingCart.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True),
+        'viewer-following': Subscription.objects.filter(
+            user=user
+        ).values_list('author_id', flat=True),
+        'subscriptions-page': Subscription.objects.filter(
+            user=user
+        ).select_related('author').order_by('-id')[:PAGE_SIZE],
+        'subscriptions-recipes': Recipe.objects.filter(
+            author__in=[recipe.author_id]
+        ).only(
+            'id', 'name', 'image', 'thumbnail', 'cooking_time', 'author_id'
+        ).order_by('author', '-pub_date', '-id'),
+        'feed-followers': Subscription.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True),
+        'cart-users': ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True),
+        'shopping-list-download': ShoppingListItem.objects.filter(
+            user=user
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name'),
+        'shopping-list-totals': shopping_list_totals([user.pk]),
+    }
+
+
+def explain(queryset):
+    """
+    План запроса строками. На PostgreSQL последовательное чтение
+    запрещается на время EXPLAIN: на маленьком наборе данных
+    планировщик выбирает его и при подходящем индексе, а так Seq Scan
+    остаётся только там, где индекса нет
+    """
+    sql, params = queryset.query.sql_with_params()
+    prefix = connection.ops.explain_query_prefix()
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'{prefix} {sql}', params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def find_sequential_scans(plan, vendor, tables, limited=False):
+    """
+    Таблицы, которые план читает целиком. В SQLite это строка SCAN,
+    в PostgreSQL - узел Seq Scan или Index Scan без Index Cond.
+    Обход индекса в порядке сортировки без условия допустим только
+    под LIMIT: страница дочитывается на первых строках. Подзапросы
+    и CTE отбрасываются по списку таблиц
+    """
+    if vendor == 'sqlite':
+        scans = []
+        for line in plan:
+            match = SQLITE_SCAN_RE.match(line.strip())
+            if match is None or (limited and ' USING ' in line):
+                continue
+            scans.append(match.group(1))
+    else:
+        nodes = []
+        for line in plan:
+            match = POSTGRESQL_SCAN_RE.search(line)
+            if match is not None:
+                nodes.append([match.group(1), match.group(2), False])
+            elif '->' in line:
+                nodes.append(None)
+            elif nodes and nodes[-1] and INDEX_CONDITION in line:
+                nodes[-1][2] = True
+        scans = [
+            table for kind, table, has_condition in filter(None, nodes)
+            if kind == SEQUENTIAL_SCAN or not (has_condition or limited)
+        ]
+    return [table for table in scans if table in tables]
+
+
+def check_plans(dataset):
+    """
+    План и найденные последовательные чтения для каждого запроса:
+    {name: (plan, scans)}
+    """
+    tables = set(connection.introspection.table_names())
+    results = {}
+    for name, queryset in get_hot_queries(dataset).items():
+        plan = explain(queryset)
+        results[name] = (plan, find_sequential_scans(
+            plan, connection.vendor, tables,
+            limited=queryset.query.high_mark is not None
+        ))
+    return results
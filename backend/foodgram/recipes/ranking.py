@@ -0,0 +1,111 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from .models import Favorite, Recipe, ShoppingCart
+
+FAVORITE = 'favorite'
+CART = 'cart'
+EVENTS = ((FAVORITE, Favorite), (CART, ShoppingCart))
+ORDERINGS = {
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+
+def current_epoch(now=None):
+    """
+    RECIPE_RANKING['epoch'], сдвинутая вперёд на целое число периодов
+    по epoch_half_lives периодов полураспада: показатель степени
+    в decay_factor не превышает двух периодов и не переполняет float.
+    Оценки, накопленные до сдвига, переводит на новую эпоху первый
+    полный update_recipe_scores после него
+    """
+    config = settings.RECIPE_RANKING
+    period = config['half_life'] * config['epoch_half_lives']
+    elapsed = (now or timezone.now()) - config['epoch']
+    return config['epoch'] + period * max(elapsed // period, 0)
+
+
+def decay_factor(moment, epoch=None):
+    """
+    2 ** ((moment - epoch) / half_life). Вклад события растёт вместе
+    с его временем, поэтому относительный вес старых событий падает
+    вдвое за каждый период полураспада без пересчёта уже накопленных
+    оценок
+    """
+    age = (moment - (epoch or current_epoch())).total_seconds()
+    return 2 ** (
+        age / settings.RECIPE_RANKING['half_life'].total_seconds()
+    )
+
+
+def score_changes(event, created, sign):
+    """
+    Выражения UPDATE, которые прибавляют (sign=1) или вычитают
+    (sign=-1) вклад событий в популярность и трендовую оценку
+    рецептов: created - {id рецепта: время события}. Ошибки округления
+    после вычитаний убирает периодический update_recipe_scores
+    """
+    weight = settings.RECIPE_RANKING['weights'][event] * sign
+    epoch = current_epoch()
+    trending = Case(
+        *(When(pk=recipe_id,
+               then=Value(weight * decay_factor(moment, epoch)))
+          for recipe_id, moment in created.items()),
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    return {
+        'popularity': F('popularity') + weight,
+        'trending_score': F('trending_score') + trending,
+    }
+
+
+def compute_scores(recipe_ids=None):
+    """
+    Оценки, посчитанные заново по событиям избранного и корзины:
+    {id рецепта: (популярность, трендовая оценка)}
+    """
+    weights = settings.RECIPE_RANKING['weights']
+    epoch = current_epoch()
+    scores = defaultdict(lambda: [0.0, 0.0])
+    for event, model in EVENTS:
+        rows = model.objects.all()
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        for recipe_id, created in rows.values_list(
+                'recipe_id', 'created').iterator():
+            score = scores[recipe_id]
+            score[0] += weights[event]
+            score[1] += weights[event] * decay_factor(created, epoch)
+    return scores
+
+
+@transaction.atomic
+def update_recipe_scores(recipe_ids=None, batch_size=1000):
+    """
+    Пересчитывает оценки и записывает только изменившиеся строки.
+    После автоматического сдвига эпохи пересчёт нужен для всех
+    рецептов: его выполняет периодический запуск без recipe_ids
+    """
+    scores = compute_scores(recipe_ids)
+    recipes = Recipe.objects.only('pk', 'popularity', 'trending_score')
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    changed = []
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        popularity, trending_score = scores.get(recipe.pk, (0.0, 0.0))
+        if (recipe.popularity, recipe.trending_score) == (
+                popularity, trending_score):
+            continue
+        recipe.popularity = popularity
+        recipe.trending_score = trending_score
+        changed.append(recipe)
+    Recipe.objects.bulk_update(
+        changed, ['popularity', 'trending_score'], batch_size=batch_size
+    )
+    return len(changed)
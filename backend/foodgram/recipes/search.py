@@ -0,0 +1,280 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.html import escape
+
+from .cache import reference_cache
+from .models import Recipe, RecipeSearchDocument
+
+SEARCH_NAMESPACE = 'search'
+WORD_RE = re.compile(r'\w+')
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ов',
+    'ев', 'ом', 'ем', 'ах', 'ях', 'ам', 'ям', 'ию', 'ия', 'ью',
+    'а', 'я', 'ы', 'и', 'е', 'о', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+MIN_STEM_LENGTH = 3
+FIELD_WEIGHTS = (('title', 4.0), ('tags', 2.0), ('ingredients', 2.0),
+                 ('body', 1.0))
+SNIPPET_LENGTH = 160
+# Документ мог быть сохранён раньше, а зафиксирован позже уже
+# прочитанных, поэтому изменённые документы дочитываются с запасом
+SYNC_OVERLAP = timedelta(minutes=1)
+MAX_CHANGE_LOG = 1000
+POSTGRES_SEARCH = '''
+    SELECT recipe_id, ts_rank(search_vector, query) AS rank
+    FROM recipes_recipesearchdocument, plainto_tsquery('russian', %s) query
+    WHERE search_vector @@ query
+    ORDER BY rank DESC, recipe_id DESC
+    LIMIT %s
+'''
+
+
+def stem(word):
+    """
+    Грубое отсечение окончаний: запрос «помидоры» находит «помидор»
+    """
+    word = word.casefold().replace('ё', 'е')
+    for ending in ENDINGS:
+        if (word.endswith(ending)
+                and len(word) - len(ending) >= MIN_STEM_LENGTH):
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def build_search_document(recipe):
+    return RecipeSearchDocument(
+        recipe=recipe,
+        title=recipe.name,
+        tags=' '.join(tag.name for tag in recipe.tags.all()),
+        ingredients=' '.join(
+            item.ingredient.name
+            for item in recipe.ingredients.select_related('ingredient')
+        ),
+        body=recipe.text,
+    )
+
+
+def update_search_document(recipe, created=False):
+    """
+    Пересобирает поисковый документ рецепта. Вызывается при создании
+    и изменении рецепта внутри его транзакции
+    """
+    build_search_document(recipe).save(force_insert=created)
+
+
+def rebuild_search_documents(batch_size=500):
+    RecipeSearchDocument.objects.all().delete()
+    recipes = Recipe.objects.prefetch_related(
+        'tags', 'ingredients__ingredient'
+    ).order_by('pk')
+    documents = []
+    for recipe in recipes.iterator(chunk_size=batch_size):
+        documents.append(build_search_document(recipe))
+        if len(documents) >= batch_size:
+            RecipeSearchDocument.objects.bulk_create(documents)
+            documents = []
+    RecipeSearchDocument.objects.bulk_create(documents)
+    invalidate_search_index()
+
+
+def deleted_key(version):
+    return f'{SEARCH_NAMESPACE}:deleted:{version}'
+
+
+def publish_search_changes(deleted_ids=()):
+    """
+    После фиксации транзакции увеличивает версию индекса и записывает,
+    какие документы удалены: процессы уберут их и дочитают изменённые
+    по updated, не сверяя все id рецептов
+    """
+    deleted_ids = list(deleted_ids)
+
+    def publish():
+        version = reference_cache.bump_version(SEARCH_NAMESPACE)
+        reference_cache.shared.set(
+            deleted_key(version), deleted_ids, reference_cache.timeout
+        )
+
+    transaction.on_commit(publish)
+
+
+def invalidate_search_index():
+    """
+    Версия без журнала удалений: процессы перестроят индекс целиком
+    """
+    transaction.on_commit(
+        lambda: reference_cache.bump_version(SEARCH_NAMESPACE)
+    )
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс поисковых документов в памяти процесса.
+    При смене версии в общем кэше дочитывает изменённые документы
+    и удаляет записанные в журнал, не перестраиваясь целиком
+    """
+    def __init__(self):
+        self.version = None
+        self.synced = None
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self.terms = []
+        self._lock = threading.Lock()
+
+    def index_document(self, document):
+        self.remove_document(document.pk)
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(getattr(document, field)):
+                weights[term] += weight
+        for term, weight in weights.items():
+            self.postings[term][document.pk] = weight
+        self.documents[document.pk] = tuple(weights)
+
+    def remove_document(self, recipe_id):
+        for term in self.documents.pop(recipe_id, ()):
+            postings = self.postings[term]
+            postings.pop(recipe_id, None)
+            if not postings:
+                del self.postings[term]
+
+    def deleted_since(self, version):
+        if self.synced is None or not (
+                0 < version - self.version <= MAX_CHANGE_LOG):
+            return None
+        keys = [
+            deleted_key(number)
+            for number in range(self.version + 1, version + 1)
+        ]
+        deleted = reference_cache.shared.get_many(keys)
+        if len(deleted) != len(keys):
+            return None
+        return set().union(*deleted.values())
+
+    def refresh(self):
+        version = reference_cache.get_version(SEARCH_NAMESPACE)
+        if version == self.version:
+            return
+        with self._lock:
+            if version == self.version:
+                return
+            deleted = self.deleted_since(version)
+            documents = RecipeSearchDocument.objects.all()
+            if deleted is None:
+                self.postings = defaultdict(dict)
+                self.documents = {}
+                self.synced = None
+            else:
+                for recipe_id in deleted:
+                    self.remove_document(recipe_id)
+                documents = documents.filter(
+                    updated__gte=self.synced - SYNC_OVERLAP
+                )
+            for document in documents.iterator():
+                self.index_document(document)
+                if self.synced is None or document.updated > self.synced:
+                    self.synced = document.updated
+            self.terms = sorted(self.postings)
+            self.version = version
+
+    def matching_terms(self, token):
+        start = bisect_left(self.terms, token)
+        end = start
+        while end < len(self.terms) and self.terms[end].startswith(token):
+            end += 1
+        return self.terms[start:end]
+
+    def search(self, query, limit):
+        """
+        Документы, содержащие все слова запроса (по началу основы),
+        с рангом TF-IDF с учётом веса поля
+        """
+        self.refresh()
+        total = len(self.documents) or 1
+        scores = None
+        for token in set(tokenize(query)):
+            matches = defaultdict(float)
+            for term in self.matching_terms(token):
+                postings = self.postings.get(term, {})
+                idf = math.log(1 + total / len(postings))
+                for recipe_id, weight in postings.items():
+                    matches[recipe_id] += weight * idf
+            if scores is None:
+                scores = matches
+            else:
+                scores = {
+                    recipe_id: score + matches[recipe_id]
+                    for recipe_id, score in scores.items()
+                    if recipe_id in matches
+                }
+        ranked = sorted(
+            (scores or {}).items(),
+            key=lambda item: (item[1], item[0]),
+            reverse=True
+        )
+        return ranked[:limit]
+
+
+class PostgresSearchBackend:
+    """
+    Поиск по search_vector с GIN-индексом и ts_rank
+    """
+    def search(self, query, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_SEARCH, [query, limit])
+            return cursor.fetchall()
+
+
+inverted_index = InvertedIndex()
+postgres_search = PostgresSearchBackend()
+
+
+def search_recipes(query):
+    """
+    Список (id рецепта, ранг) по убыванию ранга
+    """
+    limit = settings.RECIPE_SEARCH_MAX_RESULTS
+    if connection.vendor == 'postgresql':
+        return postgres_search.search(query, limit)
+    return inverted_index.search(query, limit)
+
+
+def highlight(text, query, snippet=False):
+    """
+    Оборачивает найденные слова в <mark>; при snippet возвращает
+    фрагмент текста вокруг первого совпадения
+    """
+    tokens = set(tokenize(query))
+    text = text or ''
+    matches = [
+        match for match in WORD_RE.finditer(text)
+        if any(stem(match.group()).startswith(token) for token in tokens)
+    ]
+    start, end = 0, len(text)
+    if snippet and len(text) > SNIPPET_LENGTH:
+        first = matches[0].start() if matches else 0
+        start = max(first - SNIPPET_LENGTH // 4, 0)
+        end = start + SNIPPET_LENGTH
+    parts, position = [], start
+    for match in matches:
+        if match.start() < start or match.end() > end:
+            continue
+        parts.append(escape(text[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(escape(text[position:end]))
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if end < len(text) else ''
+    return prefix + ''.join(parts) + suffix
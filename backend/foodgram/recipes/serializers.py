@@ -1,11 +1,23 @@
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
-from users.models import Subscription
+from users.models import Subscription, User
 from users.serializers import CustomUserSerializer
 
+from .conditional import invalidate_recipe_lists
+from .feed import fan_out_recipe
+from .images import reset_image_variants, schedule_image_processing
+from .matching import mark_recipe_changed
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .search import highlight, update_search_document
+from .services import change_counter, update_shopping_lists
+from .similarity import schedule_similar_update
+
+SEARCH_FIELDS = {'name', 'text'}
+# Верхняя граница PositiveSmallIntegerField количества в составе
+MAX_INGREDIENT_AMOUNT = 32767
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -52,14 +64,38 @@ class RecipeViewSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
+    thumbnail = serializers.SerializerMethodField()
+    preview = serializers.SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'name', 'image', 'thumbnail', 'preview',
+            'image_width', 'image_height', 'text', 'cooking_time',
+            'favorites_count'
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
+    def get_image_url(self, image):
+        request = self.context.get('request')
+        if request is None:
+            return image.url
+        return request.build_absolute_uri(image.url)
+
+    def get_thumbnail(self, obj):
+        return self.get_image_url(obj.thumbnail or obj.image)
+
+    def get_preview(self, obj):
+        return self.get_image_url(obj.preview or obj.image)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         user = request.user
         return (
@@ -71,6 +107,8 @@ class RecipeViewSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         user = request.user
         return (
@@ -82,6 +120,49 @@ class RecipeViewSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeSearchSerializer(RecipeViewSerializer):
+    """
+    Сериализатор результатов поиска с рангом и подсветкой
+    """
+    search_rank = serializers.FloatField(read_only=True)
+    highlight = serializers.SerializerMethodField()
+
+    class Meta(RecipeViewSerializer.Meta):
+        fields = RecipeViewSerializer.Meta.fields + (
+            'search_rank', 'highlight'
+        )
+
+    def get_highlight(self, obj):
+        query = self.context.get('query', '')
+        return {
+            'name': highlight(obj.name, query),
+            'text': highlight(obj.text, query, snippet=True),
+        }
+
+
+class RecipeMatchSerializer(RecipeViewSerializer):
+    """
+    Сериализатор результатов подбора по ингредиентам
+    """
+    coverage = serializers.FloatField(read_only=True)
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeViewSerializer.Meta):
+        fields = RecipeViewSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients'
+        )
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context.get('pantry', set())
+        return IngredientsInRecipeSerializer(
+            [
+                item for item in obj.ingredients.all()
+                if item.ingredient_id not in pantry
+            ],
+            many=True
+        ).data
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для создания рецептов"""
     tags = TagSerializer(many=True, read_only=True)
@@ -104,53 +185,160 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def validate(self, attrs):
+        if not self.partial or 'ingredients' in self.initial_data:
+            attrs['ingredient_amounts'] = self.validate_ingredient_amounts(
+                self.initial_data.get('ingredients')
+            )
+        if not self.partial or 'tags' in self.initial_data:
+            attrs['tag_ids'] = self.validate_tag_ids(
+                self.initial_data.get('tags')
+            )
+        return attrs
+
+    def validate_ingredient_amounts(self, ingredients):
+        """
+        Проверяет ингредиенты одним запросом к БД и возвращает
+        {ingredient_id: amount}
+        """
+        if not isinstance(ingredients, list) or not ingredients:
+            raise serializers.ValidationError(
+                {'ingredients': 'Нужен хотя бы один ингредиент'}
+            )
+        amounts = {}
+        for ingredient in ingredients:
+            try:
+                ingredient_id = int(ingredient['id'])
+                amount = int(ingredient['amount'])
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError(
+                    {'ingredients': 'Ингредиент задаётся полями id и amount'}
+                )
+            if amount < 1:
+                raise serializers.ValidationError(
+                    {'ingredients': 'Должен быть минимум 1 ингридиент!'}
+                )
+            if amount > MAX_INGREDIENT_AMOUNT:
+                raise serializers.ValidationError({
+                    'ingredients': 'Количество ингредиента не больше '
+                    f'{MAX_INGREDIENT_AMOUNT}'
+                })
+            if ingredient_id in amounts:
+                raise serializers.ValidationError(
+                    {'ingredients': f'Ингредиент {ingredient_id} повторяется'}
+                )
+            amounts[ingredient_id] = amount
+        missing = set(amounts) - set(Ingredient.objects.in_bulk(amounts))
+        if missing:
+            raise serializers.ValidationError({
+                'ingredients': 'Нет ингредиентов с id: '
+                + ', '.join(map(str, sorted(missing)))
+            })
+        return amounts
+
+    def validate_tag_ids(self, tags):
+        if not isinstance(tags, list) or not tags:
+            raise serializers.ValidationError(
+                {'tags': 'Нужен хотя бы один тег'}
+            )
+        try:
+            tag_ids = {int(tag) for tag in tags}
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                {'tags': 'Теги задаются списком id'}
+            )
+        missing = tag_ids - set(Tag.objects.in_bulk(tag_ids))
+        if missing:
+            raise serializers.ValidationError({
+                'tags': 'Нет тегов с id: '
+                + ', '.join(map(str, sorted(missing)))
+            })
+        return tag_ids
+
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context.get('request')
-        ingredients = self.initial_data.get('ingredients')
-        tags = self.initial_data.get('tags')
+        amounts = validated_data.pop('ingredient_amounts')
+        tags = validated_data.pop('tag_ids')
         recipe = Recipe.objects.create(
             author=request.user,
             **validated_data
         )
+        change_counter(User, request.user.pk, 'recipes_count', 1)
         recipe.tags.set(tags)
-        ingredient_objects = []
-        for ingredient in ingredients:
-            amount = ingredient.get('amount')
-            instance = get_object_or_404(
-                Ingredient,
-                pk=ingredient.get('id')
-            )
-            ingredient_objects.append(
-                RecipeIngredient(
-                    recipe=recipe,
-                    ingredient=instance,
-                    amount=amount
-                )
+        schedule_image_processing(recipe)
+        fan_out_recipe(recipe)
+        invalidate_recipe_lists()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
             )
-        RecipeIngredient.objects.bulk_create(ingredient_objects)
+            for ingredient_id, amount in amounts.items()
+        )
+        update_search_document(recipe, created=True)
+        mark_recipe_changed(recipe.pk)
+        schedule_similar_update(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = self.initial_data.get('ingredients')
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time',
-            instance.cooking_time
-        )
-        instance.tags.clear()
-        tags = self.initial_data.get('tags')
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).all().delete()
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
-                recipe=instance,
-                ingredient_id=ingredient.get('id'),
-                amount=ingredient.get('amount')
-            )
+        amounts = validated_data.pop('ingredient_amounts', None)
+        tags = validated_data.pop('tag_ids', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if 'image' in validated_data:
+            reset_image_variants(instance)
+            schedule_image_processing(instance)
+        instance.save()
+        invalidate_recipe_lists()
+        if tags is not None:
+            instance.tags.set(tags)
+        if amounts is not None:
+            self.update_ingredients(instance, amounts)
+            mark_recipe_changed(instance.pk)
+        if (tags is not None or amounts is not None
+                or SEARCH_FIELDS & set(validated_data)):
+            update_search_document(instance)
+        if tags is not None or amounts is not None:
+            schedule_similar_update(instance)
         return instance
 
+    def update_ingredients(self, recipe, amounts):
+        """
+        Применяет к составу рецепта только разницу со старым составом
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: item.amount
+            for ingredient_id, item in existing.items()
+        }
+        to_update = []
+        for ingredient_id, item in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                item.amount = amount
+                to_update.append(item)
+        RecipeIngredient.objects.filter(
+            recipe=recipe,
+            ingredient_id__in=set(existing) - set(amounts)
+        ).delete()
+        RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
+        )
+        update_shopping_lists(recipe, old_amounts, amounts)
+
 
 class FavoriteRecipeSerializer(serializers.ModelSerializer):
     """
@@ -164,6 +352,31 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class SimilarRecipeSerializer(FavoriteRecipeSerializer):
+    """
+    Сериализатор похожих рецептов со степенью сходства
+    """
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(FavoriteRecipeSerializer.Meta):
+        fields = FavoriteRecipeSerializer.Meta.fields + ('score',)
+
+
+class SubscriptionRecipeSerializer(FavoriteRecipeSerializer):
+    """
+    Сериализатор рецептов автора в подписках: карточки показывают
+    уменьшенный вариант картинки
+    """
+    thumbnail = serializers.SerializerMethodField()
+
+    class Meta(FavoriteRecipeSerializer.Meta):
+        fields = FavoriteRecipeSerializer.Meta.fields + ('thumbnail',)
+
+    def get_thumbnail(self, obj):
+        image = obj.thumbnail or obj.image
+        return image.url if image else None
+
+
 class FavoriteSerializer(serializers.ModelSerializer):
     """
     Сериализатор для добавления в избранное
@@ -178,6 +391,52 @@ class FavoriteSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class RecipeListChangeSerializer(serializers.Serializer):
+    """
+    Рецепты для массового изменения избранного или корзины: список id
+    или автор, все рецепты которого добавляются или убираются
+    """
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.RECIPE_BULK_MAX_IDS
+    )
+    author = serializers.PrimaryKeyRelatedField(
+        queryset=User.objects.all(),
+        required=False
+    )
+
+    def validate(self, data):
+        if ('recipes' in data) == ('author' in data):
+            raise serializers.ValidationError(
+                'Нужно указать либо recipes, либо author'
+            )
+        return data
+
+    def get_recipe_ids(self):
+        """
+        id рецептов без повторов в порядке запроса
+        """
+        if 'author' in self.validated_data:
+            return list(Recipe.objects.filter(
+                author=self.validated_data['author']
+            ).order_by('pk').values_list('pk', flat=True))
+        return list(dict.fromkeys(self.validated_data['recipes']))
+
+
+def get_recipes_limit(request):
+    """
+    Значение recipes_limit из запроса или None, если оно не задано
+    или некорректно
+    """
+    try:
+        limit = int(request.query_params["recipes_limit"])
+    except (AttributeError, KeyError, ValueError):
+        return None
+    return max(limit, 0)
+
+
 class SubscribeSerializer(serializers.ModelSerializer):
     """
     Сериализатор список подписок
@@ -188,6 +447,9 @@ class SubscribeSerializer(serializers.ModelSerializer):
     username = serializers.ReadOnlyField(source="author.username")
     first_name = serializers.ReadOnlyField(source="author.first_name")
     last_name = serializers.ReadOnlyField(source="author.last_name")
+    followers_count = serializers.ReadOnlyField(
+        source="author.followers_count"
+    )
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
@@ -204,20 +466,22 @@ class SubscribeSerializer(serializers.ModelSerializer):
             "is_subscribed",
             "recipes",
             "recipes_count",
+            "followers_count",
         )
 
     def get_is_subscribed(self, obj):
-        return Subscription.objects.filter(
-            user=obj.user, author=obj.author).exists()
+        return True
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        recipes = Recipe.objects.filter(author=obj.author)
-        limit = request.GET.get("recipes_limit")
-        if limit is not None:
-            recipes = recipes[: int(limit)]
-        return FavoriteRecipeSerializer(recipes, many=True).data
+        recipes = self.context.get("recipes")
+        if recipes is None:
+            recipes = Recipe.objects.latest_by_author(
+                [obj.author_id],
+                get_recipes_limit(self.context.get("request"))
+            )
+        return SubscriptionRecipeSerializer(
+            recipes.get(obj.author_id, []), many=True
+        ).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(
-            author=obj.author).count()
+        return obj.author.recipes_count
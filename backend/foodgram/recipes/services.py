@@ -0,0 +1,217 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from users.models import Subscription, User
+
+from .models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                     ShoppingListItem)
+
+# Денормализованные счётчики: (модель, поле, модель связи, поле связи).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def get_recipe_amounts(recipe):
+    """
+    Количество каждого ингредиента в рецепте: {ingredient_id: amount}
+    """
+    return dict(
+        RecipeIngredient.objects.filter(recipe=recipe).values_list(
+            'ingredient_id', 'amount'
+        )
+    )
+
+
+def diff_amounts(old, new):
+    """
+    Разница между двумя наборами количеств ингредиентов
+    """
+    delta = {
+        ingredient_id: new.get(ingredient_id, 0) - old.get(ingredient_id, 0)
+        for ingredient_id in set(old) | set(new)
+    }
+    return {
+        ingredient_id: change
+        for ingredient_id, change in delta.items() if change
+    }
+
+
+@transaction.atomic
+def apply_shopping_list_delta(user_ids, delta):
+    """
+    Прибавляет delta ({ingredient_id: изменение}) к спискам покупок
+    пользователей. Строки пользователей блокируются, чтобы
+    параллельные изменения одного списка не теряли обновления.
+    """
+    user_ids = sorted(set(user_ids))
+    if not user_ids or not delta:
+        return
+    list(User.objects.select_for_update().filter(
+        pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=delta
+        )
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, change in delta.items():
+            item = items.get((user_id, ingredient_id))
+            if item is None:
+                if change > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=change
+                    ))
+                continue
+            item.amount += change
+            if item.amount > 0:
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ['amount'])
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+def change_shopping_list(user, recipe_ids, sign):
+    """
+    Добавляет (sign=1) или убирает (sign=-1) из списка покупок
+    ингредиенты рецептов, суммированные одним запросом
+    """
+    amounts = RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id').annotate(total=Sum('amount')).order_by()
+    apply_shopping_list_delta([user.pk], {
+        ingredient_id: sign * amount for ingredient_id, amount in amounts
+    })
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts):
+    """
+    Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых рецепт лежит в корзине
+    """
+    delta = diff_amounts(old_amounts, new_amounts)
+    if not delta:
+        return
+    apply_shopping_list_delta(
+        ShoppingCart.objects.filter(recipe=recipe).values_list(
+            'user_id', flat=True
+        ),
+        delta
+    )
+
+
+def remove_recipe_from_shopping_lists(recipe):
+    update_shopping_lists(recipe, get_recipe_amounts(recipe), {})
+
+
+def shopping_list_totals(user_ids=None):
+    """
+    Суммы ингредиентов по корзинам: (user_id, ingredient_id, amount)
+    """
+    if user_ids is None:
+        totals = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user__isnull=False
+        )
+    else:
+        totals = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user__in=user_ids
+        )
+    return totals.values_list(
+        'recipe__shopping_cart__user', 'ingredient'
+    ).annotate(total=Sum('amount')).order_by()
+
+
+def aggregate_shopping_lists(user_ids=None):
+    """
+    Списки покупок, посчитанные заново по корзинам:
+    {user_id: {ingredient_id: amount}}
+    """
+    result = defaultdict(dict)
+    for user_id, ingredient_id, amount in shopping_list_totals(
+            user_ids).iterator():
+        result[user_id][ingredient_id] = amount
+    return result
+
+
+def materialized_shopping_lists(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    result = defaultdict(dict)
+    for user_id, ingredient_id, amount in items.values_list(
+            'user_id', 'ingredient_id', 'amount').iterator():
+        result[user_id][ingredient_id] = amount
+    return result
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids=None):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            user_id=user_id,
+            ingredient_id=ingredient_id,
+            amount=amount
+        )
+        for user_id, amounts in aggregate_shopping_lists(user_ids).items()
+        for ingredient_id, amount in amounts.items()
+    )
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарно меняет счётчик через F(), не опуская его ниже нуля
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field
+        ).annotate(total=Count('pk')).values('total')[:1]
+    ), 0)
+
+
+def find_counter_mismatches():
+    """
+    Число строк с расхождением для каждого счётчика
+    """
+    return {
+        f'{model.__name__}.{field}': model.objects.annotate(
+            actual=count_subquery(related_model, related_field)
+        ).exclude(**{field: F('actual')}).count()
+        for model, field, related_model, related_field in COUNTERS
+    }
+
+
+@transaction.atomic
+def reconcile_counters(recipe_ids=None, user_ids=None):
+    """
+    Пересчитывает счётчики по связанным строкам: все или, если
+    переданы id, только у рецептов recipe_ids и пользователей user_ids
+    """
+    scoped = recipe_ids is not None or user_ids is not None
+    scope = {Recipe: recipe_ids or (), User: user_ids or ()}
+    for model, field, related_model, related_field in COUNTERS:
+        rows = model.objects.all()
+        if scoped:
+            rows = rows.filter(pk__in=scope[model])
+        rows.update(**{field: count_subquery(related_model, related_field)})
@@ -0,0 +1,95 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from users.models import Subscription, User
+
+from .cache import INGREDIENTS_NAMESPACE, TAGS_NAMESPACE, reference_cache
+from .conditional import invalidate_recipe_lists, touch_recipes
+from .feed import remove_recipe_from_feeds
+from .lists import resync_after_commit
+from .matching import mark_recipe_changed
+from .models import (Favorite, Ingredient, Recipe, RecipeSearchDocument,
+                     ShoppingCart, Tag)
+from .search import publish_search_changes
+from .services import change_counter, remove_recipe_from_shopping_lists
+
+AUTHOR_PRIVATE_FIELDS = {'last_login', 'password'}
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(**kwargs):
+    reference_cache.bump_version(TAGS_NAMESPACE)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    reference_cache.bump_version(INGREDIENTS_NAMESPACE)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tag_recipes(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(pre_delete, sender=Ingredient)
+def touch_ingredient_recipes(instance, **kwargs):
+    touch_recipes(Recipe.objects.filter(ingredients__ingredient=instance))
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    """
+    Данные автора входят в выдачу его рецептов; вход в систему
+    и смена пароля её не меняют
+    """
+    if created or (
+            update_fields and set(update_fields) <= AUTHOR_PRIVATE_FIELDS):
+        return
+    touch_recipes(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=RecipeSearchDocument)
+def invalidate_search(**kwargs):
+    publish_search_changes()
+
+
+@receiver(post_delete, sender=RecipeSearchDocument)
+def forget_search_document(instance, **kwargs):
+    publish_search_changes([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def detach_recipe(instance, **kwargs):
+    """
+    Убирает рецепт из списков покупок и лент при любом удалении:
+    через API, в админке и каскадом вместе с автором
+    """
+    remove_recipe_from_shopping_lists(instance)
+    remove_recipe_from_feeds(instance.pk)
+    invalidate_recipe_lists()
+    mark_recipe_changed(instance.pk)
+    change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(pre_delete, sender=User)
+def resync_user_lists(instance, **kwargs):
+    """
+    Избранное, корзина и подписки пользователя удаляются каскадом
+    без счётчиков: после фиксации они пересчитываются у рецептов
+    и авторов, которых это касается
+    """
+    recipe_ids = set(Favorite.objects.filter(user=instance).values_list(
+        'recipe_id', flat=True
+    ))
+    recipe_ids.update(ShoppingCart.objects.filter(
+        user=instance
+    ).values_list('recipe_id', flat=True))
+    resync_after_commit(
+        recipe_ids=recipe_ids,
+        author_ids=Subscription.objects.filter(
+            user=instance
+        ).values_list('author_id', flat=True),
+    )
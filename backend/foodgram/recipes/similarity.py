@@ -0,0 +1,280 @@
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from . import tasks
+from .cache import reference_cache
+from .models import Favorite, Recipe, RecipeIngredient, SimilarRecipe
+
+SIMILAR_NAMESPACE = 'similar'
+INGREDIENT = 'i'
+TAG = 't'
+# В небольших каталогах частые признаки не отбрасываются
+MIN_PRUNED_FREQUENCY = 100
+
+
+def load_terms(recipe_ids=None):
+    """
+    Признаки рецептов: {id рецепта: {(вид, id): 1}} по ингредиентам
+    и тегам
+    """
+    terms = defaultdict(dict)
+    ingredients = RecipeIngredient.objects.all()
+    tags = Recipe.tags.through.objects.all()
+    if recipe_ids is not None:
+        ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+        tags = tags.filter(recipe_id__in=recipe_ids)
+    for recipe_id, ingredient_id in ingredients.values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        terms[recipe_id][(INGREDIENT, ingredient_id)] = 1
+    for recipe_id, tag_id in tags.values_list(
+            'recipe_id', 'tag_id').iterator():
+        terms[recipe_id][(TAG, tag_id)] = 1
+    return terms
+
+
+def load_document_frequency():
+    frequency = {
+        (INGREDIENT, row['ingredient']): row['total']
+        for row in RecipeIngredient.objects.values('ingredient').annotate(
+            total=Count('recipe', distinct=True)
+        ).order_by()
+    }
+    frequency.update(
+        ((TAG, row['tag']), row['total'])
+        for row in Recipe.tags.through.objects.values('tag').annotate(
+            total=Count('recipe')
+        ).order_by()
+    )
+    return frequency
+
+
+def load_fans(recipe_ids=None):
+    favorites = Favorite.objects.all()
+    if recipe_ids is not None:
+        favorites = favorites.filter(recipe_id__in=recipe_ids)
+    fans = defaultdict(set)
+    for recipe_id, user_id in favorites.values_list(
+            'recipe_id', 'user_id').iterator():
+        fans[recipe_id].add(user_id)
+    return fans
+
+
+class SimilarityModel:
+    """
+    Разреженные TF-IDF векторы рецептов (ингредиенты и теги с меньшим
+    весом) и косинусная близость через обратные списки признаков.
+    Признаки, встречающиеся больше чем в max_df доле рецептов (соль,
+    вода), в обратные списки не попадают. Близость по избранному -
+    косинус множеств пользователей, добавивших рецепты в избранное
+    """
+    def __init__(self, terms, fans=None, frequency=None, total=None):
+        config = settings.RECIPE_SIMILAR
+        self.total = total or len(terms) or 1
+        if frequency is None:
+            frequency = defaultdict(int)
+            for features in terms.values():
+                for term in features:
+                    frequency[term] += 1
+        self.favorite_weight = config['favorite_weight']
+        max_frequency = max(
+            config['max_df'] * self.total, MIN_PRUNED_FREQUENCY
+        )
+        self.vectors = {}
+        self.norms = {}
+        self.postings = defaultdict(list)
+        for recipe_id, features in terms.items():
+            vector = {
+                term: self.idf(frequency.get(term, 1)) * (
+                    config['tag_weight'] if term[0] == TAG else 1.0
+                )
+                for term in features
+            }
+            self.vectors[recipe_id] = vector
+            self.norms[recipe_id] = math.sqrt(
+                sum(weight * weight for weight in vector.values())
+            ) or 1.0
+            for term, weight in vector.items():
+                if frequency.get(term, 1) <= max_frequency:
+                    self.postings[term].append((recipe_id, weight))
+        self.fans = fans or {}
+        self.favorites = defaultdict(set)
+        for recipe_id, users in self.fans.items():
+            for user_id in users:
+                self.favorites[user_id].add(recipe_id)
+
+    def idf(self, frequency):
+        return math.log((1 + self.total) / (1 + frequency)) + 1
+
+    def content_scores(self, recipe_id):
+        vector = self.vectors.get(recipe_id, {})
+        dots = defaultdict(float)
+        for term, weight in vector.items():
+            for other_id, other_weight in self.postings.get(term, ()):
+                dots[other_id] += weight * other_weight
+        norm = self.norms.get(recipe_id, 1.0)
+        return {
+            other_id: dot / (norm * self.norms[other_id])
+            for other_id, dot in dots.items()
+        }
+
+    def favorite_scores(self, recipe_id):
+        users = self.fans.get(recipe_id, ())
+        common = defaultdict(int)
+        for user_id in users:
+            for other_id in self.favorites[user_id]:
+                common[other_id] += 1
+        return {
+            other_id: count / math.sqrt(
+                len(users) * len(self.fans[other_id])
+            )
+            for other_id, count in common.items()
+        }
+
+    def neighbours(self, recipe_id, top_k):
+        content = self.content_scores(recipe_id)
+        favorites = self.favorite_scores(recipe_id)
+        scores = {
+            other_id: (
+                (1 - self.favorite_weight) * content.get(other_id, 0.0)
+                + self.favorite_weight * favorites.get(other_id, 0.0)
+            )
+            for other_id in set(content) | set(favorites)
+            if other_id != recipe_id
+        }
+        return heapq.nlargest(
+            top_k, scores.items(), key=lambda item: (item[1], item[0])
+        )
+
+
+def invalidate_similar_recipes():
+    transaction.on_commit(
+        lambda: reference_cache.bump_version(SIMILAR_NAMESPACE)
+    )
+
+
+@transaction.atomic
+def compute_similar_recipes(batch_size=1000):
+    """
+    Пакетный пересчёт соседей всех рецептов
+    """
+    top_k = settings.RECIPE_SIMILAR['top_k']
+    model = SimilarityModel(load_terms(), load_fans())
+    SimilarRecipe.objects.all().delete()
+    links = []
+    for recipe_id in model.vectors:
+        links.extend(
+            SimilarRecipe(recipe_id=recipe_id, similar_id=other_id,
+                          score=score)
+            for other_id, score in model.neighbours(recipe_id, top_k)
+        )
+        if len(links) >= batch_size:
+            SimilarRecipe.objects.bulk_create(links)
+            links = []
+    SimilarRecipe.objects.bulk_create(links)
+    invalidate_similar_recipes()
+
+
+@transaction.atomic
+def update_similar_recipe(recipe_id):
+    """
+    Соседи одного рецепта без пересчёта остальных: сравнение только
+    с рецептами, у которых есть общие редкие ингредиенты или теги.
+    Рецепт добавляется и в списки соседей, где он лучше худшего
+    """
+    config = settings.RECIPE_SIMILAR
+    top_k = config['top_k']
+    total = Recipe.objects.count()
+    frequency = load_document_frequency()
+    max_frequency = max(config['max_df'] * total, MIN_PRUNED_FREQUENCY)
+    own_terms = load_terms([recipe_id]).get(recipe_id, {})
+    rare = [term for term in own_terms
+            if frequency.get(term, 1) <= max_frequency]
+    ingredient_ids = [pk for kind, pk in rare if kind == INGREDIENT]
+    tag_ids = [pk for kind, pk in rare if kind == TAG]
+    candidates = set(
+        RecipeIngredient.objects.filter(
+            ingredient__in=ingredient_ids
+        ).values('recipe').annotate(common=Count('id')).order_by(
+            '-common'
+        ).values_list('recipe', flat=True)[:config['candidates']]
+    ) | set(
+        Recipe.tags.through.objects.filter(tag__in=tag_ids).order_by(
+            '-recipe_id'
+        ).values_list('recipe_id', flat=True)[:config['candidates']]
+    )
+    candidates.add(recipe_id)
+    model = SimilarityModel(
+        load_terms(candidates), load_fans(candidates), frequency, total
+    )
+    neighbours = model.neighbours(recipe_id, top_k)
+    SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+    SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe_id=recipe_id, similar_id=other_id, score=score)
+        for other_id, score in neighbours
+    )
+    add_reverse_links(recipe_id, neighbours, top_k)
+    invalidate_similar_recipes()
+
+
+def add_reverse_links(recipe_id, neighbours, top_k):
+    """
+    Обновляет рецепт в списках соседей: из списков рецептов, которые
+    перестали быть похожими, он удаляется, в остальные вставляется
+    вместо худшего соседа
+    """
+    scores = dict(neighbours)
+    SimilarRecipe.objects.filter(similar_id=recipe_id).exclude(
+        recipe_id__in=scores
+    ).delete()
+    current = defaultdict(list)
+    for link in SimilarRecipe.objects.filter(
+            recipe__in=scores).exclude(similar_id=recipe_id):
+        current[link.recipe_id].append(link)
+    evicted, added = [], []
+    for other_id, score in scores.items():
+        links = current[other_id]
+        if len(links) >= top_k:
+            weakest = min(links, key=lambda link: link.score)
+            if weakest.score >= score:
+                continue
+            evicted.append(weakest.pk)
+        added.append(SimilarRecipe(
+            recipe_id=other_id, similar_id=recipe_id, score=score
+        ))
+    SimilarRecipe.objects.filter(pk__in=evicted).delete()
+    SimilarRecipe.objects.filter(
+        recipe__in=scores, similar_id=recipe_id
+    ).delete()
+    SimilarRecipe.objects.bulk_create(added)
+
+
+def schedule_similar_update(recipe):
+    """
+    Пересчёт соседей рецепта в очереди RECIPE_SIMILAR['queue'] после
+    фиксации транзакции
+    """
+    transaction.on_commit(lambda: tasks.dispatch(
+        settings.RECIPE_SIMILAR['queue'], update_similar_recipe, recipe.pk
+    ))
+
+
+def get_similar_ids(recipe_id):
+    """
+    Id похожих рецептов из общего кэша или из таблицы соседей
+    """
+    version = reference_cache.get_version(SIMILAR_NAMESPACE)
+    key = reference_cache.make_key(SIMILAR_NAMESPACE, version, recipe_id)
+    similar = reference_cache.get(key)
+    if similar is None:
+        similar = list(SimilarRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).order_by('-score', '-similar_id').values_list(
+            'similar_id', 'score'
+        ))
+        reference_cache.set(key, similar)
+    return similar
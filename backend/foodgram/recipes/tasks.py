@@ -0,0 +1,44 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def run_task(function, *args):
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s%s завершилась с ошибкой',
+                         function.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_WORKERS,
+            thread_name_prefix='recipes-background'
+        )
+    return _executor
+
+
+def dispatch(queue, function, *args):
+    """
+    Запускает задачу: queue - путь к функции внешней очереди (например,
+    delay задачи воркера), 'sync' - выполнение в запросе, пустое
+    значение - пул потоков в текущем процессе
+    """
+    if queue == 'sync':
+        function(*args)
+    elif queue:
+        import_string(queue)(*args)
+    else:
+        get_executor().submit(run_task, function, *args)
@@ -0,0 +1,116 @@
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .autocomplete import ingredient_index
+from .benchmarks import (Scale, background_disabled, seed_dataset,
+                         temporary_media)
+from .cache import reference_cache, response_cache
+from .matching import match_index
+from .search import inverted_index
+
+# Страница limit=50 должна быть полной, остальное - минимум, при котором
+# у каждого пользователя есть избранное, корзина и подписки.
+TEST_SCALE = Scale(
+    users=6, recipes=60, ingredients=60, ingredients_per_recipe=4, tags=3,
+    favorites=8, carts=3, subscriptions=3,
+)
+
+
+def reset_process_caches():
+    """
+    Кэши и индексы в памяти процесса переживают откат транзакции
+    теста, поэтому перед каждым тестом собираются заново
+    """
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    reference_cache.local.clear()
+    response_cache.local.clear()
+    for index in (ingredient_index, match_index, inverted_index):
+        index.__init__()
+
+
+@contextmanager
+def execute_on_commit():
+    """
+    Выполняет колбэки transaction.on_commit, зарегистрированные
+    в блоке: внутри TestCase транзакция не фиксируется и они
+    не вызываются (captureOnCommitCallbacks появился в Django 3.2)
+    """
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
+
+
+class SeededDatasetMixin:
+    """
+    Окружение бенчмарка для тестов: фоновые задачи отбрасываются,
+    файлы пишутся во временный MEDIA_ROOT, кэши процесса пустые.
+    self.dataset - набор данных seed_dataset(scale), self.anonymous
+    и self.authorized - клиенты без токена и от имени dataset.user
+    """
+    scale = TEST_SCALE
+
+    @classmethod
+    def setUpClass(cls):
+        cls.environment = ExitStack()
+        cls.environment.enter_context(background_disabled())
+        cls.environment.enter_context(temporary_media())
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.environment.close()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls.environment.close()
+
+    def setUp(self):
+        super().setUp()
+        reset_process_caches()
+        self.anonymous = APIClient()
+        self.authorized = self.client_for(self.dataset.user)
+
+    @staticmethod
+    def client_for(user):
+        """
+        Клиент с токеном пользователя: запросы проходят ту же
+        аутентификацию, что и в бою
+        """
+        token, _ = Token.objects.get_or_create(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+
+class SeededTestCase(SeededDatasetMixin, TestCase):
+    """
+    Набор данных создаётся один раз на класс и откатывается после него
+    """
+    @classmethod
+    def setUpTestData(cls):
+        reset_process_caches()
+        cls.dataset = seed_dataset(cls.scale)
+
+
+class SeededTransactionTestCase(SeededDatasetMixin, TransactionTestCase):
+    """
+    Для тестов, которым нужны настоящие фиксации транзакций:
+    набор данных создаётся заново для каждого теста
+    """
+    def setUp(self):
+        reset_process_caches()
+        self.dataset = seed_dataset(self.scale)
+        super().setUp()
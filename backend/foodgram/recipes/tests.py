@@ -0,0 +1,1427 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from foodgram.compression import brotli
+from foodgram.metrics import registry
+from foodgram.renderers import (BACKENDS, ORJSON_BACKEND, STDLIB_BACKEND,
+                                FastJSONRenderer, orjson)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from users.models import Subscription, User
+
+from .benchmarks import BENCHMARK_IMAGE_BASE64, check_budgets, run_scenarios
+from .encoders import encode_recipes
+from .feed import DatabaseFeedBackend, latest_entries, rebuild_feeds
+from .images import process_recipe_image
+from .models import (Favorite, FeedEntry, Ingredient, Recipe, RecipeIngredient,
+                     RecipeSearchDocument, ShoppingCart, ShoppingListItem,
+                     SimilarRecipe, Tag)
+from .overlay import ANONYMOUS_STATE, apply_viewer_state, load_viewer_state
+from .plans import check_plans, find_sequential_scans
+from .ranking import current_epoch, decay_factor, update_recipe_scores
+from .search import inverted_index, search_recipes, update_search_document
+from .serializers import MAX_INGREDIENT_AMOUNT, RecipeViewSerializer
+from .services import (aggregate_shopping_lists, find_counter_mismatches,
+                       materialized_shopping_lists, reconcile_counters)
+from .similarity import update_similar_recipe
+from .testing import (SeededTestCase, SeededTransactionTestCase,
+                      execute_on_commit, reset_process_caches)
+
+PAGE_SIZES = (6, 20, 50)
+
+
+def get_recipe_payload(tag_id, ingredient_ids, amount=10):
+    return {
+        'ingredients': [
+            {'id': ingredient_id, 'amount': amount}
+            for ingredient_id in ingredient_ids
+        ],
+        'tags': [tag_id],
+        'image': BENCHMARK_IMAGE_BASE64,
+        'name': 'Тестовый рецепт',
+        'text': 'Описание',
+        'cooking_time': 5,
+    }
+
+
+class BenchmarkScenariosTest(SeededTransactionTestCase):
+    def test_scenarios_succeed_within_query_budgets(self):
+        results = run_scenarios(self.dataset, repeat=2, warmup=2)
+        failed = {
+            name: result['status'] for name, result in results.items()
+            if result['status'] >= 400
+        }
+        self.assertEqual(failed, {})
+        self.assertEqual(check_budgets(results), [])
+
+
+class RecipeListQueriesTest(SeededTestCase):
+    """
+    Число запросов к БД не зависит от размера страницы. Кэши пустые:
+    считается холодный запрос
+    """
+    def assert_page_queries(self, client, path, queries, size):
+        reset_process_caches()
+        with self.assertNumQueries(queries):
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), size)
+
+    # При общем кэше: count, id страницы, выдачи рецептов с авторами,
+    # теги, ингредиенты, у зрителя ещё токен, избранное, корзина
+    # и подписки. Без него флаги зрителя считаются EXISTS в запросе
+    # страницы
+    LIST_QUERIES = {
+        True: {'anonymous': 5, 'authorized': 9},
+        False: {'anonymous': 4, 'authorized': 5},
+    }
+
+    def assert_list_queries(self, viewer):
+        client = getattr(self, viewer)
+        for enabled, queries in self.LIST_QUERIES.items():
+            for size in PAGE_SIZES:
+                with self.subTest(cache=enabled, limit=size):
+                    with override_settings(
+                            RECIPE_RESPONSE_CACHE_ENABLED=enabled):
+                        self.assert_page_queries(
+                            client, f'/api/recipes/?limit={size}',
+                            queries[viewer], size
+                        )
+
+    def test_anonymous_recipe_list(self):
+        self.assert_list_queries('anonymous')
+
+    def test_authenticated_recipe_list(self):
+        self.assert_list_queries('authorized')
+
+    @override_settings(RECIPE_RESPONSE_CACHE_ENABLED=False)
+    def test_viewer_flags_without_shared_cache(self):
+        recipe = self.dataset.recipe
+        path = f'/api/recipes/{recipe.pk}/'
+        self.assertFalse(self.authorized.get(path).data['is_favorited'])
+        Favorite.objects.create(user=self.dataset.user, recipe=recipe)
+        self.assertTrue(self.authorized.get(path).data['is_favorited'])
+
+    def test_subscriptions(self):
+        # токен, count, подписки с авторами, рецепты всех авторов
+        for path in ('/api/users/subscriptions/',
+                     '/api/users/subscriptions/?limit=50&recipes_limit=2'):
+            with self.subTest(path=path):
+                self.assert_page_queries(
+                    self.authorized, path, 4, self.scale.subscriptions
+                )
+
+
+class RecipeWriteTest(SeededTestCase):
+    """
+    Создание и изменение рецепта: число запросов не зависит от числа
+    ингредиентов, ошибки в составе - 400 без записи в БД
+    """
+    # Токен, ингредиенты и теги одним запросом каждые, запись рецепта,
+    # тегов, состава, поискового документа и повторное чтение выдачи.
+    # Внутри TestCase сюда входят и точки сохранения транзакций
+    CREATE_QUERIES = 18
+    UPDATE_QUERIES = 21
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.ingredient_ids = list(Ingredient.objects.order_by(
+            'id'
+        ).values_list('id', flat=True)[:20])
+
+    def get_payload(self, ingredient_ids, amount=10):
+        return get_recipe_payload(self.dataset.tag.id, ingredient_ids, amount)
+
+    def test_queries_do_not_depend_on_ingredients(self):
+        for count in (1, 10):
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.authorized.post(
+                        '/api/recipes/',
+                        self.get_payload(self.ingredient_ids[:count]),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+                recipe_id = response.data['id']
+                replacement = self.ingredient_ids[count:count * 2]
+                with self.assertNumQueries(self.UPDATE_QUERIES):
+                    response = self.authorized.patch(
+                        f'/api/recipes/{recipe_id}/',
+                        self.get_payload(replacement), format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['ingredients']), count)
+                self.assertEqual(
+                    list(RecipeIngredient.objects.filter(
+                        recipe_id=recipe_id
+                    ).order_by('ingredient_id').values_list(
+                        'ingredient_id', flat=True
+                    )),
+                    replacement
+                )
+
+    def assert_rejected(self, ingredient_ids, amount=10):
+        recipes = Recipe.objects.count()
+        response = self.authorized.post(
+            '/api/recipes/', self.get_payload(ingredient_ids, amount),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ingredients', response.data)
+        self.assertEqual(Recipe.objects.count(), recipes)
+
+    def test_duplicate_ingredient(self):
+        self.assert_rejected([self.ingredient_ids[0]] * 2)
+
+    def test_missing_ingredient(self):
+        missing = Ingredient.objects.order_by('-id').first().id + 1
+        self.assert_rejected([self.ingredient_ids[0], missing])
+
+    def test_amount_out_of_range(self):
+        for amount in (0, MAX_INGREDIENT_AMOUNT + 1):
+            with self.subTest(amount=amount):
+                self.assert_rejected(self.ingredient_ids[:1], amount)
+
+
+@override_settings(RECIPE_RESPONSE_CACHE_ENABLED=True)
+class RecipeConditionalTest(SeededTestCase):
+    """
+    ETag и 304 для выдач рецептов из общего кэша: отметка меняется
+    с рецептом, анонимные ответы не достаются зрителю с токеном
+    """
+    def assert_not_modified(self, client, path):
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def test_not_modified(self):
+        recipe_path = f'/api/recipes/{self.dataset.recipe.pk}/'
+        for client, path in ((self.anonymous, recipe_path),
+                             (self.authorized, recipe_path),
+                             (self.anonymous, '/api/recipes/')):
+            with self.subTest(path=path, client=client):
+                self.assert_not_modified(client, path)
+
+    def test_edit_changes_etag(self):
+        recipe = self.dataset.own_recipe
+        recipe_path = f'/api/recipes/{recipe.pk}/'
+        for client, path in ((self.anonymous, recipe_path),
+                             (self.authorized, recipe_path),
+                             (self.anonymous, '/api/recipes/')):
+            with self.subTest(path=path, client=client):
+                etag = self.assert_not_modified(client, path)
+                with execute_on_commit():
+                    response = self.authorized.patch(
+                        recipe_path,
+                        get_recipe_payload(
+                            self.dataset.tag.id,
+                            self.dataset.ingredient_ids[:2]
+                        ),
+                        format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+
+    def test_anonymous_response_is_not_shared(self):
+        recipe_path = f'/api/recipes/{self.dataset.recipe.pk}/'
+        for path in ('/api/recipes/', recipe_path):
+            with self.subTest(path=path):
+                anonymous = self.anonymous.get(path)
+                self.assertIn('public', anonymous['Cache-Control'])
+                self.assertIn('Authorization', anonymous['Vary'])
+                response = self.authorized.get(
+                    path, HTTP_IF_NONE_MATCH=anonymous['ETag']
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response.get('ETag'), anonymous['ETag'])
+                self.assertNotIn('public', response.get('Cache-Control', ''))
+
+    def test_viewer_state_over_cached_list(self):
+        recipe_id = self.anonymous.get(
+            '/api/recipes/'
+        ).data['results'][0]['id']
+        with execute_on_commit():
+            response = self.authorized.post(
+                f'/api/recipes/{recipe_id}/favorite/'
+            )
+        self.assertEqual(response.status_code, 201)
+        self.assertIs(self.get_flag(self.anonymous, recipe_id), False)
+        self.assertIs(self.get_flag(self.authorized, recipe_id), True)
+
+    @staticmethod
+    def get_flag(client, recipe_id):
+        for recipe in client.get('/api/recipes/').data['results']:
+            if recipe['id'] == recipe_id:
+                return recipe['is_favorited']
+        return None
+
+
+class RecipeListsBulkTest(SeededTestCase):
+    """
+    Массовое изменение избранного и корзины: результат по каждому id,
+    повторный запрос ничего не меняет, счётчики и список покупок
+    совпадают с корзиной
+    """
+    def setUp(self):
+        super().setUp()
+        self.user = self.dataset.user
+        self.missing = Recipe.objects.order_by('-pk').first().pk + 1
+
+    def change(self, method, path, recipe_ids):
+        response = getattr(self.authorized, method)(
+            path, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            item['id']: item['status'] for item in response.data['results']
+        }
+
+    def assert_consistent(self):
+        self.assertEqual(
+            aggregate_shopping_lists([self.user.pk]),
+            materialized_shopping_lists([self.user.pk])
+        )
+        self.assertEqual(set(find_counter_mismatches().values()), {0})
+
+    def get_ids(self, model, exclude=True):
+        recipes = Recipe.objects.filter(
+            pk__in=model.objects.filter(user=self.user).values('recipe_id')
+        )
+        if exclude:
+            recipes = Recipe.objects.exclude(pk__in=recipes)
+        return list(recipes.order_by('pk').values_list('pk', flat=True))
+
+    def test_statuses(self):
+        for model, path in ((Favorite, '/api/recipes/favorite/'),
+                            (ShoppingCart, '/api/recipes/shopping_cart/')):
+            with self.subTest(path=path):
+                existing = self.get_ids(model, exclude=False)[0]
+                new = self.get_ids(model)[:2]
+                recipe_ids = [new[0], existing, self.missing, new[1]]
+                expected = {
+                    new[0]: 'added', existing: 'exists',
+                    self.missing: 'not_found', new[1]: 'added',
+                }
+                self.assertEqual(
+                    self.change('post', path, recipe_ids), expected
+                )
+                self.assertEqual(list(expected), recipe_ids)
+                self.assert_consistent()
+                self.assertEqual(
+                    self.change('post', path, recipe_ids),
+                    {**expected, new[0]: 'exists', new[1]: 'exists'}
+                )
+                self.assert_consistent()
+                self.assertEqual(
+                    self.change('delete', path, [new[0], self.missing]),
+                    {new[0]: 'removed', self.missing: 'missing'}
+                )
+                self.assertFalse(model.objects.filter(
+                    user=self.user, recipe_id=new[0]
+                ).exists())
+                self.assert_consistent()
+
+    def get_cart_state(self, recipe_ids):
+        return (
+            self.get_ids(ShoppingCart, exclude=False),
+            materialized_shopping_lists([self.user.pk]),
+            dict(Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                'pk', 'cart_count'
+            )),
+        )
+
+    def test_repeated_post_is_idempotent(self):
+        path = '/api/recipes/shopping_cart/'
+        recipe_ids = self.get_ids(ShoppingCart)[:3]
+        self.change('post', path, recipe_ids)
+        state = self.get_cart_state(recipe_ids)
+        self.change('post', path, recipe_ids)
+        self.assertEqual(self.get_cart_state(recipe_ids), state)
+
+    def test_clear_shopping_cart(self):
+        carted = self.get_ids(ShoppingCart, exclude=False)
+        self.assertTrue(carted)
+        _, _, counts = self.get_cart_state(carted)
+        response = self.authorized.delete('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingCart.objects.filter(user=self.user).exists())
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.user).exists()
+        )
+        self.assertEqual(
+            self.get_cart_state(carted),
+            ([], {}, {pk: count - 1 for pk, count in counts.items()})
+        )
+        self.assert_consistent()
+
+
+class CounterApiTest(SeededTestCase):
+    """
+    Счётчики favorites_count, cart_count, recipes_count
+    и followers_count совпадают со строками после изменений через API
+    """
+    def get_counters(self, recipe, author):
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        author = User.objects.get(pk=author.pk)
+        return {
+            'favorites_count': (
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()
+            ),
+            'cart_count': (
+                recipe.cart_count,
+                ShoppingCart.objects.filter(recipe=recipe).count()
+            ),
+            'recipes_count': (
+                author.recipes_count,
+                Recipe.objects.filter(author=author).count()
+            ),
+            'followers_count': (
+                author.followers_count,
+                Subscription.objects.filter(author=author).count()
+            ),
+        }
+
+    def test_counters_follow_api_changes(self):
+        user = self.dataset.user
+        recipe = Recipe.objects.exclude(author=user).exclude(
+            favorites__user=user
+        ).exclude(shopping_cart__user=user).order_by('pk').first()
+        author = recipe.author
+        Subscription.objects.filter(user=user, author=author).delete()
+        reconcile_counters()
+        author_client = self.client_for(author)
+        payload = get_recipe_payload(
+            self.dataset.tag.id, self.dataset.ingredient_ids[:2]
+        )
+        before = self.get_counters(recipe, author)
+        steps = (
+            (self.authorized, 'post', f'/api/recipes/{recipe.pk}/favorite/',
+             'favorites_count', 1),
+            (self.authorized, 'post',
+             f'/api/recipes/{recipe.pk}/shopping_cart/', 'cart_count', 1),
+            (self.authorized, 'post', f'/api/users/{author.pk}/subscribe/',
+             'followers_count', 1),
+            (author_client, 'post', '/api/recipes/', 'recipes_count', 1),
+            (self.authorized, 'delete',
+             f'/api/recipes/{recipe.pk}/favorite/', 'favorites_count', 0),
+            (self.authorized, 'delete', '/api/recipes/shopping_cart/clear/',
+             'cart_count', 0),
+            (self.authorized, 'delete',
+             f'/api/users/{author.pk}/subscribe/', 'followers_count', 0),
+        )
+        for client, method, path, counter, delta in steps:
+            with self.subTest(method=method, path=path):
+                with execute_on_commit():
+                    response = getattr(client, method)(
+                        path, payload if path == '/api/recipes/' else None,
+                        format='json'
+                    )
+                self.assertLess(response.status_code, 300)
+                counters = self.get_counters(recipe, author)
+                self.assertEqual(
+                    counters[counter][0], before[counter][0] + delta
+                )
+                for name, (value, actual) in counters.items():
+                    self.assertEqual(value, actual, name)
+        created = Recipe.objects.filter(author=author).order_by('-pk').first()
+        with execute_on_commit():
+            response = author_client.delete(f'/api/recipes/{created.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_counters(recipe, author), before)
+        self.assertEqual(set(find_counter_mismatches().values()), {0})
+
+
+class RecipeFilterTest(SeededTestCase):
+    """
+    Фильтр по тегам не повторяет рецепты, сортировки по оценкам
+    идут по убыванию оценки и id
+    """
+    def get_ids(self, params):
+        ids = []
+        for enabled in (True, False):
+            with override_settings(RECIPE_RESPONSE_CACHE_ENABLED=enabled):
+                reset_process_caches()
+                response = self.anonymous.get(
+                    '/api/recipes/', {'limit': 100, **params}
+                )
+            self.assertEqual(response.status_code, 200)
+            ids.append([recipe['id'] for recipe in response.data['results']])
+        self.assertEqual(ids[0], ids[1])
+        return ids[0]
+
+    def test_recipe_with_two_tags_appears_once(self):
+        recipe = self.dataset.recipe
+        tags = list(Tag.objects.order_by('pk')[:2])
+        recipe.tags.set(tags)
+        ids = self.get_ids({'tags': [tag.slug for tag in tags]})
+        self.assertEqual(ids.count(recipe.pk), 1)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(
+            set(ids),
+            set(Recipe.objects.filter(tags__in=tags).values_list(
+                'pk', flat=True
+            ))
+        )
+
+    def test_score_orderings(self):
+        for ordering, field in (('popular', 'popularity'),
+                                ('trending', 'trending_score')):
+            with self.subTest(ordering=ordering):
+                scores = dict(Recipe.objects.values_list('pk', field))
+                self.assertGreater(len(set(scores.values())), 1)
+                self.assertEqual(
+                    self.get_ids({'ordering': ordering}),
+                    sorted(
+                        scores, key=lambda pk: (scores[pk], pk), reverse=True
+                    )
+                )
+
+
+class JSONRendererTest(SeededTestCase):
+    """
+    Оба кодировщика FastJSONRenderer дают те же байты, что
+    и JSONRenderer DRF, на странице рецептов
+    """
+    def get_page(self):
+        response = self.authorized.get('/api/recipes/', {'limit': 20})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        data['results'][0]['text'] += '\u2028\u2029'
+        return data
+
+    def test_backends_match_drf(self):
+        data = self.get_page()
+        expected = JSONRenderer().render(data)
+        for name in (STDLIB_BACKEND, ORJSON_BACKEND):
+            with self.subTest(backend=name):
+                if name == ORJSON_BACKEND and orjson is None:
+                    self.skipTest('orjson не установлен')
+                with mock.patch.object(
+                        FastJSONRenderer, 'backend', BACKENDS[name]()):
+                    self.assertEqual(
+                        FastJSONRenderer().render(data), expected
+                    )
+
+
+@override_settings(
+    RECIPE_RESPONSE_CACHE_ENABLED=True,
+    COMPRESSION=dict(settings.COMPRESSION, min_size=64)
+)
+class CompressionTest(SeededTestCase):
+    """
+    Сжатие потоковой выгрузки и ответов с ETag: тело распаковывается
+    в исходное, сильный ETag становится слабым и продолжает давать 304
+    """
+    DECOMPRESS = {'gzip': gzip.decompress}
+    if brotli is not None:
+        DECOMPRESS['br'] = brotli.decompress
+
+    @staticmethod
+    def read(response):
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def test_streaming_download(self):
+        path = '/api/recipes/download_shopping_cart/?format=csv'
+        plain = self.authorized.get(path)
+        body = self.read(plain)
+        self.assertGreater(len(body), 64)
+        self.assertNotIn('Content-Encoding', plain)
+        for encoding, decompress in self.DECOMPRESS.items():
+            with self.subTest(encoding=encoding):
+                response = self.authorized.get(
+                    path, HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertTrue(response.streaming)
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertNotIn('Content-Length', response)
+                self.assertEqual(decompress(self.read(response)), body)
+
+    def test_weak_etag(self):
+        path = f'/api/recipes/{self.dataset.recipe.pk}/'
+        plain = self.anonymous.get(path)
+        etag = plain['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        for encoding, decompress in self.DECOMPRESS.items():
+            with self.subTest(encoding=encoding):
+                response = self.anonymous.get(
+                    path, HTTP_ACCEPT_ENCODING=encoding
+                )
+                self.assertEqual(response['Content-Encoding'], encoding)
+                self.assertEqual(response['ETag'], f'W/{etag}')
+                self.assertEqual(
+                    decompress(response.content), plain.content
+                )
+                response = self.anonymous.get(
+                    path, HTTP_ACCEPT_ENCODING=encoding,
+                    HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(response.status_code, 304)
+
+
+class ProfilingTest(SeededTestCase):
+    """
+    Метрики запросов: выключенный сбор не трогает ответы DRF,
+    включённый пишет время рендерера в гистограмму и Server-Timing
+    """
+    def get_render_series(self, enabled):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        profiling = dict(
+            settings.PROFILING, enabled=enabled, server_timing=True
+        )
+        with override_settings(PROFILING=profiling):
+            response = self.anonymous.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return response, registry.metrics[
+            'foodgram_render_duration_seconds'
+        ]['series']
+
+    def test_disabled(self):
+        response, series = self.get_render_series(False)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(series, {})
+
+    def test_enabled(self):
+        response, series = self.get_render_series(True)
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertEqual(list(series), [
+            (('method', 'GET'), ('view', 'recipes:recipes-list')),
+        ])
+
+
+class ReferenceCacheTest(SeededTestCase):
+    """
+    Справочники тегов и ингредиентов: повторный запрос без БД,
+    304 по ETag, новая версия после изменения
+    """
+    def test_cached_until_changed(self):
+        for model, path, create in (
+                (Tag, '/api/tags/', lambda: Tag.objects.create(
+                    name='Новый тег', color='#000000', slug='new-tag'
+                )),
+                (Ingredient, '/api/ingredients/?name=соль',
+                 lambda: Ingredient.objects.create(
+                     name='соль', measurement_unit='г'
+                 ))):
+            with self.subTest(path=path):
+                response = self.anonymous.get(path)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(0):
+                    cached = self.anonymous.get(path)
+                self.assertEqual(cached.data, response.data)
+                with self.assertNumQueries(0):
+                    response = self.anonymous.get(
+                        path, HTTP_IF_NONE_MATCH=cached['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                created = create()
+                response = self.anonymous.get(path)
+                self.assertNotEqual(response['ETag'], cached['ETag'])
+                self.assertIn(
+                    created.pk, [item['id'] for item in response.data]
+                )
+
+
+class KeysetPaginationTest(SeededTestCase):
+    """
+    Курсорная пагинация списка рецептов: страницы по (pub_date, id)
+    без пропусков и повторов в обе стороны
+    """
+    def walk(self, url, link):
+        """
+        Страницы по ссылкам link до конца и данные последней страницы
+        """
+        pages = []
+        while url:
+            response = self.anonymous.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data[link]
+        return pages, response.data
+
+    def test_walk_both_ways(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', flat=True))
+        pages, last = self.walk(
+            '/api/recipes/?pagination=cursor&limit=7', 'next'
+        )
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages[0]), 7)
+        previous, first = self.walk(last['previous'], 'previous')
+        self.assertEqual(previous, pages[-2::-1])
+        self.assertEqual(first['results'][0]['id'], expected[0])
+
+    def test_new_recipe_does_not_shift_pages(self):
+        first = self.anonymous.get(
+            '/api/recipes/?pagination=cursor&limit=7'
+        ).data
+        with execute_on_commit():
+            response = self.authorized.post(
+                '/api/recipes/',
+                get_recipe_payload(
+                    self.dataset.tag.id, self.dataset.ingredient_ids[:1]
+                ),
+                format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        second = self.anonymous.get(first['next']).data
+        seen = [recipe['id'] for recipe in first['results']]
+        self.assertFalse(
+            set(seen) & {recipe['id'] for recipe in second['results']}
+        )
+        self.assertNotIn(response.data['id'], seen)
+
+    def test_invalid_cursor(self):
+        response = self.anonymous.get('/api/recipes/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+class SubscriptionsTest(SeededTestCase):
+    """
+    Подписки: превью последних recipes_limit рецептов каждого автора
+    и счётчики из строк
+    """
+    def test_recipe_previews(self):
+        response = self.authorized.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        authors = Subscription.objects.filter(
+            user=self.dataset.user
+        ).order_by('-id').values_list('author_id', flat=True)
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            list(authors)
+        )
+        for author in response.data['results']:
+            with self.subTest(author=author['id']):
+                recipes = Recipe.objects.filter(author_id=author['id'])
+                self.assertEqual(
+                    [recipe['id'] for recipe in author['recipes']],
+                    list(recipes.order_by(
+                        '-pub_date', '-id'
+                    ).values_list('pk', flat=True)[:2])
+                )
+                self.assertEqual(author['recipes_count'], recipes.count())
+                self.assertEqual(
+                    author['followers_count'],
+                    Subscription.objects.filter(
+                        author_id=author['id']
+                    ).count()
+                )
+                self.assertTrue(author['is_subscribed'])
+
+
+class QueryPlanTest(SeededTestCase):
+    """
+    Горячие запросы читаются по индексам; разбор планов PostgreSQL
+    проверяется на образце, потому что тесты идут и на SQLite
+    """
+    POSTGRESQL_PLAN = [
+        'Limit  (cost=0.28..1.02 rows=6 width=24)',
+        '  ->  Index Scan using recipe_popularity_idx on recipes_recipe',
+        'Nested Loop  (cost=0.28..8.30 rows=1 width=8)',
+        '  ->  Seq Scan on recipes_favorite',
+        '        Filter: (user_id = 1)',
+        '  ->  Index Scan using recipes_recipeingredient_recipe on '
+        'recipes_recipeingredient',
+        '        Index Cond: (recipe_id = 1)',
+        '  ->  Index Only Scan using recipes_tag_pkey on recipes_tag',
+    ]
+
+    def test_hot_queries_use_indexes(self):
+        scans = {
+            name: tables
+            for name, (plan, tables) in check_plans(self.dataset).items()
+            if tables
+        }
+        self.assertEqual(scans, {})
+
+    def test_postgresql_scans(self):
+        tables = {
+            'recipes_recipe', 'recipes_favorite',
+            'recipes_recipeingredient', 'recipes_tag',
+        }
+        for limited, expected in (
+                (False, ['recipes_recipe', 'recipes_favorite',
+                         'recipes_tag']),
+                (True, ['recipes_favorite'])):
+            with self.subTest(limited=limited):
+                self.assertEqual(
+                    find_sequential_scans(
+                        self.POSTGRESQL_PLAN, 'postgresql', tables, limited
+                    ),
+                    expected
+                )
+
+
+class RecipeEncoderTest(SeededTestCase):
+    """
+    Дифференциальная проверка быстрого кодировщика: выдача каждого
+    рецепта с флагами зрителя совпадает с RecipeViewSerializer байт
+    в байт для анонима, пользователя без списков и пользователя
+    с избранным, корзиной и подписками
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.viewer = User.objects.create_user(
+            username='viewer', email='viewer@example.com',
+            password='viewer-password'
+        )
+
+    @staticmethod
+    def get_request(user):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = user
+        return request
+
+    def get_mismatches(self, user):
+        request = self.get_request(user)
+        recipes = Recipe.objects.order_by('pk')
+        expected = {
+            payload['id']: payload for payload in RecipeViewSerializer(
+                recipes, many=True, context={'request': request}
+            ).data
+        }
+        state = ANONYMOUS_STATE
+        if user.is_authenticated:
+            state = load_viewer_state(user, 0)
+        actual = {
+            payload['id']: apply_viewer_state(payload, state)
+            for payload in encode_recipes(
+                request, list(recipes.values_list('pk', flat=True))
+            )
+        }
+        self.assertEqual(set(actual), set(expected))
+        renderer = JSONRenderer()
+        return [
+            recipe_id for recipe_id, payload in expected.items()
+            if renderer.render(payload) != renderer.render(actual[recipe_id])
+        ]
+
+    def test_matches_serializer(self):
+        viewers = {
+            'anonymous': AnonymousUser(),
+            'authenticated': self.viewer,
+            'subscribed': self.dataset.user,
+        }
+        state = load_viewer_state(self.dataset.user, 0)
+        self.assertTrue(state.favorites and state.cart and state.following)
+        for name, user in viewers.items():
+            with self.subTest(viewer=name):
+                self.assertEqual(self.get_mismatches(user), [])
+
+
+class RecipeImageVariantsTest(SeededTestCase):
+    """
+    Файлы вариантов картинки удаляются после повторной обработки
+    и после замены картинки
+    """
+    def get_variant_names(self, recipe_id):
+        recipe = Recipe.objects.get(pk=recipe_id)
+        return [recipe.thumbnail.name, recipe.preview.name]
+
+    def assert_stored(self, names, stored):
+        storage = Recipe._meta.get_field('thumbnail').storage
+        for name in names:
+            self.assertEqual(storage.exists(name), stored, name)
+
+    def test_old_variants_are_deleted(self):
+        response = self.authorized.post(
+            '/api/recipes/',
+            get_recipe_payload(
+                self.dataset.tag.id, self.dataset.ingredient_ids[:1]
+            ),
+            format='json'
+        )
+        recipe_id = response.data['id']
+        with execute_on_commit():
+            process_recipe_image(recipe_id)
+        first = self.get_variant_names(recipe_id)
+        self.assert_stored(first, True)
+
+        with execute_on_commit():
+            process_recipe_image(recipe_id)
+        second = self.get_variant_names(recipe_id)
+        self.assert_stored(first, False)
+        self.assert_stored(second, True)
+
+        with execute_on_commit():
+            response = self.authorized.patch(
+                f'/api/recipes/{recipe_id}/',
+                {'image': BENCHMARK_IMAGE_BASE64}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assert_stored(second, False)
+        self.assertEqual(self.get_variant_names(recipe_id), ['', ''])
+
+
+class AdminConsistencyTest(SeededTestCase):
+    """
+    Списки покупок и счётчики сходятся с исходными строками после
+    правок в админке и каскадного удаления пользователя
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            password='admin-password', first_name='Админ',
+            last_name='Админов'
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def assert_consistent(self):
+        self.assertEqual(
+            aggregate_shopping_lists(), materialized_shopping_lists()
+        )
+        self.assertEqual(set(find_counter_mismatches().values()), {0})
+
+    def get_carted_ingredient(self):
+        return RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).order_by('pk').first()
+
+    def delete_selected(self, model, pks):
+        with execute_on_commit():
+            response = self.client.post(
+                f'/admin/{model._meta.app_label}/'
+                f'{model._meta.model_name}/',
+                {
+                    'action': 'delete_selected',
+                    '_selected_action': pks,
+                    'post': 'yes',
+                }
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(model.objects.filter(pk__in=pks).exists())
+
+    def test_change_recipe_ingredient(self):
+        row = self.get_carted_ingredient()
+        with execute_on_commit():
+            response = self.client.post(
+                f'/admin/recipes/recipeingredient/{row.pk}/change/',
+                {
+                    'recipe': row.recipe_id,
+                    'ingredient': row.ingredient_id,
+                    'amount': row.amount + 7,
+                }
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+
+    def test_delete_recipe_ingredient(self):
+        row = self.get_carted_ingredient()
+        with execute_on_commit():
+            response = self.client.post(
+                f'/admin/recipes/recipeingredient/{row.pk}/delete/',
+                {'post': 'yes'}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assert_consistent()
+
+    def test_delete_selected_rows(self):
+        cases = {
+            ShoppingCart: ShoppingCart.objects.all(),
+            Favorite: Favorite.objects.all(),
+            Subscription: Subscription.objects.all(),
+            Recipe: Recipe.objects.filter(shopping_cart__isnull=False),
+        }
+        for model, rows in cases.items():
+            with self.subTest(model=model.__name__):
+                pks = list(rows.order_by('pk').values_list(
+                    'pk', flat=True
+                ).distinct()[:3])
+                self.delete_selected(model, pks)
+                self.assert_consistent()
+
+    def test_delete_user(self):
+        user = self.dataset.user
+        self.assertTrue(user.shopping_cart.exists())
+        self.assertTrue(Favorite.objects.filter(user=user).exists())
+        with execute_on_commit():
+            user.delete()
+        self.assert_consistent()
+
+
+class SimilarRecipeTest(SeededTestCase):
+    def test_stale_reverse_links_are_deleted(self):
+        recipe_id = self.dataset.recipe.pk
+        update_similar_recipe(recipe_id)
+        neighbours = set(SimilarRecipe.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('similar_id', flat=True))
+        stale_id = Recipe.objects.exclude(
+            pk__in=neighbours | {recipe_id}
+        ).values_list('pk', flat=True).first()
+        SimilarRecipe.objects.update_or_create(
+            recipe_id=stale_id, similar_id=recipe_id,
+            defaults={'score': 1.0}
+        )
+        update_similar_recipe(recipe_id)
+        self.assertEqual(
+            set(SimilarRecipe.objects.filter(
+                similar_id=recipe_id
+            ).values_list('recipe_id', flat=True)) - neighbours,
+            set()
+        )
+
+
+class LoadDataTest(TestCase):
+    def load(self, rows):
+        with tempfile.TemporaryDirectory() as directory:
+            ingredients = os.path.join(directory, 'ingredients.json')
+            with open(ingredients, 'w', encoding='utf-8') as file:
+                json.dump(rows, file, ensure_ascii=False)
+            tags = os.path.join(directory, 'tags.jsonl')
+            open(tags, 'w').close()
+            call_command(
+                'load_data', ingredients=ingredients, tags=tags,
+                stdout=io.StringIO()
+            )
+
+    def test_missing_field(self):
+        rows = [
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар'},
+        ]
+        with self.assertRaisesMessage(
+                CommandError, 'в записи 2 нет поля measurement_unit'):
+            self.load(rows)
+        self.assertFalse(Ingredient.objects.filter(name='соль').exists())
+
+    def test_not_an_object(self):
+        with self.assertRaisesMessage(CommandError, 'запись 1 не объект'):
+            self.load([['соль', 'г']])
+
+    def test_repeated_load_is_idempotent(self):
+        rows = [
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'сахар', 'measurement_unit': 'г'},
+        ]
+        self.load(rows)
+        loaded = list(Ingredient.objects.order_by('pk').values_list(
+            'pk', 'name', 'measurement_unit'
+        ))
+        self.load(rows)
+        self.assertEqual(
+            list(Ingredient.objects.order_by('pk').values_list(
+                'pk', 'name', 'measurement_unit'
+            )),
+            loaded
+        )
+        self.assertEqual(len(loaded), 2)
+
+
+class FeedTest(SeededTestCase):
+    """
+    Ленты подписок: рассылка по записям FeedEntry с ограничением длины
+    и подмешивание рецептов авторов с большим числом подписчиков
+    """
+    def get_feed_ids(self, user):
+        response = self.client_for(user).get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_push_entries_are_trimmed(self):
+        readers = [
+            User.objects.create_user(
+                username=f'reader{number}',
+                email=f'reader{number}@example.com',
+                password='reader-password'
+            )
+            for number in range(2)
+        ]
+        entries = latest_entries(
+            User.objects.values_list('pk', flat=True), 10
+        )
+        with override_settings(
+                RECIPE_FEED=dict(settings.RECIPE_FEED, max_length=3)):
+            with self.assertNumQueries(2):
+                DatabaseFeedBackend().add(
+                    [reader.pk for reader in readers], entries
+                )
+        for reader in readers:
+            self.assertEqual(
+                list(FeedEntry.objects.filter(user=reader).order_by(
+                    '-pub_date', '-recipe_id'
+                ).values_list('recipe_id', flat=True)),
+                [recipe_id for _, recipe_id, _ in entries[:3]]
+            )
+
+    def test_new_recipe_is_pushed_to_followers(self):
+        follower = Subscription.objects.filter(
+            author=self.dataset.user
+        ).select_related('user').first().user
+        with override_settings(
+                RECIPE_FEED=dict(settings.RECIPE_FEED, queue='sync')):
+            with execute_on_commit():
+                response = self.authorized.post(
+                    '/api/recipes/',
+                    get_recipe_payload(
+                        self.dataset.tag.id, self.dataset.ingredient_ids[:1]
+                    ),
+                    format='json'
+                )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            self.get_feed_ids(follower)[0], response.data['id']
+        )
+
+    def test_author_below_threshold_is_pushed(self):
+        author = User.objects.filter(
+            followers_count__gte=2
+        ).order_by('pk').first()
+        leaving, staying = [
+            subscription.user for subscription in Subscription.objects.filter(
+                author=author
+            ).select_related('user').order_by('pk')[:2]
+        ]
+        recipe_id = latest_entries([author.pk], 1)[0][1]
+        with override_settings(RECIPE_FEED=dict(
+                settings.RECIPE_FEED, queue='sync',
+                fanout_threshold=author.followers_count)):
+            rebuild_feeds()
+            self.assertFalse(FeedEntry.objects.filter(author=author).exists())
+            self.assertIn(recipe_id, self.get_feed_ids(staying))
+
+            with execute_on_commit():
+                response = self.client_for(leaving).delete(
+                    f'/api/users/{author.pk}/subscribe/'
+                )
+            self.assertEqual(response.status_code, 204)
+            self.assertTrue(FeedEntry.objects.filter(
+                user=staying, author=author, recipe_id=recipe_id
+            ).exists())
+            self.assertIn(recipe_id, self.get_feed_ids(staying))
+
+
+class RankingEpochTest(SeededTestCase):
+    def setUp(self):
+        super().setUp()
+        config = settings.RECIPE_RANKING
+        self.half_life = config['half_life']
+        self.epoch = config['epoch']
+        self.period = self.half_life * config['epoch_half_lives']
+
+    def test_epoch_moves_by_whole_periods(self):
+        self.assertEqual(current_epoch(self.epoch - self.period), self.epoch)
+        self.assertEqual(
+            current_epoch(self.epoch + self.period * 2.5),
+            self.epoch + self.period * 2
+        )
+
+    def test_scores_do_not_overflow(self):
+        now = self.epoch + self.half_life * 5000
+        with mock.patch('recipes.ranking.timezone.now', return_value=now):
+            self.assertLessEqual(
+                decay_factor(now), 2 ** settings.RECIPE_RANKING[
+                    'epoch_half_lives'
+                ]
+            )
+            update_recipe_scores()
+        self.assertFalse(Recipe.objects.filter(trending_score__gt=1).exists())
+
+
+class InvertedIndexTest(SeededTestCase):
+    """
+    Индекс поиска на SQLite дочитывает только изменения: изменённые
+    документы по updated и удалённые по журналу версий
+    """
+    def test_refresh_reads_only_changes(self):
+        inverted_index.refresh()
+        changed, deleted = Recipe.objects.order_by('pk')[:2]
+        changed.name = 'Шакшука'
+        with execute_on_commit():
+            changed.save()
+            update_search_document(changed)
+            deleted.delete()
+        with self.assertNumQueries(1):
+            inverted_index.refresh()
+        self.assertEqual(
+            [recipe_id for recipe_id, _ in inverted_index.search(
+                'шакшуку', 10
+            )],
+            [changed.pk]
+        )
+        self.assertNotIn(deleted.pk, inverted_index.documents)
+        self.assertEqual(
+            set(inverted_index.documents),
+            set(RecipeSearchDocument.objects.values_list(
+                'recipe_id', flat=True
+            ))
+        )
+
+
+class RecipeSearchTest(SeededTestCase):
+    """
+    Страницы поиска: без фильтров - срез ранжированного списка,
+    с фильтрами - те же рецепты в порядке ранга, что и фильтр по
+    всему списку
+    """
+    query = 'рецепт'
+
+    def get_page(self, **params):
+        response = self.anonymous.get(
+            '/api/recipes/search/', {'q': self.query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_unfiltered_page_is_a_slice(self):
+        ranked = [pk for pk, _ in search_recipes(self.query)]
+        page = self.get_page(limit=5, page=2)
+        self.assertEqual(page['count'], len(ranked))
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], ranked[5:10]
+        )
+
+    def test_filtered_pages_keep_rank_order(self):
+        slug = self.dataset.tag.slug
+        tagged = set(Recipe.objects.filter(tags__slug=slug).values_list(
+            'pk', flat=True
+        ))
+        expected = [
+            pk for pk, _ in search_recipes(self.query) if pk in tagged
+        ]
+        found, number, page = [], 1, {'next': True}
+        while page['next']:
+            page = self.get_page(tags=slug, limit=5, page=number)
+            found.extend(recipe['id'] for recipe in page['results'])
+            number += 1
+        self.assertEqual(found, expected)
+        self.assertEqual(page['count'], len(expected))
+
+
+class RecipeMatchTest(TestCase):
+    """
+    Подбор по набору ингредиентов: порядок по покрытию, числу
+    недостающих и id, недостающие ингредиенты в выдаче
+    """
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='cook', email='cook@example.com',
+            password='cook-password'
+        )
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'молоко', 'яйца', 'сахар', 'соль')
+        }
+        cls.recipes = {}
+        for name, ingredient_names in (
+                ('блины', ('мука', 'молоко')),
+                ('омлет', ('мука', 'молоко', 'яйца')),
+                ('печенье', ('мука', 'сахар')),
+                ('карамель', ('сахар',)),
+                ('пирог', ('мука', 'сахар', 'соль'))):
+            recipe = Recipe.objects.create(
+                author=author, name=name, image='recipes/images/test.png',
+                text=name, cooking_time=10
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[ingredient_name],
+                    amount=100
+                )
+                for ingredient_name in ingredient_names
+            )
+            cls.recipes[name] = recipe
+
+    def setUp(self):
+        reset_process_caches()
+        self.client = APIClient()
+
+    def get_match(self, **params):
+        pantry = [
+            self.ingredients[name].pk for name in ('мука', 'молоко', 'яйца')
+        ]
+        response = self.client.get(
+            '/api/recipes/match/', {'ingredients': pantry, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranking(self):
+        page = self.get_match(missing=1)
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(
+            [
+                (recipe['name'], recipe['coverage'], [
+                    item['name'] for item in recipe['missing_ingredients']
+                ])
+                for recipe in page['results']
+            ],
+            [
+                ('омлет', 1.0, []),
+                ('блины', 1.0, []),
+                ('печенье', 0.5, ['сахар']),
+            ]
+        )
+
+    def test_exact_matches_only(self):
+        page = self.get_match(limit=1)
+        self.assertEqual(page['count'], 2)
+        self.assertEqual(page['results'][0]['name'], 'омлет')
+        self.assertIsNotNone(page['next'])
+
+
+class ShoppingListDownloadTest(TestCase):
+    """
+    Список покупок в каждом формате: тип содержимого и суммы
+    ингредиентов, общих для нескольких рецептов корзины
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com',
+            password='buyer-password'
+        )
+        ingredients = {
+            name: Ingredient.objects.create(
+                name=name, measurement_unit=unit
+            )
+            for name, unit in (('мука', 'г'), ('молоко', 'мл'),
+                               ('сахар', 'г'))
+        }
+        cls.recipes = []
+        for name, amounts in (('блины', {'мука': 200, 'молоко': 300}),
+                              ('печенье', {'мука': 150, 'сахар': 100})):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=name,
+                image='recipes/images/test.png', text=name, cooking_time=10
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredients[ingredient],
+                    amount=amount
+                )
+                for ingredient, amount in amounts.items()
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        reset_process_caches()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for recipe in self.recipes:
+            response = self.client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )
+            self.assertEqual(response.status_code, 201)
+
+    def download(self, file_format, content_type):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Type'], f'{content_type}; charset=utf-8'
+        )
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping-list.{file_format}"'
+        )
+        return b''.join(response.streaming_content).decode()
+
+    def test_text(self):
+        self.assertEqual(
+            self.download('txt', 'text/plain'),
+            'Купить ингридиенты (продукты): \n'
+            'молоко: 300 мл\n'
+            'мука: 350 г\n'
+            'сахар: 100 г\n'
+        )
+
+    def test_csv(self):
+        self.assertEqual(
+            list(csv.reader(io.StringIO(self.download('csv', 'text/csv')))),
+            [
+                ['name', 'measurement_unit', 'amount'],
+                ['молоко', 'мл', '300'],
+                ['мука', 'г', '350'],
+                ['сахар', 'г', '100'],
+            ]
+        )
+
+    def test_json(self):
+        self.assertEqual(
+            json.loads(self.download('json', 'application/json')),
+            [
+                {'name': 'молоко', 'measurement_unit': 'мл', 'amount': 300},
+                {'name': 'мука', 'measurement_unit': 'г', 'amount': 350},
+                {'name': 'сахар', 'measurement_unit': 'г', 'amount': 100},
+            ]
+        )
+
+
+class IngredientSearchTest(TestCase):
+    """
+    Поиск ингредиентов по ?name=: сначала совпадения с начала
+    названия, затем внутри, с индексом в памяти и без него
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('ванильный сахар', 'соль', 'сахарная пудра',
+                         'сахар', 'тростниковый сахар')
+        )
+
+    def setUp(self):
+        reset_process_caches()
+        self.client = APIClient()
+
+    def get_names(self):
+        response = self.client.get('/api/ingredients/', {'name': 'сах'})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_before_substring(self):
+        expected = [
+            'сахар', 'сахарная пудра', 'ванильный сахар',
+            'тростниковый сахар'
+        ]
+        for enabled in (True, False):
+            with self.subTest(index=enabled):
+                reset_process_caches()
+                with override_settings(
+                        INGREDIENT_AUTOCOMPLETE_INDEX=enabled):
+                    self.assertEqual(self.get_names(), expected)
+
+    def test_index_results_are_limited(self):
+        with override_settings(INGREDIENT_SEARCH_MAX_RESULTS=3):
+            self.assertEqual(
+                self.get_names(),
+                ['сахар', 'сахарная пудра', 'ванильный сахар']
+            )
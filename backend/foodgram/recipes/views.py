@@ -1,33 +1,68 @@
-from django.db.models import Sum
-from django.http.response import HttpResponse
+from django.conf import settings
+from django.http import Http404
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from .cache import INGREDIENTS_NAMESPACE, TAGS_NAMESPACE, ReferenceCacheMixin
+from .conditional import RecipeResponseCacheMixin
+from .encoders import get_encoder
+from .exporters import EXPORTERS, SHOPPING_LIST_RENDERERS
+from .feed import Feed
 from .filters import IngredientSearchFilter, RecipeFilter
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                     ShoppingCart, Tag)
-from .pagination import PageNumberPagination
+from .lists import EXISTS, LISTS, MISSING, add_recipes, remove_recipes
+from .matching import match_recipes
+from .models import Ingredient, Recipe, ShoppingListItem, Tag
+from .pagination import FeedPagination, RankedPagination, RecipePagination
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .ranking import CART, FAVORITE
+from .search import search_recipes
 from .serializers import (FavoriteSerializer, IngredientSerializer,
-                          RecipeSerializer, RecipeViewSerializer,
+                          RecipeListChangeSerializer, RecipeMatchSerializer,
+                          RecipeSearchSerializer, RecipeSerializer,
+                          RecipeViewSerializer, SimilarRecipeSerializer,
                           TagSerializer)
+from .similarity import get_similar_ids
 
 GET_METHOD = 'GET'
 POST_METHOD = 'POST'
 DELETE_METHOD = 'DELETE'
+SHOPPING_LIST_CHUNK_SIZE = 500
+SEARCH_QUERY_PARAM = 'q'
+ALREADY_ADDED = {
+    FAVORITE: 'Рецепт уже в избранном',
+    CART: 'Рецепт уже в списке покупок',
+}
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def parse_ids(values):
+    """
+    id из повторяющегося параметра и/или через запятую
+    """
+    try:
+        return {
+            int(value) for item in values
+            for value in item.split(',') if value.strip()
+        }
+    except ValueError:
+        raise ValidationError({'ingredients': 'Ожидаются id ингредиентов'})
+
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespace = TAGS_NAMESPACE
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    cache_namespace = INGREDIENTS_NAMESPACE
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
@@ -35,22 +70,31 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientSearchFilter
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(RecipeResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeViewSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
-    pagination_class = PageNumberPagination
+    pagination_class = RecipePagination
     filter_class = RecipeFilter
 
+    def get_queryset(self):
+        if self.request.method == GET_METHOD:
+            return Recipe.objects.for_user(self.request.user)
+        return Recipe.objects.all()
+
     def get_serializer_class(self):
         if self.request.method == GET_METHOD:
             return RecipeViewSerializer
         return RecipeSerializer
 
+    def get_encoder(self):
+        return get_encoder(self.get_serializer_class())
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        self.perform_create(serializer)
+        recipe = self.perform_create(serializer)
+        serializer.instance = Recipe.objects.with_related().get(pk=recipe.pk)
         return Response(
             serializer.data, status=status.HTTP_201_CREATED)
 
@@ -66,13 +110,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         serializer = RecipeViewSerializer(
-            instance=serializer.instance,
+            instance=Recipe.objects.for_user(request.user).get(
+                pk=instance.pk
+            ),
             context={'request': self.request},
         )
         return Response(
             serializer.data, status=status.HTTP_200_OK
         )
 
+    def change_recipe_list(self, request, pk, event):
+        """
+        Один рецепт в избранное или корзину: повторное добавление
+        отвечает 400, удаление отсутствующего - 404
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+            pk=pk
+        )
+        if request.method == POST_METHOD:
+            result = add_recipes(request.user, event, [recipe.pk])
+            if result[recipe.pk] == EXISTS:
+                return Response({
+                    'errors': ALREADY_ADDED[event]
+                }, status=status.HTTP_400_BAD_REQUEST)
+            model, _ = LISTS[event]
+            serializer = FavoriteSerializer(
+                model(user=request.user, recipe=recipe)
+            )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+        result = remove_recipes(request.user, event, [recipe.pk])
+        if result[recipe.pk] == MISSING:
+            raise Http404
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def change_recipe_lists(self, request, event):
+        """
+        Массовое добавление или удаление: {"recipes": [id, ...]}
+        или {"author": id}, в ответе результат по каждому id
+        """
+        serializer = RecipeListChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.get_recipe_ids()
+        if request.method == POST_METHOD:
+            results = add_recipes(request.user, event, recipe_ids)
+        else:
+            results = remove_recipes(request.user, event, recipe_ids)
+        return Response({'results': [
+            {'id': recipe_id, 'status': result}
+            for recipe_id, result in results.items()
+        ]})
+
     @action(
         methods=[POST_METHOD, DELETE_METHOD],
         detail=True,
@@ -81,16 +170,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer_class=FavoriteSerializer
     )
     def favorite(self, request, pk=id):
-        user = request.user
-        if request.method == POST_METHOD:
-            recipe = get_object_or_404(Recipe, pk=pk)
-            favorite = Favorite.objects.create(user=user, recipe=recipe)
-            serializer = FavoriteSerializer(favorite)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        favorite = get_object_or_404(Favorite, user=user, recipe__id=pk)
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.change_recipe_list(request, pk, FAVORITE)
 
     @action(
         methods=[POST_METHOD, DELETE_METHOD],
@@ -100,34 +180,175 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer_class=FavoriteSerializer
     )
     def shopping_cart(self, request, pk=id):
-        user = request.user
-        if request.method == POST_METHOD:
-            recipe = get_object_or_404(Recipe, pk=pk)
-            favorite = ShoppingCart.objects.create(user=user, recipe=recipe)
-            serializer = FavoriteSerializer(favorite)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.change_recipe_list(request, pk, CART)
+
+    @action(
+        methods=[POST_METHOD, DELETE_METHOD],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated],
+        serializer_class=RecipeListChangeSerializer
+    )
+    def favorite_bulk(self, request):
+        return self.change_recipe_lists(request, FAVORITE)
 
-        favorite = get_object_or_404(ShoppingCart, user=user, recipe__id=pk)
-        favorite.delete()
+    @action(
+        methods=[POST_METHOD, DELETE_METHOD],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated],
+        serializer_class=RecipeListChangeSerializer
+    )
+    def shopping_cart_bulk(self, request):
+        return self.change_recipe_lists(request, CART)
+
+    @action(
+        methods=[DELETE_METHOD],
+        detail=False,
+        url_path='shopping_cart/clear',
+        permission_classes=[IsAuthenticated]
+    )
+    def clear_shopping_cart(self, request):
+        remove_recipes(request.user, CART)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=[GET_METHOD],
+        url_path='feed',
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(Feed(request.user))
+        serializer = RecipeViewSerializer(
+            page, many=True, context={'request': request}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    def get_allowed_ids(self, ids):
+        return set(self.filter_queryset(
+            Recipe.objects.filter(pk__in=ids)
+        ).order_by().values_list('pk', flat=True))
+
+    def has_list_filters(self):
+        params = self.request.query_params
+        return any(
+            params.get(name) for name in RecipeFilter.base_filters
+            if name != RecipePagination.ordering_query_param
+        )
+
+    def get_ranked_page(self, ranked):
+        """
+        Страница рецептов из ранжированного списка (id, данные)
+        с учётом фильтров списка рецептов. Из БД читаются только
+        рецепты страницы, а при фильтрах - куски списка до её заполнения
+        """
+        page = self.paginator.paginate_ranked(
+            ranked, self.request,
+            self.get_allowed_ids if self.has_list_filters() else None
+        )
+        recipes = Recipe.objects.for_user(self.request.user).in_bulk(
+            [pk for pk, _ in page]
+        )
+        return [(recipes[pk], data) for pk, data in page if pk in recipes]
+
+    @action(
+        detail=True,
+        methods=[GET_METHOD],
+        url_path='similar',
+        pagination_class=None
+    )
+    def similar(self, request, pk=None):
+        recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        similar = get_similar_ids(recipe.pk)
+        recipes = Recipe.objects.only(
+            'id', 'name', 'image', 'cooking_time'
+        ).in_bulk([similar_id for similar_id, _ in similar])
+        results = []
+        for similar_id, score in similar:
+            if similar_id in recipes:
+                recipes[similar_id].score = round(score, 4)
+                results.append(recipes[similar_id])
+        return Response(SimilarRecipeSerializer(
+            results, many=True, context={'request': request}
+        ).data)
+
+    @action(
+        detail=False,
+        methods=[GET_METHOD],
+        url_path='match',
+        pagination_class=RankedPagination
+    )
+    def match(self, request):
+        """
+        Рецепты, для которых хватает ингредиентов из ?ingredients=
+        или недостаёт не больше ?missing=
+        """
+        pantry = parse_ids(request.query_params.getlist('ingredients'))
+        try:
+            missing = int(request.query_params.get('missing', 0))
+        except ValueError:
+            raise ValidationError({'missing': 'Ожидается целое число'})
+        if not 0 <= missing <= settings.RECIPE_MATCH_MAX_MISSING:
+            raise ValidationError({'missing': (
+                'Допустимо от 0 до '
+                f'{settings.RECIPE_MATCH_MAX_MISSING}'
+            )})
+        ranked = match_recipes(pantry, missing) if pantry else []
+        results = []
+        for recipe, (coverage, _) in self.get_ranked_page(ranked):
+            recipe.coverage = round(coverage, 4)
+            results.append(recipe)
+        serializer = RecipeMatchSerializer(
+            results, many=True,
+            context={'request': request, 'pantry': pantry}
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=[GET_METHOD],
+        url_path='search',
+        pagination_class=RankedPagination
+    )
+    def search(self, request):
+        """
+        Полнотекстовый поиск по ?q= с фильтрами списка рецептов
+        """
+        query = request.query_params.get(SEARCH_QUERY_PARAM, '').strip()
+        ranked = search_recipes(query) if query else []
+        results = []
+        for recipe, rank in self.get_ranked_page(ranked):
+            recipe.search_rank = round(rank, 4)
+            results.append(recipe)
+        serializer = RecipeSearchSerializer(
+            results, many=True, context={'request': request, 'query': query}
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         detail=False,
         methods=[GET_METHOD],
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS
     )
     def download_shopping_cart(self, request):
-        cart = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user).values_list(
-            'ingredient__name', 'ingredient__measurement_unit').order_by(
-                'ingredient__name').annotate(ingredient_total=Sum('amount'))
-        text = 'Купить ингридиенты (продукты): \n'
-        for ingredients in cart:
-            name, measurement_unit, amount = ingredients
-            text += f'{name}: {amount} {measurement_unit}\n'
-        response = HttpResponse(text, content_type='text/plain')
+        renderer = request.accepted_renderer
+        cart = ShoppingListItem.objects.filter(
+            user=request.user).values_list(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'amount').order_by('ingredient__name')
+        response = StreamingHttpResponse(
+            EXPORTERS[renderer.format](
+                cart.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+            ),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}'
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping-list.txt"'
+            f'attachment; filename="shopping-list.{renderer.format}"'
         )
         return response
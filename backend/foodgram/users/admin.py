@@ -1,4 +1,5 @@
 from django.contrib import admin
+from recipes.admin import ResyncAdmin
 
 from .models import Subscription, User
 
@@ -10,14 +11,17 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'username',
         'first_name',
-        'last_name'
+        'last_name',
+        'recipes_count',
+        'followers_count'
     ]
+    readonly_fields = ('recipes_count', 'followers_count')
     search_fields = ('email', 'username', 'first_name', 'last_name')
     list_filter = ('email', 'username')
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(ResyncAdmin):
     list_display = (
         'pk',
         'user',
@@ -25,3 +29,10 @@ class SubscriptionAdmin(admin.ModelAdmin):
     )
     search_fields = ('user', 'author')
     list_filter = ('user', 'author')
+
+    def get_affected(self, objects):
+        return (
+            {row.user_id for row in objects},
+            (),
+            {row.author_id for row in objects},
+        )
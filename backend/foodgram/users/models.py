@@ -31,6 +31,16 @@ class User(AbstractUser):
         verbose_name='Фамилия пользователя'
     )
 
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество рецептов'
+    )
+
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество подписчиков'
+    )
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
 
@@ -75,6 +85,16 @@ class Subscription(models.Model):
                 name='unique_follow'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=['user', '-id'],
+                name='subscription_user_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'user'],
+                name='subscription_author_user_idx'
+            ),
+        )
 
     def __str__(self):
         return self.user.username
@@ -1,7 +1,13 @@
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet as DjoserViewSet
+from recipes.feed import (backfill_feed, drop_author_from_feed, is_pulled,
+                          start_fan_out)
+from recipes.models import Recipe
+from recipes.overlay import invalidate_viewer_state
 from recipes.pagination import CustomPagesPaginator
-from recipes.serializers import SubscribeSerializer
+from recipes.serializers import SubscribeSerializer, get_recipes_limit
+from recipes.services import change_counter
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
@@ -39,12 +45,18 @@ class CustomUserViewSet(DjoserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = Subscription.objects.filter(user=request.user)
+        queryset = Subscription.objects.filter(
+            user=request.user
+        ).select_related('author').order_by('-id')
         page = self.paginate_queryset(queryset)
+        recipes = Recipe.objects.latest_by_author(
+            [subscription.author_id for subscription in page],
+            get_recipes_limit(request)
+        )
         serializer = SubscribeSerializer(
             page,
             many=True,
-            context={'request': request}
+            context={'request': request, 'recipes': recipes}
         )
         return self.get_paginated_response(serializer.data)
 
@@ -63,10 +75,15 @@ class CustomUserViewSet(DjoserViewSet):
                 return Response({
                     'errors': 'Нельзя подписываться на самого себя'
                 }, status=status.HTTP_400_BAD_REQUEST)
-            subscription = Subscription.objects.create(
-                user=user,
-                author=author
-            )
+            with transaction.atomic():
+                subscription = Subscription.objects.create(
+                    user=user,
+                    author=author
+                )
+                change_counter(User, author.pk, 'followers_count', 1)
+                backfill_feed(user, author)
+                invalidate_viewer_state(user.pk)
+            author.refresh_from_db(fields=('followers_count',))
             serializer = SubscribeSerializer(
                 subscription,
                 context={'request': request}
@@ -81,7 +98,14 @@ class CustomUserViewSet(DjoserViewSet):
             subscription = Subscription.objects.filter(
                 user=user, author=author
             )
-            if subscription.exists():
-                subscription.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
+            with transaction.atomic():
+                if subscription.delete()[0]:
+                    change_counter(User, author.pk, 'followers_count', -1)
+                    drop_author_from_feed(user, author)
+                    if is_pulled(author):
+                        author.refresh_from_db(fields=('followers_count',))
+                        if not is_pulled(author):
+                            start_fan_out(author)
+                    invalidate_viewer_state(user.pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_204_NO_CONTENT)
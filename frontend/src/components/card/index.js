@@ -6,7 +6,7 @@ import { AuthContext } from '../../contexts'
 const Card = ({
   name = 'Без названия',
   id,
-  image,
+  thumbnail,
   is_favorited,
   is_in_shopping_cart,
   tags,
@@ -21,7 +21,7 @@ const Card = ({
       <LinkComponent
         className={styles.card__title}
         href={`/recipes/${id}`}
-        title={<div className={styles.card__image} style={{ backgroundImage: `url(${ image })` }} />}
+        title={<div className={styles.card__image} style={{ backgroundImage: `url(${ thumbnail })` }} />}
       />
       <div className={styles.card__body}>
         <LinkComponent
@@ -2,7 +2,7 @@ import styles from './styles.module.css'
 import cn from 'classnames'
 import { LinkComponent, Icons } from '../index'
 
-const Purchase = ({ image, name, cooking_time, id, handleRemoveFromCart, is_in_shopping_cart, updateOrders }) => {
+const Purchase = ({ thumbnail, name, cooking_time, id, handleRemoveFromCart, is_in_shopping_cart, updateOrders }) => {
   if (!is_in_shopping_cart) { return null }
   return <li className={styles.purchase}>
     <div className={styles.purchaseContent}>
@@ -10,7 +10,7 @@ const Purchase = ({ image, name, cooking_time, id, handleRemoveFromCart, is_in_s
         alt={name}
         className={styles.purchaseImage}
         style={{
-          backgroundImage: `url(${image})`
+          backgroundImage: `url(${thumbnail})`
         }}
       />
       <h3 className={styles.purchaseTitle}>